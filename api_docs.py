@@ -0,0 +1,310 @@
+"""
+Swagger documentation of the API (flasgger), set up without slowing down the start of the API.
+
+Importing flasgger (and jsonschema, yaml and mistune with it) and reading the YAML files of docs/ is left out
+of the startup: the views are documented with api_docs.swag_from, which only records the YAML file of the
+view, and in the lazy mode (the default) the documentation routes are registered without flasgger:
+
+    /apispec_1.json -> the spec precompiled into configurations.swagger_spec_path by 'python api_docs.py'
+                       (a build step), or built from docs/ on the first request when that file is missing or
+                       was built from other docs
+    /apidocs/       -> the Swagger UI of flasgger, which imports it on the first request
+
+SWAGGER_MODE=eager (environment variable) sets flasgger up when the API starts, as before. In debug mode it
+reads the YAML files again on every request of the spec, which is handy while writing them.
+
+The 'parameters' sections of docs/*.yml are generated from the parameter schemas of the endpoints (see
+param_schemas), which also validate the requests, so the docs and the validation cannot drift apart.
+
+Usage:
+    python api_docs.py                      -> builds the spec and saves it
+    python api_docs.py --update-parameters  -> rewrites the 'parameters' sections of docs/*.yml from the schemas
+    python api_docs.py --check              -> exits with status 1 if the saved spec or a 'parameters' section
+                                               is out of date
+"""
+
+import argparse
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from flask import Blueprint, current_app, jsonify, redirect, url_for
+
+import configurations as configs
+import templates
+
+ROOT_PATH = Path(__file__).parent
+
+# Endpoint (and route) of the spec, the same as flasgger's default
+SPEC_ENDPOINT = "apispec_1"
+
+# First line of the generated 'parameters' sections
+GENERATED_PARAMETERS_COMMENT = "# Generated from the parameter schema by 'python api_docs.py --update-parameters'"
+
+logger = logging.getLogger(__name__)
+
+_spec = None
+_spec_lock = threading.Lock()
+_views = {}
+
+
+def swag_from(specs: str):
+    """
+    Documents a view with a YAML file (relative to the project root), like flasgger's swag_from. The file is
+    only read when the spec is built, and the view is returned as it is, without a wrapper
+    """
+
+    def decorator(function):
+        function.swag_path = str(ROOT_PATH / specs)
+        function.swag_type = specs.rsplit(".", 1)[-1]
+        return function
+
+    return decorator
+
+
+def get_swagger_mode() -> str:
+    return (os.environ.get("SWAGGER_MODE") or configs.swagger_mode).lower()
+
+
+def get_spec_path() -> Path:
+    return Path(os.environ.get("SWAGGER_SPEC_PATH") or configs.swagger_spec_path)
+
+
+def get_documented_views(app) -> list[tuple[str, str, str]]:
+    """(rule, methods, YAML file) of every documented view"""
+    return sorted(
+        (rule.rule, ",".join(sorted(rule.methods)), app.view_functions[rule.endpoint].swag_path)
+        for rule in app.url_map.iter_rules()
+        if hasattr(app.view_functions[rule.endpoint], "swag_path")
+    )
+
+
+def get_source_digest(app) -> str:
+    """
+    Hash of everything the spec is built from: the documented routes, their YAML files, the swagger template
+    and the flasgger version. A precompiled spec with another digest is out of date
+    """
+    digest = hashlib.sha256()
+    digest.update(importlib.metadata.version("flasgger").encode())
+    digest.update(json.dumps(templates.swagger_template, sort_keys=True).encode())
+    for rule, methods, swag_path in get_documented_views(app):
+        digest.update(f"{rule} {methods} {Path(swag_path).relative_to(ROOT_PATH).as_posix()}\n".encode())
+        digest.update(Path(swag_path).read_bytes())
+    return digest.hexdigest()
+
+
+def render_parameters(schema) -> list[str]:
+    """The 'parameters' section of the docs of 'schema', as YAML lines"""
+    import yaml
+
+    parameters = yaml.safe_dump(schema.to_swagger(), sort_keys=False, allow_unicode=True, width=110)
+    return (
+        ["parameters:", f"  {GENERATED_PARAMETERS_COMMENT}"]
+        + [f"  {line}" if line else line for line in parameters.splitlines()]
+        + [""]
+    )
+
+
+def replace_parameters(text: str, parameters: list[str]) -> str:
+    """Replaces the top level 'parameters' key of a YAML file (or adds it at the end) by 'parameters'"""
+    lines = text.splitlines()
+    if "parameters:" not in lines:
+        return "\n".join(lines + [""] + parameters) + "\n"
+
+    start = lines.index("parameters:")
+    end = start + 1
+    # The section goes on until the next top level key
+    while end < len(lines) and (not lines[end] or lines[end][0] in " -#"):
+        end += 1
+    return "\n".join(lines[:start] + parameters + lines[end:]) + "\n"
+
+
+def update_parameter_docs(write: bool = True) -> list[str]:
+    """
+    Rewrites the 'parameters' section of the docs of every parameter schema. Returns the docs files that were
+    (or, with write=False, would be) changed
+    """
+    # The schemas are declared by useful_functions
+    import param_schemas
+    import useful_functions  # noqa: F401
+
+    changed = []
+    for schema in param_schemas.SCHEMAS:
+        path = ROOT_PATH / schema.docs_file
+        text = path.read_text(encoding="utf-8")
+        updated = replace_parameters(text, render_parameters(schema))
+        if updated != text:
+            changed.append(schema.docs_file)
+            if write:
+                path.write_text(updated, encoding="utf-8")
+    return changed
+
+
+def build_spec(app) -> dict:
+    """Builds the spec with flasgger, as the /apispec_1.json route of the eager mode does"""
+    from flasgger import Swagger
+
+    # Not initialized with the app, so no route is registered
+    swagger = Swagger(template=templates.swagger_template)
+    swagger.app = app
+    swagger.load_config(app)
+
+    with app.app_context():
+        # Round trip through JSON, because flasgger builds it with defaultdicts and lazy strings
+        return json.loads(json.dumps(swagger.get_apispecs(SPEC_ENDPOINT), default=str))
+
+
+def save_spec(app, path: Path) -> dict:
+    spec = build_spec(app)
+    artifact = {
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "sourceDigest": get_source_digest(app),
+        "spec": spec,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(artifact, file, indent=2, sort_keys=True)
+    return spec
+
+
+def load_precompiled_spec(app, path: Path) -> dict | None:
+    """The spec saved in 'path', if it was built from the current docs"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            artifact = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if artifact.get("sourceDigest") != get_source_digest(app):
+        return None
+    return artifact.get("spec")
+
+
+def get_spec() -> dict:
+    """The spec of the lazy mode. It is loaded (or built) on the first request and kept in memory"""
+    global _spec
+
+    if _spec is None:
+        with _spec_lock:
+            if _spec is None:
+                app = current_app._get_current_object()
+                spec = load_precompiled_spec(app, get_spec_path())
+                if spec is None:
+                    logger.warning(
+                        "The precompiled Swagger spec %s is missing or out of date. Building it now "
+                        "(run 'python api_docs.py' in the build to skip this)",
+                        get_spec_path(),
+                    )
+                    spec = build_spec(app)
+                _spec = spec
+
+    return _spec
+
+
+def get_flasgger_config() -> dict:
+    from flasgger import Swagger
+
+    return {**Swagger.DEFAULT_CONFIG, **current_app.config.get("SWAGGER", {})}
+
+
+def get_view(name: str):
+    """The flasgger view 'name', created (importing flasgger) on its first request"""
+    view = _views.get(name)
+    if view is None:
+        from flasgger.base import APIDocsView, OAuthRedirect
+
+        if name == "apidocs":
+            view = APIDocsView.as_view("apidocs", view_args={"config": get_flasgger_config()})
+        else:
+            view = OAuthRedirect.as_view("oauth_redirect")
+        _views[name] = view
+    return view
+
+
+def apispec():
+    return jsonify(get_spec())
+
+
+def apidocs():
+    return get_view("apidocs")()
+
+
+def oauth_redirect():
+    return get_view("oauth_redirect")()
+
+
+def register_lazy_views(app) -> None:
+    """
+    Registers the routes of flasgger (same paths and endpoints, so its templates work unchanged) with views that
+    only import it when they are requested. Its package is located without being imported
+    """
+    flasgger_path = Path(importlib.util.find_spec("flasgger").origin).parent
+    blueprint = Blueprint(
+        "flasgger",
+        __name__,
+        template_folder=str(flasgger_path / "ui3" / "templates"),
+        static_folder=str(flasgger_path / "ui3" / "static"),
+        static_url_path="/flasgger_static",
+    )
+    blueprint.add_url_rule(f"/{SPEC_ENDPOINT}.json", SPEC_ENDPOINT, apispec)
+    blueprint.add_url_rule("/apidocs/", "apidocs", apidocs)
+    blueprint.add_url_rule("/oauth2-redirect.html", "oauth_redirect", oauth_redirect)
+    blueprint.add_url_rule("/apidocs/index.html", "apidocs_index", lambda: redirect(url_for("flasgger.apidocs")))
+    app.register_blueprint(blueprint)
+
+
+def init_app(app):
+    """Sets the documentation up in the mode chosen by SWAGGER_MODE (or configurations.swagger_mode)"""
+    if get_swagger_mode() == "eager":
+        from flasgger import Swagger
+
+        return Swagger(app, template=templates.swagger_template)
+
+    register_lazy_views(app)
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompiles the Swagger spec of the API")
+    parser.add_argument("--output", type=Path, default=get_spec_path())
+    parser.add_argument("--check", action="store_true", help="Only checks that the docs and spec are up to date")
+    parser.add_argument(
+        "--update-parameters", action="store_true", help="Rewrites the 'parameters' sections of docs/*.yml"
+    )
+    args = parser.parse_args()
+
+    # Building the spec must not leave an access log behind
+    os.environ.setdefault("ACCESS_LOG_PATH", "off")
+
+    if args.update_parameters:
+        for docs_file in update_parameter_docs():
+            print(f"{docs_file} updated")
+        return
+
+    from main import app
+
+    if args.check:
+        outdated_docs = update_parameter_docs(write=False)
+        for docs_file in outdated_docs:
+            print(f"The parameters of {docs_file} are out of date. Run 'python api_docs.py --update-parameters'")
+        if load_precompiled_spec(app, args.output) is None:
+            print(f"{args.output} is missing or out of date. Run 'python api_docs.py' to build it")
+            sys.exit(1)
+        if outdated_docs:
+            sys.exit(1)
+        print(f"{args.output} is up to date")
+        return
+
+    spec = save_spec(app, args.output)
+    print(f"Swagger spec with {len(spec.get('paths', {}))} paths saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Microbenchmarks of the request hot path.
+
+Every view of main.py is called through the Flask test client, with the FrankFurter and brapi APIs replaced by
+the deterministic stubs of upstream_stubs.py, and the validators and serializers of useful_functions are also
+timed on their own. Each benchmark reports the median and the 95th percentile of the time per call.
+
+    view.<endpoint>.hit      -> the same request again and again (every cache warm)
+    view.<endpoint>.uncached -> the same request with the cached response cleared before each call, so the
+                                validation, conversion and serialization run every time
+    fn.<function>            -> a single function of the hot path
+    startup.import_main      -> the time to import main.py in a fresh interpreter (the cold start of a worker)
+
+Usage:
+    python benchmark.py                      -> runs every benchmark and compares it with the saved baseline
+    python benchmark.py --save               -> also saves the results as the new baseline
+    python benchmark.py --filter historical  -> runs only the benchmarks whose name contains 'historical'
+
+The exit status is 1 when a benchmark got slower than the baseline by more than the regression threshold
+(configurations.py), or when importing main.py took longer than the import time budget, so the script can gate
+a CI job. Baselines are only comparable on the same machine.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import configurations as configs
+
+# Calls made before the timing starts, to fill the caches and check that the benchmark works
+WARMUP_ITERATIONS = 5
+
+# Endpoint -> (request, whether its response is cached by stale_cache.cached_view)
+VIEW_REQUESTS = {
+    "api_info": ("/", False),
+    "currencies": ("/v1/currencies", False),
+    "historical": ("/v1/conversion/historical?from=USD&to=BRL,EUR,JPY&amount=10&date=2024-03-15", True),
+    "interval": ("/v1/conversion/interval?from=USD&to=BRL,EUR&start_date=2024-01-01&end_date=2024-12-31", True),
+    "interval_csv": (
+        "/v1/conversion/interval?from=USD&to=BRL,EUR&start_date=2024-01-01&end_date=2024-12-31&format=csv",
+        False,
+    ),
+    "analytics": (
+        "/v1/conversion/analytics?from=USD&to=BRL,JPY&start_date=2020-01-01&end_date=2024-12-31&window=20",
+        False,
+    ),
+    "b3_all": ("/v1/b3stocks/all", False),
+    "b3_search": ("/v1/b3stocks/search?prefix=PE&limit=10", False),
+    "b3_quote": ("/v1/b3stocks/quote?ticker=PETR4,VALE3,ITUB4&range=5d&interval=1d", False),
+    "b3_quote_resampled": (
+        "/v1/b3stocks/quote?ticker=PETR4&range=1y&interval=1wk&resample=true&indicators=sma:20,rsi:14",
+        False,
+    ),
+    "b3_stocksinfo": ("/v1/b3stocks/stocksinfo?sector=Finance&sortedBy=volume&order=desc&limit=20", False),
+}
+
+
+class Benchmark:
+    """
+    A function to be timed. 'setup' runs before every call, outside of the timing, and 'context' returns a
+    context manager (ex: a Flask request context) kept open while the benchmark runs
+    """
+
+    def __init__(self, name: str, function, setup=None, context=None):
+        self.name = name
+        self.function = function
+        self.setup = setup
+        self.context = context
+
+
+def prepare_environment() -> None:
+    """
+    Isolates the benchmarks from the local setup: an empty rate store (every rate comes from the stubs),
+    in-process caches and the upstream stubs. The access log is still written, but to nowhere
+    """
+    os.environ["RATE_STORE_DIR"] = tempfile.mkdtemp(prefix="financeapi-benchmark-")
+    os.environ["ACCESS_LOG_PATH"] = os.devnull
+    os.environ["CACHE_BACKEND"] = "memory"
+    os.environ.setdefault("BRAPI_API_KEY", "benchmark")
+
+
+def get_view_benchmarks(app, cache) -> list[Benchmark]:
+    client = app.test_client()
+    benchmarks = []
+
+    for endpoint, (url, cached_view) in VIEW_REQUESTS.items():
+
+        def get(url=url):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} returned {response.status_code}: {response.get_data(as_text=True)}")
+
+        benchmarks.append(Benchmark(f"view.{endpoint}.hit", get))
+        if cached_view:
+            benchmarks.append(Benchmark(f"view.{endpoint}.uncached", get, setup=cache.clear))
+
+    return benchmarks
+
+
+def get_function_benchmarks(app) -> list[Benchmark]:
+    # Imported here because the stubs must be installed (and the environment prepared) first
+    from flask import jsonify, request
+
+    import response_encoding
+    import standard_responses as sr
+    import useful_functions as uf
+
+    historical_url = VIEW_REQUESTS["historical"][0]
+    interval_url = VIEW_REQUESTS["interval"][0]
+
+    with app.test_request_context(historical_url):
+        historical_params = uf.validate_historical_endpoint_params(request)
+    with app.test_request_context(interval_url):
+        interval_params = uf.validate_interval_endpoint_params(request)
+    interval_payload = sr.StandardAPISuccessfulResponse(data=uf.get_interval_conversion(interval_params)).to_dict()
+
+    def historical_payload():
+        # The same steps as historical_conversion() in main.py, after the validation
+        response = uf.get_historical_conversion(historical_params)
+        response["from"] = response.pop("base")
+        response["to"] = response.pop("rates")
+        return jsonify(sr.StandardAPISuccessfulResponse(data=response).to_dict())
+
+    return [
+        Benchmark("fn.date_is_real", lambda: uf.date_is_real("2024-03-15")),
+        Benchmark("fn.get_formatted_date", lambda: uf.get_formatted_date("15-03-2024")),
+        Benchmark(
+            "fn.validate_historical_endpoint_params",
+            lambda: uf.validate_historical_endpoint_params(request),
+            context=lambda: app.test_request_context(historical_url),
+        ),
+        Benchmark(
+            "fn.validate_interval_endpoint_params",
+            lambda: uf.validate_interval_endpoint_params(request),
+            context=lambda: app.test_request_context(interval_url),
+        ),
+        Benchmark(
+            "fn.validate_analytics_endpoint_params",
+            lambda: uf.validate_analytics_endpoint_params(request),
+            context=lambda: app.test_request_context(VIEW_REQUESTS["analytics"][0]),
+        ),
+        Benchmark(
+            "fn.validate_quotes_endpoint_params",
+            lambda: uf.validate_quotes_endpoint_params(request),
+            context=lambda: app.test_request_context(VIEW_REQUESTS["b3_quote"][0]),
+        ),
+        Benchmark(
+            "fn.validate_stocksinfo_endpoint_params",
+            lambda: uf.validate_stocksinfo_endpoint_params(request),
+            context=lambda: app.test_request_context(VIEW_REQUESTS["b3_stocksinfo"][0]),
+        ),
+        Benchmark("fn.get_historical_conversion", lambda: uf.get_historical_conversion(historical_params)),
+        Benchmark("fn.get_interval_conversion", lambda: uf.get_interval_conversion(interval_params)),
+        Benchmark("fn.historical_payload_jsonify", historical_payload, context=app.app_context),
+        Benchmark("fn.interval_payload_jsonify", lambda: jsonify(interval_payload), context=app.app_context),
+        Benchmark("fn.interval_payload_dumps", lambda: response_encoding.dumps(interval_payload)),
+    ]
+
+
+def run_benchmark(benchmark: Benchmark, min_time: float, min_iterations: int) -> dict:
+    """Calls the benchmark until both 'min_time' seconds and 'min_iterations' calls are reached"""
+    timings = []
+    context = benchmark.context() if benchmark.context is not None else contextlib.nullcontext()
+
+    with context:
+        for _ in range(WARMUP_ITERATIONS):
+            if benchmark.setup is not None:
+                benchmark.setup()
+            benchmark.function()
+
+        # Like timeit, the garbage collector is kept from running in the middle of the measurements
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            started_at = time.perf_counter()
+            while len(timings) < min_iterations or time.perf_counter() - started_at < min_time:
+                if benchmark.setup is not None:
+                    benchmark.setup()
+                call_started_at = time.perf_counter_ns()
+                benchmark.function()
+                timings.append(time.perf_counter_ns() - call_started_at)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    timings.sort()
+    return {
+        "iterations": len(timings),
+        "median_us": round(statistics.median(timings) / 1000, 2),
+        "p95_us": round(timings[int(0.95 * (len(timings) - 1))] / 1000, 2),
+        "mean_us": round(statistics.fmean(timings) / 1000, 2),
+        "min_us": round(timings[0] / 1000, 2),
+    }
+
+
+def measure_import_time(module: str = "main") -> dict[str, int]:
+    """
+    Imports 'module' in a fresh interpreter with -X importtime and returns the cumulative import time (in
+    microseconds) of the module and of each module it imported directly
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    timings = {}
+    # Lines look like 'import time:  self [us] | cumulative | <indentation>name', 2 spaces per nesting level
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 0 and name.strip() == module:
+            timings[module] = int(cumulative)
+        elif depth == 1:
+            timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def run_import_benchmark(runs: int) -> tuple[dict, dict[str, int]]:
+    """
+    Times the import of main.py 'runs' times. Returns the result, in the same format as the other benchmarks,
+    and the median import time of each module main.py imports directly
+    """
+    measurements = [measure_import_time() for _ in range(runs)]
+    timings = sorted(measurement.pop("main") for measurement in measurements)
+    modules = {
+        name: statistics.median(measurement.get(name, 0) for measurement in measurements)
+        for name in measurements[0]
+    }
+
+    result = {
+        "iterations": runs,
+        "median_us": round(statistics.median(timings), 2),
+        "p95_us": round(timings[int(0.95 * (runs - 1))], 2),
+        "mean_us": round(statistics.fmean(timings), 2),
+        "min_us": round(timings[0], 2),
+    }
+    return result, modules
+
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file).get("results", {})
+
+
+def save_baseline(path: Path, results: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    baseline = {
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Prints every result next to its baseline and returns the names of the benchmarks that regressed"""
+    regressions = []
+    print(f"{'benchmark':<44} {'median':>11} {'p95':>11} {'baseline':>11} {'change':>8}")
+
+    for name, result in results.items():
+        line = f"{name:<44} {result['median_us']:>9.1f}us {result['p95_us']:>9.1f}us"
+        previous = baseline.get(name)
+        if previous:
+            change = result["median_us"] / previous["median_us"] - 1
+            line += f" {previous['median_us']:>9.1f}us {change:>+7.1%}"
+            if change > threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Times the views and the hot path functions of the API")
+    parser.add_argument("--filter", default="", help="Runs only the benchmarks whose name contains this text")
+    parser.add_argument("--baseline", type=Path, default=configs.benchmark_baseline_path)
+    parser.add_argument("--save", action="store_true", help="Saves the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=configs.benchmark_regression_threshold)
+    parser.add_argument("--min-time", type=float, default=configs.benchmark_min_time)
+    parser.add_argument("--import-budget", type=float, default=configs.import_time_budget, help="Seconds")
+    args = parser.parse_args()
+
+    prepare_environment()
+
+    # Imported here because they read the environment prepared above
+    import upstream_stubs
+
+    upstream_stubs.install()
+
+    from main import app, cache
+
+    benchmarks = get_view_benchmarks(app, cache) + get_function_benchmarks(app)
+    results = {
+        benchmark.name: run_benchmark(benchmark, args.min_time, configs.benchmark_min_iterations)
+        for benchmark in benchmarks
+        if args.filter in benchmark.name
+    }
+
+    # The cold start runs in other interpreters, with the environment prepared above
+    import_modules = {}
+    if args.filter in "startup.import_main":
+        results["startup.import_main"], import_modules = run_import_benchmark(configs.import_time_runs)
+
+    regressions = compare_with_baseline(results, load_baseline(args.baseline), args.threshold)
+
+    over_budget = False
+    if import_modules:
+        import_time = results["startup.import_main"]["median_us"] / 1_000_000
+        slowest = sorted(import_modules.items(), key=lambda item: item[1], reverse=True)[:8]
+        print(f"\nImport of main.py: {import_time * 1000:.1f}ms (budget {args.import_budget * 1000:.0f}ms)")
+        print("Slowest direct imports: " + ", ".join(f"{name} {us / 1000:.1f}ms" for name, us in slowest))
+        over_budget = import_time > args.import_budget
+
+    if args.save:
+        # Benchmarks left out by --filter keep their previous baseline
+        save_baseline(args.baseline, {**load_baseline(args.baseline), **results})
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if over_budget:
+        print("\nImporting main.py took longer than the import time budget")
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) more than {args.threshold:.0%} slower than the baseline")
+    if over_budget or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Canonical cache keys for the cached endpoints.
+
+The keys are built from the validated output of the validate_*_endpoint_params functions instead of the raw
+query string. Requests that only differ in parameter order, date format, currency order, or in omitting a
+parameter that has a default value (amount=1, the current date, ...) therefore share one cache entry.
+
+Usage (replays an access log and prints the hit ratio of both key styles):
+    python cache_keys.py [data/access.log]
+
+The log is either the JSON access log written by the API (see tracing) or a file with one request path per line.
+"""
+
+import json
+import sys
+from urllib.parse import urlencode
+
+from flask import request
+
+import configurations as configs
+import custom_exceptions
+
+
+def canonical_currency_list(currencies: list[str] | None) -> str | None:
+    """Sorts and deduplicates a list of currencies, joined by commas"""
+    if currencies is None:
+        return None
+    return ",".join(sorted(set(currencies)))
+
+
+def canonical_number(value: int | str | None, default: str | None = None) -> str | None:
+    """Gives '01', '+1' and ' 1' the same representation. Omitted values are replaced by 'default'"""
+    if value is None:
+        return default
+    return str(int(value))
+
+
+def canonical_historical_params(params: dict) -> dict:
+    return {
+        "from": params["from_currency"],
+        "to": canonical_currency_list(params["to_currencies"]),
+        "amount": canonical_number(params["amount"]),
+        "date": params["date"],
+    }
+
+
+def canonical_interval_params(params: dict) -> dict:
+    return {
+        "from": params["from_currency"],
+        "to": canonical_currency_list(params["to_currencies"]),
+        "amount": canonical_number(params["amount"]),
+        "start_date": params["start_date"],
+        "end_date": params["end_date"],
+        # Left out for the default JSON output, so its keys stay the same
+        "format": params["format"] if params["format"] != "json" else None,
+    }
+
+
+def build_cache_key(path: str, canonical_params: dict) -> str:
+    """Joins the request path and the canonical parameters (sorted, without the unset ones) into a cache key"""
+    query = urlencode(sorted((key, value) for key, value in canonical_params.items() if value is not None))
+    return f"view/{path}?{query}"
+
+
+def canonical_key_maker(canonicalizer):
+    """
+    Returns a function to be passed as 'make_cache_key' to stale_cache.cached_view(). The parameters validated and
+    normalized by the validator of the view are reduced to their canonical form by 'canonicalizer'.
+    """
+
+    def make_cache_key(path: str, params: dict) -> str:
+        return build_cache_key(path, canonicalizer(params))
+
+    return make_cache_key
+
+
+historical_cache_key = canonical_key_maker(canonical_historical_params)
+interval_cache_key = canonical_key_maker(canonical_interval_params)
+
+
+def read_request_paths(log_path: str) -> list[str]:
+    """
+    Request paths (with their query string) of a log: the GET requests of a JSON access log, except the ones the
+    API sent to itself (cache warming), or every line of a file with one request path per line
+    """
+    request_paths = []
+    with open(log_path, encoding="utf-8") as log_file:
+        for line in log_file:
+            line = line.strip()
+            if not line.startswith("{"):
+                if line:
+                    request_paths.append(line)
+                continue
+
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("method") != "GET" or record.get("internalRequest"):
+                continue
+            query = record.get("query")
+            request_paths.append(f"{record['path']}?{query}" if query else record["path"])
+
+    return request_paths
+
+
+def measure_hit_ratios(app, request_paths: list[str]) -> dict:
+    """
+    Replays the given request paths (ex: /v1/conversion/historical?from=USD&to=BRL) against an unbounded cache
+    and returns the hit ratio obtained with the raw query string keys and with the canonical keys, computed by the
+    validator and key function of the stale_cache.cached_view of each view. Invalid requests are never cached
+    and are left out
+    """
+    raw_keys, canonical_keys = set(), set()
+    raw_hits, canonical_hits, total = 0, 0, 0
+
+    for path in request_paths:
+        with app.test_request_context(path):
+            if request.url_rule is None:
+                continue
+            view = app.view_functions[request.url_rule.endpoint]
+            if not hasattr(view, "make_cache_key"):
+                continue
+
+            try:
+                params = view.validate_params(request)
+            except (custom_exceptions.BadRequestError, custom_exceptions.MissingBrapiAPIKeyError):
+                continue
+
+            raw_key = f"view/{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+            canonical_key = view.make_cache_key(request.path, params)
+
+        total += 1
+        raw_hits += raw_key in raw_keys
+        canonical_hits += canonical_key in canonical_keys
+        raw_keys.add(raw_key)
+        canonical_keys.add(canonical_key)
+
+    return {
+        "requests": total,
+        "raw_hit_ratio": raw_hits / total if total else 0.0,
+        "raw_entries": len(raw_keys),
+        "canonical_hit_ratio": canonical_hits / total if total else 0.0,
+        "canonical_entries": len(canonical_keys),
+    }
+
+
+if __name__ == "__main__":
+    from main import app
+
+    paths = read_request_paths(sys.argv[1] if len(sys.argv) > 1 else str(configs.access_log_path))
+    results = measure_hit_ratios(app, paths)
+    print(f"Requests replayed: {results['requests']}")
+    print(f"Raw query string keys -> hit ratio: {results['raw_hit_ratio']:.1%} ({results['raw_entries']} entries)")
+    print(
+        f"Canonical keys        -> hit ratio: {results['canonical_hit_ratio']:.1%} "
+        f"({results['canonical_entries']} entries)"
+    )
@@ -0,0 +1,311 @@
+"""
+Cache warming: prefetches the most requested data after a restart, before the clients ask for it.
+
+Every successful GET to a cacheable endpoint is counted under a key made of its path and its normalized
+parameters (sorted, with empty ones left out, dates in %Y-%m-%d and the current date left out, since it is the
+default of the date parameters). The counts are kept in memory and merged every minute into a small histogram on
+disk (configurations.cache_warming_histogram_path, or CACHE_WARMING_HISTOGRAM_PATH), which only keeps the most
+requested keys and halves the older counts every configurations.cache_warming_half_life seconds.
+
+A background thread, started by the serving entry point with start_scheduler(app) (importing the API starts
+nothing), requests the top keys to the API itself a few seconds after it starts and then on a schedule, which
+fills the view and upstream caches: the popular tickers, the currency pairs of the current day, the popular
+stocksinfo sectors... Requests are only counted by the processes running it. The number of keys, the concurrency
+and the upstream calls a warming run may spend are set in configurations.py. Set CACHE_WARMING=off to disable it.
+
+Usage:
+    python cache_warming.py top [--limit N]    -> prints the most requested keys of the histogram
+    python cache_warming.py import-log [path]  -> adds the requests of a JSON access log (see tracing) to it
+    python cache_warming.py warm               -> runs one warming, in this process
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
+
+import configurations as configs
+import param_schemas
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Origin of the requests sent by the warming itself (see tracing.INTERNAL_REQUEST_KEY), which are not counted
+WARMING_ORIGIN = "cache-warming"
+
+# Header of the responses to the warming requests with the number of upstream requests they made
+UPSTREAM_CALLS_HEADER = "X-Upstream-Calls"
+
+# Parameters whose default is the current date
+DATE_PARAMS = frozenset(("date", "end_date"))
+# Parameters holding a date, in any of the accepted formats
+ANY_DATE_PARAMS = DATE_PARAMS | {"start_date"}
+
+_pending_counts = {}
+_pending_lock = threading.Lock()
+_histogram_lock = threading.Lock()
+_scheduler = None
+
+
+def warming_enabled() -> bool:
+    return (os.environ.get("CACHE_WARMING") or "on").lower() != "off"
+
+
+def get_histogram_path() -> Path:
+    return Path(os.environ.get("CACHE_WARMING_HISTOGRAM_PATH") or configs.cache_warming_histogram_path)
+
+
+# -------- Access frequency ---------- #
+
+def normalize_key(path: str, params) -> str:
+    """The histogram key of a request: its path and its parameters ((name, value) pairs) in a canonical form"""
+    today = param_schemas.get_today()
+    normalized = []
+    for name, value in params:
+        if not value:
+            continue
+        if name in ANY_DATE_PARAMS:
+            value = param_schemas.normalize_date(value) or value
+            # Requests for the current date are counted (and warmed) as requests for the current date of the
+            # warming, not for a date that is over by then
+            if name in DATE_PARAMS and value == today:
+                continue
+        normalized.append((name, value))
+
+    query = urlencode(sorted(normalized))
+    return f"{path}?{query}" if query else path
+
+
+def record_request(request, response) -> None:
+    """
+    Counts a successful GET to a cacheable endpoint. Must be called by an after_request function, before the
+    trace of the request ends
+    """
+    if request.environ.get(tracing.INTERNAL_REQUEST_KEY) == WARMING_ORIGIN:
+        trace = tracing.get_current_trace()
+        if trace is not None:
+            upstream_calls = sum(1 for span in trace.spans if span["phase"] == "upstream")
+            response.headers[UPSTREAM_CALLS_HEADER] = str(upstream_calls)
+        return
+
+    if (
+        _scheduler is None
+        or request.method != "GET"
+        or response.status_code != 200
+        or response.is_streamed
+        or request.path not in configs.cache_warming_routes
+    ):
+        return
+
+    key = normalize_key(request.path, request.args.items(multi=True))
+    with _pending_lock:
+        _pending_counts[key] = _pending_counts.get(key, 0) + 1
+
+
+def load_histogram(path: Path | None = None) -> dict:
+    """{'updatedAt': Unix time, 'counts': {key: count}} saved in 'path', or an empty histogram"""
+    try:
+        with open(path or get_histogram_path(), encoding="utf-8") as file:
+            histogram = json.load(file)
+    except (OSError, ValueError):
+        return {"updatedAt": time.time(), "counts": {}}
+
+    if not isinstance(histogram.get("counts"), dict):
+        return {"updatedAt": time.time(), "counts": {}}
+    return histogram
+
+
+def merge_counts(histogram: dict, counts: dict, now: float) -> dict:
+    """
+    Adds 'counts' to the histogram, after halving its counts once per half-life since it was updated, and keeps only
+    the most requested keys
+    """
+    decay = 0.5 ** (max(0.0, now - histogram["updatedAt"]) / configs.cache_warming_half_life)
+    merged = {key: count * decay for key, count in histogram["counts"].items()}
+    for key, count in counts.items():
+        merged[key] = merged.get(key, 0.0) + count
+
+    top_keys = sorted(merged, key=merged.get, reverse=True)[: configs.cache_warming_histogram_size]
+    return {"updatedAt": now, "counts": {key: round(merged[key], 3) for key in top_keys}}
+
+
+@contextmanager
+def histogram_file_lock(path: Path):
+    """
+    Serializes the updates of the histogram in 'path' between the threads and the API processes of the host (a
+    lock on a file next to it), so no process overwrites the counts merged by another
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _histogram_lock, open(path.with_name(f"{path.name}.lock"), "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def flush(path: Path | None = None) -> None:
+    """Merges the counts recorded since the last flush into the histogram on disk"""
+    with _pending_lock:
+        counts = _pending_counts.copy()
+        _pending_counts.clear()
+    if not counts:
+        return
+
+    path = path or get_histogram_path()
+    # Read, merged and written under the lock, so the counts flushed at the same time by other processes are kept
+    with histogram_file_lock(path):
+        histogram = merge_counts(load_histogram(path), counts, time.time())
+        # Written aside and renamed, so the readers (get_top_keys) never read a half written file
+        temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(histogram, file, separators=(",", ":"))
+        os.replace(temporary_path, path)
+
+
+def get_top_keys(limit: int, path: Path | None = None) -> list[tuple[str, float]]:
+    """The 'limit' most requested keys (with their decayed counts) requested at least cache_warming_min_count times"""
+    histogram = load_histogram(path)
+    counts = merge_counts(histogram, {}, time.time())["counts"]
+    return [(key, count) for key, count in counts.items() if count >= configs.cache_warming_min_count][:limit]
+
+
+def import_access_log(log_path: Path) -> int:
+    """Counts the requests of a JSON access log (one record per line, see tracing) and returns how many were added"""
+    added = 0
+    with open(log_path, encoding="utf-8") as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if (
+                record.get("internalRequest")
+                or record.get("method") != "GET"
+                or record.get("status") != 200
+                or record.get("streamed")
+                or record.get("path") not in configs.cache_warming_routes
+            ):
+                continue
+
+            key = normalize_key(record["path"], parse_qsl(record.get("query") or ""))
+            with _pending_lock:
+                _pending_counts[key] = _pending_counts.get(key, 0) + 1
+            added += 1
+
+    flush()
+    return added
+
+
+# -------- Warming ---------- #
+
+def warm(app, limit: int | None = None) -> dict:
+    """
+    Requests the most requested keys to the app, a few at a time, until they are all requested or the upstream
+    budget of the run is spent. Returns a summary of the run
+    """
+    keys = [key for key, _ in get_top_keys(limit or configs.cache_warming_top_keys)]
+    summary = {"keys": len(keys), "warmed": 0, "failed": 0, "skipped": 0, "upstreamCalls": 0}
+    summary_lock = threading.Lock()
+    started_at = time.perf_counter()
+
+    def warm_key(key: str) -> None:
+        # The budget is checked before each request, so a run may go over it by the requests already in flight
+        with summary_lock:
+            if summary["upstreamCalls"] >= configs.cache_warming_upstream_budget:
+                summary["skipped"] += 1
+                return
+
+        try:
+            response = app.test_client().get(key, environ_base={tracing.INTERNAL_REQUEST_KEY: WARMING_ORIGIN})
+            status, upstream_calls = response.status_code, int(response.headers.get(UPSTREAM_CALLS_HEADER, 0))
+            response.close()
+        except Exception:
+            logger.exception("Could not warm %s", key)
+            status, upstream_calls = None, 0
+
+        with summary_lock:
+            summary["upstreamCalls"] += upstream_calls
+            summary["warmed" if status == 200 else "failed"] += 1
+
+    with ThreadPoolExecutor(
+        max_workers=configs.cache_warming_concurrency, thread_name_prefix="cache-warming"
+    ) as executor:
+        list(executor.map(warm_key, keys))
+
+    summary["durationMs"] = round((time.perf_counter() - started_at) * 1000, 3)
+    return summary
+
+
+def run_scheduler(app) -> None:
+    """Flushes the counts every cache_warming_flush_interval seconds and warms every cache_warming_interval ones"""
+    time.sleep(configs.cache_warming_startup_delay)
+    next_warming = time.monotonic()
+
+    while True:
+        try:
+            flush()
+            if time.monotonic() >= next_warming:
+                next_warming = time.monotonic() + configs.cache_warming_interval
+                logger.info("Cache warming: %s", warm(app))
+        except Exception:
+            logger.exception("Cache warming failed")
+        time.sleep(configs.cache_warming_flush_interval)
+
+
+def start_scheduler(app) -> None:
+    """Starts the warming thread of this process, unless CACHE_WARMING=off"""
+    global _scheduler
+
+    if _scheduler is not None or not warming_enabled():
+        return
+    _scheduler = threading.Thread(target=run_scheduler, args=(app,), name="cache-warming", daemon=True)
+    _scheduler.start()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cache warming histogram and runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    top_parser = subparsers.add_parser("top", help="Prints the most requested keys")
+    top_parser.add_argument("--limit", type=int, default=configs.cache_warming_top_keys)
+    import_parser = subparsers.add_parser("import-log", help="Counts the requests of a JSON access log")
+    import_parser.add_argument("path", type=Path, nargs="?", default=configs.access_log_path)
+    warm_parser = subparsers.add_parser("warm", help="Runs one warming in this process")
+    warm_parser.add_argument("--limit", type=int, default=configs.cache_warming_top_keys)
+    args = parser.parse_args()
+
+    if args.command == "top":
+        for key, count in get_top_keys(args.limit):
+            print(f"{count:>12.1f}  {key}")
+
+    elif args.command == "import-log":
+        print(f"{import_access_log(args.path)} requests added to {get_histogram_path()}")
+
+    else:
+        # The warming requests are not logged
+        os.environ.setdefault("ACCESS_LOG_PATH", "off")
+        from main import app
+
+        print(json.dumps(warm(app, args.limit), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,221 @@
+from datetime import time
+from pathlib import Path
+
 default_flask_api_config = {
     "DEBUG": True,
     "CACHE_TYPE": "SimpleCache",
     "CACHE_DELFAULT_TIMEOUT": 300,
 }
+
+# -- Local historical FX rate store -- #
+# Default directory where the memory-mapped ECB rate history is kept. It can be overridden with the
+# RATE_STORE_DIR environment variable (useful when several API instances on the same host share one copy).
+rate_store_directory = Path(__file__).parent / "data" / "rate_store"
+
+# First day of the ECB reference rates history served by the FrankFurter API
+rate_store_history_start = "1999-01-04"
+
+# -- Shared cross-process cache (enabled with CACHE_BACKEND=sqlite) -- #
+# Default location of the SQLite database shared by every API process on the host. It can be overridden with
+# the SHARED_CACHE_PATH environment variable
+shared_cache_path = Path(__file__).parent / "data" / "shared_cache.sqlite3"
+
+# Above this number of entries, the ones closest to expiring are removed
+shared_cache_max_entries = 100000
+
+# Bytes of the database file read through mmap instead of read() calls
+shared_cache_mmap_size = 256 * 1024 * 1024
+
+# -- Interval conversions -- #
+# Intervals spanning more calendar months than this (and not in the local rate store) are requested to the
+# FrankFurter API in a single call, instead of one call per month
+interval_max_month_segments = 12
+
+# -- B3 quotes -- #
+# Maximum number of tickers accepted by a single request to the quote endpoint
+b3_quote_max_tickers_per_request = 50
+
+# Number of tickers brapi accepts in a single quote request. The API is set up with a free brapi key (see the
+# README), and the free plan only accepts one ticker per request, so by default each ticker that is not cached costs
+# one request. The paid plans accept several: set the BRAPI_MAX_TICKERS_PER_CALL environment variable to the limit
+# of the plan of the key in use, and the tickers of a batch quote are sent together
+brapi_max_tickers_per_call = 1
+
+# -- Upstream resilience (circuit breakers, retries and connection pools) -- #
+# (connect, read) timeouts, in seconds, of every request sent to the upstream APIs
+upstream_timeouts = (3.05, 10)
+
+# Connections kept open to each upstream API by the 'requests' session
+upstream_pool_maxsize = {
+    "frankfurter": 32,
+    "brapi": 8,
+}
+
+# Idempotent GETs are retried up to this number of times, on connection errors (including connect timeouts) and
+# these statuses. Read timeouts are never retried: a hung upstream must fail within one read timeout, so it does not
+# hold a worker thread for several of them and its circuit breaker sees the failure right away.
+# The delay before retry N (the first one included) is backoff * 2 ** (N - 1) (at most backoff_max) plus a random
+# jitter of up to backoff (see upstream_policy.JitteredRetry)
+upstream_retry_attempts = 2
+upstream_retry_statuses = frozenset({502, 503, 504})
+upstream_retry_backoff = 0.2
+upstream_retry_backoff_max = 2.0
+
+# A breaker opens when, among its last 'window_size' calls (at least 'minimum_calls'), the rate of failed or slow
+# calls reaches its threshold. It stays open for 'open_seconds' and then lets 'half_open_max_calls' probes through
+upstream_circuit_breakers = {
+    "frankfurter": {
+        "window_size": 20,
+        "minimum_calls": 5,
+        "failure_rate_threshold": 0.5,
+        "slow_call_seconds": 3.0,
+        "slow_call_rate_threshold": 0.8,
+        "open_seconds": 30.0,
+        "half_open_max_calls": 2,
+    },
+    "brapi": {
+        "window_size": 20,
+        "minimum_calls": 5,
+        "failure_rate_threshold": 0.5,
+        "slow_call_seconds": 5.0,
+        "slow_call_rate_threshold": 0.8,
+        "open_seconds": 60.0,
+        "half_open_max_calls": 1,
+    },
+}
+
+# Maximum number of tickers returned by a single request to the ticker search endpoint
+b3_ticker_search_max_limit = 100
+
+# Number of stocks requested per page when the whole brapi /quote/list universe is loaded by the stock screener
+brapi_quote_list_page_size = 500
+
+# -- HTTP caching headers -- #
+# max-age (in seconds) of the responses that never change, such as conversions of past dates (one year)
+http_cache_immutable_max_age = 31536000
+
+# max-age (in seconds) of the responses that only change when the API itself changes (the list of currencies)
+http_cache_static_max_age = 86400
+
+# -- Streamed interval conversions (format=ndjson|csv) -- #
+# Number of dates converted and sent together in each chunk of the stream
+interval_stream_chunk_size = 256
+
+# -- FX analytics -- #
+# Longest rolling window (in business days) accepted by the analytics endpoint
+fx_analytics_max_window = 1000
+
+# -- Resampled B3 quote history and indicators -- #
+# Ranges of daily history kept per ticker. A request is derived from the shortest one that covers its range
+b3_daily_history_ranges = ("1y", "5y", "max")
+
+# Longest period accepted by an indicator (ex: sma:200)
+b3_indicator_max_period = 1000
+
+# -- Benchmarks (benchmark.py) -- #
+# Default file where the benchmark results are saved as a baseline and compared against
+benchmark_baseline_path = Path(__file__).parent / "data" / "benchmark_baseline.json"
+
+# A benchmark whose median time grew more than this fraction over the baseline is flagged as a regression
+benchmark_regression_threshold = 0.15
+
+# Each benchmark runs for at least this many seconds (and at least benchmark_min_iterations times)
+benchmark_min_time = 0.5
+benchmark_min_iterations = 20
+
+# -- Load tests (load_test.py) -- #
+# Concurrent clients and duration (in seconds) of a load test run
+load_test_concurrency = 16
+load_test_duration = 30
+
+# Seconds the API process started by a load test has to answer its first request
+load_test_startup_timeout = 30
+
+# -- Tracing and access log -- #
+# File where one JSON line per request is written. It can be overridden with the ACCESS_LOG_PATH environment
+# variable ("-" writes to the standard error, "off" disables the access log)
+access_log_path = Path(__file__).parent / "data" / "access.log"
+
+# -- Swagger documentation (api_docs.py) -- #
+# "lazy" imports flasgger and loads the spec only when the documentation is first requested, "eager" sets
+# flasgger up when the API starts. It can be overridden with the SWAGGER_MODE environment variable
+swagger_mode = "lazy"
+
+# File where 'python api_docs.py' saves the precompiled spec loaded by the lazy mode. It can be overridden with
+# the SWAGGER_SPEC_PATH environment variable
+swagger_spec_path = Path(__file__).parent / "data" / "apispec.json"
+
+# Longest time (in seconds) importing main.py may take, checked by 'python benchmark.py --filter startup'
+import_time_budget = 0.5
+
+# Fresh interpreters started to measure the import time (the median is reported)
+import_time_runs = 5
+
+# -- Cache TTL policy (ttl_policy.py) -- #
+# Time to live (in seconds) of the cached data that never changes, such as the rates of past dates (one year)
+immutable_data_ttl = 31536000
+
+# The ECB publishes the reference rates of each TARGET business day around 16:00 CET. The FrankFurter API is
+# asked again for them this many seconds after the publication
+ecb_timezone = "Europe/Berlin"
+ecb_publication_time = time(16, 0)
+ecb_publication_delay = 900
+
+# TTL of the latest rates when the data does not tell whether the latest publication was picked up
+fx_latest_rate_ttl = 3600
+
+# TTL of the rates whose publication is late (the FrankFurter API still returns the ones of a previous day)
+fx_unpublished_rate_ttl = 300
+
+# B3 trading session, in local time (including the closing call). Outside of it, quotes, the stocks snapshot and
+# the ticker list are cached until the next session opens
+b3_timezone = "America/Sao_Paulo"
+b3_session_open = time(10, 0)
+b3_session_close = time(18, 0)
+
+# Days the B3 does not trade besides the weekends and the holidays known by ttl_policy (ex: date(2027, 1, 25))
+b3_extra_holidays = set()
+
+# TTLs (in seconds) during the trading session
+b3_quote_session_ttl = 900
+b3_stocks_session_ttl = 900
+b3_tickers_session_ttl = 10800
+
+# How long (in seconds) expired B3 data is still served while it is refreshed in the background
+b3_stale_ttl = 86400
+
+# -- Cache warming (cache_warming.py, disabled with CACHE_WARMING=off) -- #
+# File with the access frequency of the most requested keys. It can be overridden with the
+# CACHE_WARMING_HISTOGRAM_PATH environment variable
+cache_warming_histogram_path = Path(__file__).parent / "data" / "access_histogram.json"
+
+# Keys kept in the histogram, and time (in seconds) after which the older counts weigh half
+cache_warming_histogram_size = 2000
+cache_warming_half_life = 86400
+
+# Endpoints whose requests are counted and warmed
+cache_warming_routes = frozenset(
+    (
+        "/v1/conversion/historical",
+        "/v1/conversion/interval",
+        "/v1/conversion/analytics",
+        "/v1/b3stocks/all",
+        "/v1/b3stocks/search",
+        "/v1/b3stocks/quote",
+        "/v1/b3stocks/stocksinfo",
+    )
+)
+
+# Keys requested by each warming run, and the count a key needs to be warmed
+cache_warming_top_keys = 50
+cache_warming_min_count = 2
+
+# Warming requests in flight at a time, and the upstream requests a warming run may make (brapi's quota is tight)
+cache_warming_concurrency = 4
+cache_warming_upstream_budget = 40
+
+# Seconds after the start of the API before the first warming, between two warmings and between two writes of the
+# counts to the histogram
+cache_warming_startup_delay = 5
+cache_warming_interval = 900
+cache_warming_flush_interval = 60
@@ -1,3 +1,6 @@
+from requests import RequestException
+
+
 class NonExistentDateError(Exception):
     """This error object will be raised when a Date does not exist"""
 
@@ -14,3 +17,11 @@ class InvalidBrapiAPIKeyError(Exception):
 
 class MissingBrapiAPIKeyError(Exception):
     pass
+
+
+class UpstreamUnavailableError(RequestException):
+    """Raised without calling an upstream API while its circuit breaker is open"""
+
+    def __init__(self, message: str, retry_after: int = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
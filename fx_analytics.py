@@ -0,0 +1,129 @@
+"""
+Statistics of a currency pair over a date range, computed with vectorized NumPy over its daily rate series.
+
+Each metric receives the business days and the rates of one pair (NaN days already removed) and returns a small
+dict, so the clients get a handful of numbers instead of the whole interval series:
+
+    returns        -> total, mean daily and annualized log returns
+    volatility     -> annualized volatility over the range and over the rolling window
+    moving_average -> simple moving average over the window, and how far the last rate is from it
+    drawdown       -> largest peak-to-trough fall, and the current one
+    minmax         -> lowest, highest, first and last rates
+"""
+
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ECB reference rates are published on TARGET business days, about 252 per year
+BUSINESS_DAYS_PER_YEAR = 252
+
+
+def to_number(value, significant_digits: int = 6) -> float | None:
+    """Rounds a statistic for the response. Undefined values (NaN, a window longer than the series) become None"""
+    value = float(value)
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return float(f"{value:.{significant_digits}g}")
+
+
+def log_returns(rates: np.ndarray) -> np.ndarray:
+    return np.diff(np.log(rates))
+
+
+def returns_summary(days: list[str], rates: np.ndarray, window: int) -> dict:
+    daily_returns = log_returns(rates)
+    mean_daily_return = daily_returns.mean() if daily_returns.size else math.nan
+
+    return {
+        "total": to_number(rates[-1] / rates[0] - 1),
+        "meanDailyLog": to_number(mean_daily_return),
+        "annualized": to_number(math.expm1(mean_daily_return * BUSINESS_DAYS_PER_YEAR)),
+    }
+
+
+def volatility_summary(days: list[str], rates: np.ndarray, window: int) -> dict:
+    daily_returns = log_returns(rates)
+    annualization = math.sqrt(BUSINESS_DAYS_PER_YEAR)
+
+    if daily_returns.size >= window:
+        # One row per window of 'window' consecutive daily returns
+        rolling = sliding_window_view(daily_returns, window).std(axis=-1, ddof=1) * annualization
+        latest, highest = rolling[-1], rolling.max()
+    else:
+        latest = highest = math.nan
+
+    return {
+        "window": window,
+        "annualized": to_number(daily_returns.std(ddof=1) * annualization if daily_returns.size > 1 else math.nan),
+        "rollingLatest": to_number(latest),
+        "rollingMax": to_number(highest),
+    }
+
+
+def moving_average_summary(days: list[str], rates: np.ndarray, window: int) -> dict:
+    if rates.size >= window:
+        moving_averages = sliding_window_view(rates, window).mean(axis=-1)
+        latest = moving_averages[-1]
+    else:
+        latest = math.nan
+
+    return {
+        "window": window,
+        "latest": to_number(latest),
+        "lastRateVsAverage": to_number(rates[-1] / latest - 1),
+    }
+
+
+def drawdown_summary(days: list[str], rates: np.ndarray, window: int) -> dict:
+    running_peaks = np.maximum.accumulate(rates)
+    drawdowns = rates / running_peaks - 1
+
+    trough = int(drawdowns.argmin())
+    peak = int(rates[: trough + 1].argmax())
+
+    return {
+        "max": to_number(drawdowns[trough]),
+        "peakDate": days[peak],
+        "troughDate": days[trough],
+        "current": to_number(drawdowns[-1]),
+    }
+
+
+def minmax_summary(days: list[str], rates: np.ndarray, window: int) -> dict:
+    lowest, highest = int(rates.argmin()), int(rates.argmax())
+
+    return {
+        "min": to_number(rates[lowest]),
+        "minDate": days[lowest],
+        "max": to_number(rates[highest]),
+        "maxDate": days[highest],
+        "first": to_number(rates[0]),
+        "last": to_number(rates[-1]),
+    }
+
+
+METRICS = {
+    "returns": returns_summary,
+    "volatility": volatility_summary,
+    "moving_average": moving_average_summary,
+    "drawdown": drawdown_summary,
+    "minmax": minmax_summary,
+}
+
+# Metrics whose result depends on the 'window' parameter
+WINDOWED_METRICS = {"volatility", "moving_average"}
+
+
+def compute_metric(metric: str, days: list[str], rates: np.ndarray, window: int) -> dict | None:
+    """Computes 'metric' over a pair's series. Days without a rate (NaN) are left out. Empty series give None"""
+    quoted = ~np.isnan(rates)
+    if not quoted.any():
+        return None
+
+    if not quoted.all():
+        days = [day for day, is_quoted in zip(days, quoted.tolist()) if is_quoted]
+        rates = rates[quoted]
+
+    return METRICS[metric](days, rates, window)
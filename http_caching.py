@@ -0,0 +1,70 @@
+"""
+HTTP caching headers (Cache-Control, ETag, Last-Modified) and conditional GETs.
+
+The max-age of each endpoint follows its data (see ttl_policy): conversions of past dates never change and are
+cached for a long time, while the latest rates, the quotes and the stocks snapshot are cached only until they may
+change, and never for longer than our own cached copy is fresh. Every successful GET carries an ETag (the one of the cached payload when it comes from a cache),
+and requests whose If-None-Match (or If-Modified-Since) still matches are answered with 304 Not Modified.
+"""
+
+import functools
+import time
+
+from flask import current_app, request
+
+import configurations as configs
+import response_encoding
+import stale_cache
+
+
+def policy_max_age(ttl):
+    """
+    Returns a max-age function following a TTL function of ttl_policy: data that is final gets the long, immutable
+    max-age, and the rest is cached downstream until it may change (the next publication of the ECB rates, the
+    end of the B3 trading session...)
+    """
+
+    def max_age() -> int:
+        return int(min(ttl(time.time()), configs.http_cache_immutable_max_age))
+
+    return max_age
+
+
+def cache_control(max_age):
+    """
+    Adds the caching headers to the successful GET responses of a Flask view and answers the conditional requests
+    with 304. 'max_age' is a number of seconds, or a function returning it for the current request. Responses
+    that were not served as a whole from a cache are never cached downstream for longer than the cached data
+    they were built from stays fresh.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            response = current_app.make_response(view(*args, **kwargs))
+
+            if request.method not in ("GET", "HEAD") or response.status_code != 200 or response.is_streamed:
+                return response
+
+            seconds = max_age() if callable(max_age) else max_age
+            fresh_until = stale_cache.get_data_fresh_until()
+
+            if stale_cache.get_served_staleness() is not None:
+                # Part of the data is being refreshed: clients should come back for the new version right away
+                seconds = 0
+            elif "Age" not in response.headers and fresh_until is not None:
+                seconds = min(seconds, max(0, int(fresh_until - time.time())))
+
+            response.cache_control.public = True
+            response.cache_control.max_age = seconds
+            if seconds >= configs.http_cache_immutable_max_age:
+                response.cache_control.immutable = True
+
+            if response.get_etag() == (None, None):
+                response.set_etag(response_encoding.compute_etag(response.get_data()), weak=True)
+
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,318 @@
+"""
+End-to-end load tests of the API against local stub FrankFurter and brapi servers.
+
+The stub servers (upstream_stubs.StubServer) answer like the real APIs, with configurable latency, 503 errors and
+429 rate limiting. The API runs unchanged in a separate process pointed to them, and a traffic generator sends it
+a mix of requests from concurrent clients. The report shows:
+
+    throughput         -> requests answered per second, by status code
+    latency            -> 50th, 90th and 99th percentiles and maximum, overall and per endpoint
+    upstream calls     -> requests received by each stub, by status code
+    amplification      -> upstream calls per request to the API (below 1 when the caches do their job)
+
+Usage:
+    python load_test.py                                       -> default mix, 16 clients for 30 seconds
+    python load_test.py --mix recorded.jsonl --concurrency 64 -> replays a recorded request mix
+    python load_test.py --latency 0.3 --rate-limit-rate 0.05  -> slow upstream APIs that rate limit 5% of calls
+    python load_test.py --target http://127.0.0.1:5000        -> an API already running (and pointed to the stubs)
+
+A request mix file has one JSON object per line: {"path": "/v1/currencies", "weight": 3}. "method" (GET or POST),
+"body" (JSON body of a POST), "query" (when not part of the path) and "weight" are optional. Requests are drawn
+at random in proportion to their weights, so a recording with one line per request is replayed in its proportions.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import requests
+
+import configurations as configs
+import upstream_stubs
+
+# Request mix used when no --mix file is given. Roughly the traffic of the public API: mostly conversions and
+# quotes, with a long tail of heavier interval and screener requests
+DEFAULT_MIX = [
+    {"path": "/v1/conversion/historical?from=USD&to=BRL", "weight": 20},
+    {"path": "/v1/conversion/historical?from=EUR&to=BRL,USD&date=2024-03-15", "weight": 10},
+    {"path": "/v1/conversion/interval?from=USD&to=BRL&start_date=2024-01-01&end_date=2024-06-30", "weight": 8},
+    {"path": "/v1/conversion/analytics?from=USD&to=BRL&start_date=2023-01-01&end_date=2024-12-31", "weight": 3},
+    {"path": "/v1/currencies", "weight": 5},
+    {"path": "/v1/b3stocks/quote?ticker=PETR4", "weight": 15},
+    {"path": "/v1/b3stocks/quote?ticker=VALE3,ITUB4,BBDC4&range=1mo&interval=1d", "weight": 8},
+    {"path": "/v1/b3stocks/search?prefix=PE", "weight": 5},
+    {"path": "/v1/b3stocks/stocksinfo?sector=Finance&sortedBy=volume&order=desc&limit=20", "weight": 4},
+    {"path": "/v1/b3stocks/all", "weight": 2},
+]
+
+
+def build_request_mix(records: list[dict]) -> list[tuple[dict, float]]:
+    """Converts the records of a request mix into (request, weight) pairs"""
+    mix = []
+    for record in records:
+        request = {
+            "method": record.get("method", "GET").upper(),
+            "path": record["path"] + (f"?{record['query']}" if record.get("query") else ""),
+            "body": record.get("body"),
+        }
+        mix.append((request, float(record.get("weight", 1))))
+    return mix
+
+
+def read_request_mix(path: Path) -> list[tuple[dict, float]]:
+    """Reads a request mix file (one JSON request per line)"""
+    with open(path, encoding="utf-8") as file:
+        return build_request_mix([json.loads(line) for line in file if line.strip()])
+
+
+def get_route(path: str) -> str:
+    return path.split("?", 1)[0]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class TrafficGenerator:
+    """
+    Sends requests drawn from 'mix' to 'target' from 'concurrency' clients, each waiting for its response before
+    sending the next one. With 'rate', the clients together send at most that many requests per second
+    """
+
+    def __init__(self, target: str, mix: list[tuple[dict, float]], concurrency: int, rate: float | None = None):
+        self.target = target.rstrip("/")
+        self.requests = [request for request, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.concurrency = concurrency
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._sent = 0
+
+    def _wait_for_turn(self, started_at: float) -> None:
+        """Paces the clients so the requests leave at a steady 'rate'"""
+        with self._lock:
+            send_at = started_at + self._sent / self.rate
+            self._sent += 1
+        delay = send_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self, duration: float, seed: int = 0) -> list[tuple[str, str, float]]:
+        """Runs the clients for 'duration' seconds and returns the (route, status, seconds) of every request"""
+        results = []
+        started_at = time.perf_counter()
+        deadline = started_at + duration
+
+        def client(number: int):
+            generator = random.Random(seed + number)
+            session = requests.Session()
+            client_results = []
+
+            while time.perf_counter() < deadline:
+                if self.rate:
+                    self._wait_for_turn(started_at)
+                request = generator.choices(self.requests, self.weights)[0]
+                request_started_at = time.perf_counter()
+                try:
+                    response = session.request(
+                        request.get("method", "GET"),
+                        self.target + request["path"],
+                        json=request.get("body"),
+                        timeout=60,
+                    )
+                    status = str(response.status_code)
+                except requests.RequestException:
+                    status = "error"
+                elapsed = time.perf_counter() - request_started_at
+                client_results.append((get_route(request["path"]), status, elapsed))
+
+            with self._lock:
+                results.extend(client_results)
+
+        threads = [threading.Thread(target=client, args=(number,)) for number in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+
+def build_report(results: list[tuple[str, str, float]], duration: float, upstream_counts: dict) -> dict:
+    latencies_by_route = defaultdict(list)
+    for route, _, seconds in results:
+        latencies_by_route[route].append(seconds)
+
+    def latency_summary(latencies: list[float]) -> dict:
+        latencies = sorted(latencies)
+        return {
+            "requests": len(latencies),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        }
+
+    upstream_calls = sum(sum(counts.values()) for counts in upstream_counts.values())
+    return {
+        "requests": len(results),
+        "durationSeconds": round(duration, 2),
+        "throughput": round(len(results) / duration, 2) if duration else 0.0,
+        "statuses": dict(Counter(status for _, status, _ in results)),
+        "latency": latency_summary([seconds for _, _, seconds in results]),
+        "latencyByRoute": {
+            route: latency_summary(latencies) for route, latencies in sorted(latencies_by_route.items())
+        },
+        "upstreamCalls": {
+            api: {str(status): count for status, count in counts.items()} for api, counts in upstream_counts.items()
+        },
+        "amplification": round(upstream_calls / len(results), 4) if results else 0.0,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['requests']} requests in {report['durationSeconds']}s: {report['throughput']} req/s")
+    print("statuses: " + ", ".join(f"{status}: {count}" for status, count in sorted(report["statuses"].items())))
+
+    print(f"\n{'route':<36} {'requests':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for route, summary in list(report["latencyByRoute"].items()) + [("(all)", report["latency"])]:
+        print(
+            f"{route:<36} {summary['requests']:>9} {summary['p50_ms']:>7.1f}ms {summary['p90_ms']:>7.1f}ms "
+            f"{summary['p99_ms']:>7.1f}ms {summary['max_ms']:>7.1f}ms"
+        )
+
+    print()
+    for api, counts in report["upstreamCalls"].items():
+        print(f"{api} calls: " + (", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "0"))
+    print(f"upstream calls per request (amplification): {report['amplification']}")
+
+
+# -------- API process ---------- #
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_app(port: int) -> None:
+    """Runs the API with a threaded WSGI server. Used by the process started by start_app()"""
+    from werkzeug.serving import make_server
+
+    from main import app
+
+    # One log line per request would slow the server down and flood the output
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def start_app(frankfurter_url: str, brapi_url: str) -> tuple[subprocess.Popen, str]:
+    """
+    Starts the API in a new process pointed to the stub servers, with an empty rate store, in-process caches and
+    its access log in a temporary directory, and waits until it answers
+    """
+    port = get_free_port()
+    work_directory = tempfile.mkdtemp(prefix="financeapi-load-test-")
+    env = {
+        **os.environ,
+        "FRANKFURTER_API_BASE_URL": frankfurter_url,
+        "BRAPI_API_BASE_URL": brapi_url,
+        "BRAPI_API_KEY": os.environ.get("BRAPI_API_KEY") or "load-test",
+        "RATE_STORE_DIR": os.path.join(work_directory, "rate_store"),
+        "ACCESS_LOG_PATH": os.path.join(work_directory, "access.log"),
+        "CACHE_BACKEND": "memory",
+    }
+    process = subprocess.Popen([sys.executable, __file__, "--serve-app", str(port)], env=env)
+    target = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + configs.load_test_startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The API process exited with status {process.returncode}")
+        try:
+            requests.get(f"{target}/v1/currencies", timeout=1)
+            return process, target
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError(f"The API did not answer within {configs.load_test_startup_timeout} seconds")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load tests the API against stub FrankFurter and brapi servers")
+    parser.add_argument("--mix", type=Path, help="Request mix file (JSON lines). Defaults to a built-in mix")
+    parser.add_argument("--concurrency", type=int, default=configs.load_test_concurrency)
+    parser.add_argument("--duration", type=float, default=configs.load_test_duration, help="Seconds of traffic")
+    parser.add_argument("--warmup", type=float, default=0.0, help="Seconds of traffic before the measurements")
+    parser.add_argument("--rate", type=float, help="Maximum requests per second, across all clients")
+    parser.add_argument("--target", help="URL of an API already running. By default a new one is started")
+    parser.add_argument("--output", type=Path, help="Also saves the report to this JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve-app", type=int, help=argparse.SUPPRESS)
+    upstream_stubs.add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    if args.serve_app:
+        serve_app(args.serve_app)
+        return
+
+    faults = upstream_stubs.get_fault_profile(args)
+    stubs = {
+        "frankfurter": upstream_stubs.StubServer("frankfurter", faults=faults).start(),
+        "brapi": upstream_stubs.StubServer("brapi", faults=faults).start(),
+    }
+
+    process = None
+    if args.target:
+        target = args.target
+        print(f"FRANKFURTER_API_BASE_URL={stubs['frankfurter'].base_url}")
+        print(f"BRAPI_API_BASE_URL={stubs['brapi'].base_url}")
+    else:
+        process, target = start_app(stubs["frankfurter"].base_url, stubs["brapi"].base_url)
+
+    try:
+        mix = read_request_mix(args.mix) if args.mix else build_request_mix(DEFAULT_MIX)
+        generator = TrafficGenerator(target, mix, args.concurrency, args.rate)
+
+        if args.warmup:
+            generator.run(args.warmup, seed=args.seed)
+        counts_before = {api: Counter(stub.get_response_counts()) for api, stub in stubs.items()}
+
+        started_at = time.perf_counter()
+        results = generator.run(args.duration, seed=args.seed + 1)
+        duration = time.perf_counter() - started_at
+
+        upstream_counts = {
+            api: Counter(stub.get_response_counts()) - counts_before[api] for api, stub in stubs.items()
+        }
+        report = build_report(results, duration, upstream_counts)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        for stub in stubs.values():
+            stub.stop()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,28 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_caching import Cache
-from flasgger import Swagger, swag_from
 # -- Production WSGI server -- #
 # from waitress import serve
-from requests import RequestException
+from requests import RequestException, Timeout
+import os
+import time
 
 # -- Personal modules -- #
 import custom_exceptions
 import useful_functions as uf
 import standard_responses as sr
 import configurations as configs
-import templates
+import cache_keys
+import stale_cache
+import shared_cache
+import upstream_policy
+import response_encoding
+import cache_warming
+import http_caching
+import ttl_policy
+import metrics
+import tracing
+import api_docs
+from api_docs import swag_from
 
 """
 HTML response status for reference: https://developer.mozilla.org/en-US/docs/Web/HTTP/Reference/Status
@@ -20,9 +32,138 @@ app = Flask(__name__)
 # Adding some default configs to the Flask API instance
 app.config.from_mapping(configs.default_flask_api_config)
 
+# Cache shared by every process on the host when CACHE_BACKEND=sqlite is set
+app.config.from_mapping(shared_cache.get_flask_cache_config())
+
+# jsonify() encodes with orjson when it is installed
+app.json = response_encoding.FastJSONProvider(app)
+
 cache = Cache(app)
 
-swagger = Swagger(app, template=templates.swagger_template)
+# Lazy by default: flasgger is only imported when the documentation is first requested (see api_docs)
+swagger = api_docs.init_app(app)
+
+
+# -------- Tracing and access log ---------- #
+
+# The access log is opened on the first request (see tracing.log_request)
+
+
+@app.before_request
+def start_request_trace():
+    tracing.start_trace(request.headers)
+
+
+# Registered before every other after_request function, so it runs last and the trace covers them too
+@app.after_request
+def finish_request_trace(response):
+    trace = tracing.get_current_trace()
+    if trace is not None:
+        response.headers["X-Trace-ID"] = trace.trace_id
+        response.headers["Server-Timing"] = tracing.get_server_timing(trace)
+        tracing.log_request(trace, request, response)
+    return response
+
+
+@app.teardown_request
+def end_request_trace(err):
+    tracing.end_trace()
+
+
+# -------- Request metrics ---------- #
+
+def get_route_label() -> str:
+    # The URL rule (ex: /v1/conversion/historical) keeps the number of label values bounded
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started_at = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.inc(route=get_route_label())
+
+
+# Registered before the other after_request functions (but the tracing one), so it measures them too
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.pop("request_started_at", None)
+    if started_at is not None:
+        route = get_route_label()
+        metrics.REQUEST_DURATION.observe(
+            time.perf_counter() - started_at, route=route, method=request.method, status=response.status_code
+        )
+        metrics.REQUESTS_IN_FLIGHT.dec(route=route)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(err):
+    # Requests whose response was never built (after_request did not run) must leave the in-flight gauge too
+    if g.pop("request_started_at", None) is not None:
+        metrics.REQUESTS_IN_FLIGHT.dec(route=get_route_label())
+
+
+# -------- Stale data signaling ---------- #
+
+@app.before_request
+def reset_served_staleness():
+    stale_cache.reset_served_staleness()
+
+
+@app.after_request
+def add_staleness_headers(response):
+    """Tells the client when part of the response comes from a cache entry that is being refreshed"""
+    staleness = stale_cache.get_served_staleness()
+    if staleness is not None:
+        response.headers["Warning"] = '110 - "Response is Stale"'
+        response.headers["X-Data-Staleness"] = str(int(staleness))
+    return response
+
+
+@app.after_request
+def compress_large_responses(response):
+    """The cached responses are already compressed. The other large ones are compressed here, on the fly"""
+    return response_encoding.compress_response(response)
+
+
+# -------- Cache warming ---------- #
+
+@app.after_request
+def record_cache_warming_access(response):
+    """Counts the requests worth prefetching after a restart (see cache_warming)"""
+    cache_warming.record_request(request, response)
+    return response
+
+
+# -------- Upstream errors ---------- #
+
+def upstream_error_response(err: RequestException):
+    """
+    Builds the response to a failed upstream request. Errors without an upstream response (timeouts, connection
+    errors, open circuit breakers) are answered with 504, 502 and 503 respectively
+    """
+    headers = {}
+
+    if isinstance(err, custom_exceptions.UpstreamUnavailableError):
+        status_code = 503
+        headers["Retry-After"] = str(err.retry_after)
+    elif err.response is not None:
+        status_code = err.response.status_code
+    elif isinstance(err, Timeout):
+        status_code = 504
+    else:
+        status_code = 502
+
+    return (
+        jsonify(
+            sr.StandardAPIErrorMessage(
+                http_error_code=status_code, error_message=str(err)
+            ).to_dict()
+        ),
+        status_code,
+        headers,
+    )
+
 
 # -------- Existing routes ---------- #
 
@@ -38,14 +179,24 @@ def api_basic_information():
 
 
 @app.route("/v1/conversion/historical", methods=["GET"])
-@cache.cached(query_string=True)
+# Conversions of past dates never change. The latest ones are cached until the ECB publishes the next rates
+@http_caching.cache_control(max_age=http_caching.policy_max_age(ttl_policy.fx_request_ttl("date")))
+@stale_cache.cached_view(
+    cache,
+    validate=uf.validate_historical_endpoint_params,
+    make_cache_key=cache_keys.historical_cache_key,
+    timeout=ttl_policy.fx_params_ttl("date"),
+    invalid_errors=(custom_exceptions.BadRequestError,),
+)
 @swag_from("docs/conversion_historical.yml")
-def historical_conversion():
+def historical_conversion(params: dict | None = None):
     """Converts a given amount of one currency to another on a specific date"""
 
     try:
-        # Getting the URL parameters passed in the request to the historical endpoin pre-formatted and ready-to-use
-        params = uf.validate_historical_endpoint_params(request)
+        # Getting the URL parameters passed in the request to the historical endpoin pre-formatted and ready-to-use.
+        # They come already validated from the cache (stale_cache.cached_view), unless they are invalid
+        if params is None:
+            params = uf.validate_historical_endpoint_params(request)
     except custom_exceptions.BadRequestError as err:
         return (
             jsonify(
@@ -56,22 +207,9 @@ def historical_conversion():
             400,
         )
 
-    # Lets try to consume the FrankFurter API to get real-time information on the conversion from one currency to another
+    # Lets get the conversion from the local rate store, or from the FrankFurter API if the store does not have it yet
     try:
-        # Defining the URL parameters which will be used to send a request to FrankFurter API
-        url_params = {
-            "base": params["from_currency"],
-            "symbols": params["to_currencies"],
-            "amount": params["amount"],
-        }
-
-        #  Only the parameters different than None will be passed to the FrankFurter API request
-        response = uf.consume_frankfurter_api(
-            endpoint=f"/v1/{params['date']}",
-            params={
-                key: value for key, value in url_params.items() if value is not None
-            },
-        )
+        response = uf.get_historical_conversion(params)
 
         # replacing the "base" dict key with "from" in the response
         response["from"] = response.pop("base")
@@ -82,25 +220,33 @@ def historical_conversion():
         return (jsonify(sr.StandardAPISuccessfulResponse(data=response).to_dict()), 200)
 
     except RequestException as err:
-        return (
-            jsonify(
-                sr.StandardAPIErrorMessage(
-                    http_error_code=err.response.status_code, error_message=str(err)
-                ).to_dict()
-            ),
-            err.response.status_code,
-        )
+        return upstream_error_response(err)
 
 
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# The rates are cached one month at a time by useful_functions, so overlapping intervals share their cached
+# segments. The encoded (and compressed) response is cached as well, so a hit on a long interval is served
+# without converting or serializing anything again
 @app.route("/v1/conversion/interval", methods=["GET"])
-@cache.cached(query_string=True)
+@http_caching.cache_control(max_age=http_caching.policy_max_age(ttl_policy.fx_request_ttl("end_date")))
+@stale_cache.cached_view(
+    cache,
+    validate=uf.validate_interval_endpoint_params,
+    make_cache_key=cache_keys.interval_cache_key,
+    timeout=ttl_policy.fx_params_ttl("end_date"),
+    invalid_errors=(custom_exceptions.BadRequestError,),
+)
 @swag_from("docs/conversion_interval.yml")
-def date_interval_conversion():
+def date_interval_conversion(params: dict | None = None):
     """Converts a given amount of one currency to another within a given date range"""
 
     try:
-        # Getting the URL parameters passed in the request to the interval endpoin pre-formatted and ready-to-use
-        params = uf.validate_interval_endpoint_params(request)
+        # Getting the URL parameters passed in the request to the interval endpoin pre-formatted and ready-to-use.
+        # They come already validated from the cache (stale_cache.cached_view), unless they are invalid
+        if params is None:
+            params = uf.validate_interval_endpoint_params(request)
 
     except custom_exceptions.BadRequestError as err:
         return (
@@ -112,21 +258,18 @@ def date_interval_conversion():
             400,
         )
 
-    # Lets try to consume the FrankFurter API to get real-time information on the conversion from one currency to another
+    # Lets get the conversions from the local rate store. Only the dates it does not have yet are requested
+    # to the FrankFurter API
     try:
-        url_params = {
-            "base": params["from_currency"],
-            "symbols": params["to_currencies"],
-            "amount": params["amount"],
-        }
-
-        #  Only the parameters different than None will be passed to the FrankFurter API request
-        response = uf.consume_frankfurter_api(
-            endpoint=f"/v1/{params['start_date']}..{params['end_date']}",
-            params={
-                key: value for key, value in url_params.items() if value is not None
-            },
-        )
+        # NDJSON and CSV are streamed one line per date, as they are converted
+        if params["format"] != "json":
+            return Response(
+                stream_with_context(uf.stream_interval_conversion(params)),
+                status=200,
+                mimetype=STREAM_MIMETYPES[params["format"]],
+            )
+
+        response = uf.get_interval_conversion(params)
 
         # replacing the "base" dict key with "from" in the response
         response["from"] = response.pop("base")
@@ -137,17 +280,39 @@ def date_interval_conversion():
         return (jsonify(sr.StandardAPISuccessfulResponse(data=response).to_dict()), 200)
 
     except RequestException as err:
+        return upstream_error_response(err)
+
+
+@app.route("/v1/conversion/analytics", methods=["GET"])
+@http_caching.cache_control(max_age=http_caching.policy_max_age(ttl_policy.fx_request_ttl("end_date")))
+@swag_from("docs/conversion_analytics.yml")
+def interval_conversion_analytics():
+    """Returns statistics (returns, volatility, moving average, drawdown, min/max) of currency pairs over a date range"""
+
+    try:
+        # Getting the URL parameters passed in the request to the analytics endpoin pre-formatted and ready-to-use
+        params = uf.validate_analytics_endpoint_params(request)
+
+    except custom_exceptions.BadRequestError as err:
         return (
             jsonify(
                 sr.StandardAPIErrorMessage(
-                    http_error_code=err.response.status_code, error_message=str(err)
+                    http_error_code=400, error_message=str(err)
                 ).to_dict()
             ),
-            err.response.status_code,
+            400,
         )
 
+    # The statistics are computed from the same rates of the interval endpoint, and cached one by one
+    try:
+        return (jsonify(sr.StandardAPISuccessfulResponse(data=uf.get_fx_analytics(params)).to_dict()), 200)
+
+    except RequestException as err:
+        return upstream_error_response(err)
+
 
 @app.route("/v1/currencies", methods=["GET"])
+@http_caching.cache_control(max_age=configs.http_cache_static_max_age)
 @swag_from("docs/currencies.yml")
 def get_currencies():
     """This function returns all the currencies we are able to convert"""
@@ -162,16 +327,14 @@ def get_currencies():
 
 
 @app.route("/v1/b3stocks/all", methods=["GET"])
+# The list of traded stocks is refreshed every 3 hours during the trading session
+@http_caching.cache_control(max_age=http_caching.policy_max_age(uf.B3_TICKERS_TTL))
 @swag_from("docs/b3stocks_all.yml")
 def get_all_b3stocks():
     """This function returns the tickers of all stocks traded on B3 at the present time"""
     try:
-        return (
-            jsonify(
-                sr.StandardAPISuccessfulResponse(data=uf.get_b3_traded_stocks()).to_dict()
-            ),
-            200,
-        )
+        # The response body is encoded (and compressed) once, every time the list of tickers is refreshed
+        return response_encoding.variant_response(uf.get_b3_traded_stocks().all_tickers_variants)
 
     except custom_exceptions.MissingBrapiAPIKeyError as err:
         print(str(err))
@@ -185,21 +348,57 @@ def get_all_b3stocks():
             503,
         )
     except RequestException as err:
+        return upstream_error_response(err)
+
+
+@app.route("/v1/b3stocks/search", methods=["GET"])
+@http_caching.cache_control(max_age=http_caching.policy_max_age(uf.B3_TICKERS_TTL))
+@swag_from("docs/b3stocks_search.yml")
+def search_b3stocks():
+    """This function returns the B3 tickers matching a prefix, a ticker root and/or a share class suffix"""
+    try:
+        # Getting the URL parameters passed in the request to the search endpoin pre-formatted and ready-to-use
+        params = uf.validate_search_endpoint_params(request)
+
+    except custom_exceptions.BadRequestError as err:
+        return (
+            jsonify(
+                sr.StandardAPIErrorMessage(
+                    http_error_code=400, error_message=str(err)
+                ).to_dict()
+            ),
+            400,
+        )
+
+    try:
+        # Answered by the in-memory ticker index, without requests to brapi (except when the list is refreshed)
+        return (
+            jsonify(sr.StandardAPISuccessfulResponse(data=uf.search_b3_tickers(params)).to_dict()),
+            200,
+        )
+
+    except custom_exceptions.MissingBrapiAPIKeyError as err:
+        print(str(err))
         return (
             jsonify(
                 sr.StandardAPIErrorMessage(
-                    http_error_code=err.response.status_code, error_message=str(err)
+                    http_error_code=503,
+                    error_message="This endpoint is unavailable at the moment. Please try again later.",
                 ).to_dict()
             ),
-            err.response.status_code,
+            503,
         )
+    except RequestException as err:
+        return upstream_error_response(err)
 
 
-@app.route("/v1/b3stocks/quote", methods=["GET"])
-@cache.cached(timeout=900, query_string=True)  # caching the quote results for 15 mintues. This is not a DayTrade API
+# The quote results are cached per ticker for 15 mintues during the trading session by useful_functions. This is
+# not a DayTrade API
+@app.route("/v1/b3stocks/quote", methods=["GET", "POST"])
+@http_caching.cache_control(max_age=http_caching.policy_max_age(uf.B3_QUOTE_TTL))
 @swag_from("docs/b3stocks_quote.yml")
 def get_b3stocks_quotes():
-    """This funtion returns the quote of a given B3 stock"""
+    """This funtion returns the quotes of one or more B3 stocks"""
     try:
         # Getting the URL parameters passed in the request to the quote endpoin pre-formatted and ready-to-use
         params = uf.validate_quotes_endpoint_params(request)
@@ -226,23 +425,11 @@ def get_b3stocks_quotes():
         )
 
     try:
-        url_params = {
-            "range": params["analysis_time_range"],
-            "interval": params["interval_between_quotations"],
-            "fundamental": params["fundamental_data"],
-            "dividends": params["dividends"],
-        }
-        response = uf.consume_brapi_api(
-            endpoint=f"quote/{params['ticker']}",
-            params={
-                key: value for key, value in url_params.items() if value is not None
-            },
-        )
+        # Only the tickers whose quotes are not cached yet are requested to brapi
+        results = uf.get_b3_quotes(params)
 
         return (
-            jsonify(
-                sr.StandardAPISuccessfulResponse(data=response["results"]).to_dict()
-            ),
+            jsonify(sr.StandardAPISuccessfulResponse(data=results).to_dict()),
             200,
         )
 
@@ -258,18 +445,12 @@ def get_b3stocks_quotes():
             503,
         )
     except RequestException as err:
-        return (
-            jsonify(
-                sr.StandardAPIErrorMessage(
-                    http_error_code=err.response.status_code, error_message=str(err)
-                ).to_dict()
-            ),
-            err.response.status_code,
-        )
+        return upstream_error_response(err)
 
 
+# Not cached per request: every combination of parameters is answered from the same local snapshot of the stocks
 @app.route("/v1/b3stocks/stocksinfo", methods=["GET"])
-@cache.cached(timeout=900, query_string=True)
+@http_caching.cache_control(max_age=http_caching.policy_max_age(uf.B3_STOCKS_TTL))
 @swag_from("docs/b3stocks_stocksinfo.yml")
 def get_b3stocks_information():
     """This function returns information about stocks traded on b3"""
@@ -288,34 +469,8 @@ def get_b3stocks_information():
         )
 
     try:
-        url_params = {
-            "sector": params["sector"],
-            "sortBy": params["sortedBy"],
-            "sortOrder": params["order"],
-            "limit": params["limit"],
-            "page": params["page"],
-            "type": "stock",
-        }
-
-        # Only the URL parameters different than None will be passed to the brapi API request
-        response = uf.consume_brapi_api(
-            endpoint="/quote/list",
-            params={
-                key: value for key, value in url_params.items() if value is not None
-            },
-        )
-
-        # -- adding additional informations in the response to guide the user in next requests -- #
-        response.pop("availableStockTypes")
-        response["sortByOptions"] = [
-            "name",
-            "close",
-            "change",
-            "change_abs",
-            "volume",
-            "market_cap_basic",
-            "sector"
-        ]
+        # Filtered, sorted and paginated locally, from a snapshot of every B3 stock refreshed every 15 minutes
+        response = uf.get_b3_stocks_information(params)
 
         return (jsonify(sr.StandardAPISuccessfulResponse(data=response).to_dict()), 200)
 
@@ -335,14 +490,27 @@ def get_b3stocks_information():
         )
 
     except RequestException as err:
-        return (
-            jsonify(
-                sr.StandardAPIErrorMessage(
-                    http_error_code=err.response.status_code, error_message=str(err)
-                ).to_dict()
-            ),
-            err.response.status_code,
-        )
+        return upstream_error_response(err)
+
+
+@app.route("/v1/status/upstreams", methods=["GET"])
+@swag_from("docs/status_upstreams.yml")
+def get_upstreams_status():
+    """This function returns the state of the circuit breaker of each upstream API, for monitoring"""
+    return (
+        jsonify(
+            sr.StandardAPISuccessfulResponse(data=upstream_policy.get_breaker_states()).to_dict()
+        ),
+        200,
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+@swag_from("docs/metrics.yml")
+def get_metrics():
+    """This function returns the metrics of the API in the Prometheus text format"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 # -------- Handling errors ---------- #
 
@@ -375,7 +543,12 @@ def internal_server_error_handler(err):
 
 
 if __name__ == "__main__":
+    # Prefetches the most requested keys a few seconds after the start, and then on a schedule. With the reloader of
+    # the debug mode, only in the process that serves the requests
+    if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        cache_warming.start_scheduler(app)
     app.run(port=5000, host="localhost", debug=True)
 
-# Use waitress to serve you API on production
+# Use waitress to serve you API on production (start the cache warming first)
+# cache_warming.start_scheduler(app)
 # serve(app, host='localhost', port=8080)
@@ -0,0 +1,269 @@
+"""
+In-process metrics registry, exposed by the /metrics endpoint in the Prometheus text format.
+
+Recording a value is a dict lookup and an addition under a lock, so instruments can be placed on hot paths
+(every request, every upstream call, every cache lookup). Values that already live elsewhere (circuit breaker
+states, single-flight counters, cachetools statistics) are read from their sources (Metric.add_source) only when /metrics
+is scraped.
+
+    REQUEST_DURATION, REQUESTS_IN_FLIGHT      -> per route (recorded by main.py)
+    UPSTREAM_DURATION, UPSTREAM_IN_FLIGHT,
+    UPSTREAM_ERRORS                           -> per upstream API (recorded by observe_upstream_request)
+    CACHE_REQUESTS, CACHE_EVICTIONS           -> per cache
+    CIRCUIT_BREAKER_*, SINGLE_FLIGHT_CALLS    -> per upstream API (read from upstream_policy and single_flight)
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+import custom_exceptions
+
+# Latency buckets (seconds), from a cache hit to an upstream timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._sources = []
+
+    def add_source(self, source) -> None:
+        """
+        Adds a function called on every scrape that returns {labelvalues: value} for values kept outside of this
+        registry (the circuit breakers, the single-flight counters, ...). They are reported with the recorded ones
+        """
+        self._sources.append(source)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            values = list(self._values.items())
+        for source in self._sources:
+            values.extend(source().items())
+        for labelvalues, value in sorted(values):
+            lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+    def _render_sample(self, labelvalues: tuple, value) -> list[str]:
+        return [f"{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # Index of the first bucket the value fits in. The last position is the +Inf bucket
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][position] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_sample(self, labelvalues: tuple, value) -> list[str]:
+        bucket_counts, total, count = value
+        lines, cumulative = [], 0
+        for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+            cumulative += bucket_count
+            labels = format_labels(self.labelnames, labelvalues, f'le="{format_value(upper_bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(
+    Histogram("financeapi_request_duration_seconds", "Time to answer a request.", ("route", "method", "status"))
+)
+REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge("financeapi_requests_in_flight", "Requests being answered.", ("route",))
+)
+UPSTREAM_DURATION = REGISTRY.register(
+    Histogram(
+        "financeapi_upstream_request_duration_seconds", "Time of the requests to an upstream API.", ("upstream",)
+    )
+)
+UPSTREAM_IN_FLIGHT = REGISTRY.register(
+    Gauge(
+        "financeapi_upstream_requests_in_flight",
+        "Requests to an upstream API waiting for a response.",
+        ("upstream",),
+    )
+)
+UPSTREAM_ERRORS = REGISTRY.register(
+    Counter(
+        "financeapi_upstream_errors_total",
+        "Failed requests to an upstream API, by HTTP status or error kind (timeout, connection).",
+        ("upstream", "status"),
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter("financeapi_cache_requests_total", "Cache lookups, by result (hit, stale, miss).", ("cache", "result"))
+)
+CACHE_EVICTIONS = REGISTRY.register(
+    Counter(
+        "financeapi_cache_evictions_total",
+        "Entries removed from an in-process cache, by reason (capacity, expired).",
+        ("cache", "reason"),
+    )
+)
+CIRCUIT_BREAKER_STATE = REGISTRY.register(
+    Gauge(
+        "financeapi_circuit_breaker_state",
+        "State of the circuit breaker of an upstream API (1 for the current state).",
+        ("upstream", "state"),
+    )
+)
+CIRCUIT_BREAKER_REJECTED = REGISTRY.register(
+    Counter(
+        "financeapi_circuit_breaker_rejected_total",
+        "Requests to an upstream API refused by its open circuit breaker.",
+        ("upstream",),
+    )
+)
+CIRCUIT_BREAKER_OPENED = REGISTRY.register(
+    Counter(
+        "financeapi_circuit_breaker_opened_total",
+        "Times the circuit breaker of an upstream API opened.",
+        ("upstream",),
+    )
+)
+SINGLE_FLIGHT_CALLS = REGISTRY.register(
+    Counter(
+        "financeapi_single_flight_calls_total",
+        "Upstream calls by single-flight outcome (leader, coalesced, error).",
+        ("upstream", "outcome"),
+    )
+)
+
+# name -> function decorated with cachetools' cached(..., info=True), whose hits and misses are reported
+_cached_functions = {}
+
+
+def track_cached_function(name: str, function) -> None:
+    """Reports the hits and misses of a function cached with cachetools' cached(..., info=True)"""
+    _cached_functions[name] = function
+
+
+def _cached_function_lookups() -> dict:
+    lookups = {}
+    for name, function in list(_cached_functions.items()):
+        info = function.cache_info()
+        lookups[(name, "hit")] = info.hits
+        lookups[(name, "miss")] = info.misses
+    return lookups
+
+
+CACHE_REQUESTS.add_source(_cached_function_lookups)
+
+
+def upstream_error_status(err: BaseException) -> str:
+    """Label of an upstream error: the HTTP status code, or the kind of error when there is no response"""
+    if isinstance(err, custom_exceptions.InvalidBrapiAPIKeyError):
+        return "401"
+    if isinstance(err, requests.HTTPError) and err.response is not None:
+        return str(err.response.status_code)
+    if isinstance(err, requests.Timeout):
+        return "timeout"
+    if isinstance(err, requests.ConnectionError):
+        return "connection"
+    return "other"
+
+
+@contextmanager
+def observe_upstream_request(upstream: str):
+    """Measures a request to an upstream API and counts it as an error if it raises"""
+    UPSTREAM_IN_FLIGHT.inc(upstream=upstream)
+    started_at = time.perf_counter()
+    try:
+        yield
+    except Exception as err:
+        UPSTREAM_ERRORS.inc(upstream=upstream, status=upstream_error_status(err))
+        raise
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - started_at, upstream=upstream)
+        UPSTREAM_IN_FLIGHT.dec(upstream=upstream)
+
+
+def record_cache_lookup(cache: str, result: str) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+
+
+def render() -> str:
+    return REGISTRY.render()
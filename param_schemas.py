@@ -0,0 +1,229 @@
+"""
+Declarative schemas of the endpoint parameters, compiled once into validators.
+
+Each endpoint declares its parameters once (ParamSchema and Param, see useful_functions), and the declaration is
+used to:
+
+    validate -> ParamSchema.parse() checks and converts every parameter in a single pass. The accepted values
+                are frozen into sets and the checks of each parameter are compiled into one function when the
+                schema is built, and dates are parsed once and their normalized form is cached
+    document -> ParamSchema.to_swagger() returns the 'parameters' section of the endpoint docs. The docs/*.yml
+                files are updated from it with 'python api_docs.py --update-parameters'
+
+Invalid values raise custom_exceptions.BadRequestError with the message of the parameter.
+"""
+
+import functools
+from datetime import datetime
+
+import custom_exceptions
+
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y")
+
+# Schemas with a docs file, updated by 'python api_docs.py --update-parameters'
+SCHEMAS = []
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_date(str_date: str) -> str | None:
+    """Converts a date in the %Y-%m-%d or %d-%m-%Y format to %Y-%m-%d. Returns None if it is not a real date"""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str_date, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def get_today() -> str:
+    return datetime.now().date().isoformat()
+
+
+class Param:
+    """
+    A parameter of an endpoint.
+
+        kind     -> 'string', 'integer', 'boolean' (the string 'true' or 'false'), 'date' (converted to %Y-%m-%d)
+                    or 'list' (comma-separated, or a list in a JSON body. Repeated items are kept once)
+        key      -> name of the parameter in the parsed dict (the name of the parameter by default)
+        default  -> value (or function returning the value) used when the parameter is missing or empty
+        choices  -> accepted values (of each item, in a list). With strict=False they are only documented
+        required -> whether a missing or empty parameter (or an empty list) is refused with 'missing_error'
+        parser   -> function converting the value, for parameters with a syntax of their own
+        error    -> message of an invalid value. Formatted with {name}, {value}, {options}, {minimum}, {maximum}
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = "string",
+        description: str = "",
+        key: str | None = None,
+        default=None,
+        required: bool = False,
+        choices=None,
+        strict: bool = True,
+        minimum: int | None = None,
+        maximum: int | None = None,
+        aliases: tuple = (),
+        parser=None,
+        error: str | None = None,
+        range_error: str | None = None,
+        missing_error: str | None = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.key = key or name
+        self.default = default
+        self.required = required
+        self.choices = tuple(choices) if choices is not None else None
+        self.strict = strict
+        self.minimum = minimum
+        self.maximum = maximum
+        self.names = (name,) + tuple(aliases)
+        self.parser = parser
+        self.error = error or self.get_default_error()
+        self.range_error = range_error or self.get_default_range_error()
+        self.missing_error = missing_error or "The '{name}' parameter must be specified"
+
+    def get_default_error(self) -> str:
+        if self.kind == "integer":
+            return "The '{name}' parameter must be a number"
+        if self.kind == "boolean":
+            return "The '{name}' parameter only accepts 'true' or 'false' as a value"
+        if self.kind == "date":
+            return "The following date does not exist: {value}"
+        return "The '{name}' parameter only accepts the following options: {options}"
+
+    def get_default_range_error(self) -> str:
+        if self.maximum is None:
+            return "The '{name}' parameter must be a number greater than or equal to {minimum}"
+        return "The '{name}' parameter must be a number between {minimum} and {maximum}"
+
+    def format_error(self, message: str, value) -> custom_exceptions.BadRequestError:
+        return custom_exceptions.BadRequestError(
+            message.format(
+                name=self.name,
+                value=value,
+                options=" | ".join(self.choices or ()),
+                minimum=self.minimum,
+                maximum=self.maximum,
+            )
+        )
+
+    def compile(self):
+        """Returns the function that validates and converts a value of this parameter"""
+        if self.parser is not None:
+            return self.parser
+
+        accepted = frozenset(self.choices) if self.choices is not None and self.strict else None
+
+        if self.kind == "integer":
+            minimum = self.minimum if self.minimum is not None else float("-inf")
+            maximum = self.maximum if self.maximum is not None else float("inf")
+
+            def convert(value):
+                try:
+                    number = int(value)
+                except (TypeError, ValueError):
+                    raise self.format_error(self.error, value) from None
+                if not minimum <= number <= maximum:
+                    raise self.format_error(self.range_error, value)
+                return number
+
+        elif self.kind == "date":
+
+            def convert(value):
+                date = normalize_date(value) if isinstance(value, str) else None
+                if date is None:
+                    raise self.format_error(self.error, value)
+                return date
+
+        elif self.kind == "list":
+
+            def convert(value):
+                items = value.split(",") if isinstance(value, str) else [str(item) for item in value]
+                if accepted is not None:
+                    for item in items:
+                        if item not in accepted:
+                            raise self.format_error(self.error, item)
+                return list(dict.fromkeys(items))
+
+        else:
+            if self.kind == "boolean":
+                accepted = frozenset(("true", "false"))
+
+            def convert(value):
+                if accepted is not None and value not in accepted:
+                    raise self.format_error(self.error, value)
+                return value
+
+        return convert
+
+    def to_swagger(self) -> dict:
+        """The Swagger (OpenAPI 2.0) description of the parameter, as a query parameter"""
+        description = {"name": self.name, "in": "query", "required": self.required}
+
+        if self.kind == "list":
+            description["type"] = "array"
+            description["collectionFormat"] = "csv"
+            description["items"] = {"type": "string"}
+            if self.choices is not None:
+                description["items"]["enum"] = list(self.choices)
+        else:
+            description["type"] = {"integer": "integer", "boolean": "boolean"}.get(self.kind, "string")
+            if self.kind == "date":
+                description["format"] = "date"
+            if self.choices is not None:
+                description["enum"] = list(self.choices)
+            if self.minimum is not None:
+                description["minimum"] = self.minimum
+            if self.maximum is not None:
+                description["maximum"] = self.maximum
+
+        # Defaults computed on every request (ex: the current date) are explained in the description instead
+        if self.default is not None and not callable(self.default):
+            description["default"] = self.default
+        if self.description:
+            description["description"] = self.description
+        return description
+
+
+class ParamSchema:
+    """The parameters of an endpoint, validated in the order they are declared"""
+
+    def __init__(self, params: list[Param], docs_file: str | None = None):
+        self.params = params
+        self.docs_file = docs_file
+        # (key, names, default, convert, param if it is required) of each parameter, so parse() does no attribute
+        # lookups
+        self._compiled = [
+            (param.key, param.names, param.default, param.compile(), param if param.required else None)
+            for param in params
+        ]
+
+        if docs_file is not None:
+            SCHEMAS.append(self)
+
+    def parse(self, values) -> dict:
+        """
+        Validates and converts the parameters found in 'values' (the request args, or the args merged with a
+        JSON body) and returns them by key. Missing parameters without a default are None
+        """
+        parsed = {}
+        for key, names, default, convert, required in self._compiled:
+            value = None
+            for name in names:
+                value = values.get(name)
+                if value:
+                    break
+            if not value:
+                value = default() if callable(default) else default
+            parsed[key] = convert(value) if value is not None else None
+            if required is not None and not parsed[key]:
+                raise required.format_error(required.missing_error, value)
+        return parsed
+
+    def to_swagger(self) -> list[dict]:
+        return [param.to_swagger() for param in self.params]
@@ -0,0 +1,220 @@
+"""
+Resampling and technical indicators of the B3 quote history.
+
+The daily history returned by brapi (the 'historicalDataPrice' of a quote) is cached once per ticker, and every
+coarser view is derived from it here, without new requests to brapi:
+
+    trim_history    -> keeps the bars of the requested range (5d, 1mo, 1y, ytd, ...)
+    resample_bars   -> groups the daily bars into 5-day, weekly, monthly or quarterly OHLCV bars
+    compute_indicators -> SMA, EMA, RSI, returns and volatility of the closing prices, one value per bar
+
+The bars are handled as NumPy columns, and the groups are reduced at once with ufunc.reduceat.
+"""
+
+import math
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Intervals of the quote endpoint that can be derived from the daily history
+RESAMPLE_INTERVALS = ("1d", "5d", "1wk", "1mo", "3mo")
+
+# Bars per year of each interval, used to annualize the volatility
+BARS_PER_YEAR = {"1d": 252, "5d": 252 / 5, "1wk": 52, "1mo": 12, "3mo": 4}
+
+# Ranges of the quote endpoint, from the shortest to the longest
+RANGES = ("1d", "5d", "1mo", "3mo", "6mo", "ytd", "1y", "2y", "5y", "10y", "max")
+
+# Indicator -> smallest period it accepts (ex: sma:200), or None if it takes no period. The volatility is a sample
+# standard deviation, which needs at least two returns
+INDICATORS = {"sma": 1, "ema": 1, "rsi": 1, "returns": None, "volatility": 2}
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "adjustedClose")
+
+
+def covering_history_range(requested_range: str, history_ranges) -> str:
+    """
+    Returns the shortest of 'history_ranges' (the ranges of daily history we keep per ticker) that includes every
+    bar of 'requested_range'
+    """
+    # ytd is at most one year long
+    requested_position = RANGES.index("1y" if requested_range == "ytd" else requested_range)
+    for history_range in history_ranges:
+        if RANGES.index(history_range) >= requested_position:
+            return history_range
+    return "max"
+
+
+def bars_to_columns(bars: list[dict]) -> dict:
+    """Converts brapi's list of bars into one array per field. Missing values become NaN"""
+    columns = {"date": np.array([int(bar.get("date") or 0) for bar in bars], dtype=np.int64)}
+    for field in BAR_FIELDS:
+        columns[field] = np.array(
+            [bar.get(field) if bar.get(field) is not None else math.nan for bar in bars], dtype=np.float64
+        )
+    return columns
+
+
+def columns_to_bars(columns: dict) -> list[dict]:
+    """Converts the arrays back into brapi's list of bars"""
+    fields = [(field, columns[field].tolist()) for field in BAR_FIELDS]
+    bars = [
+        {"date": timestamp, **{field: (values[i] if values[i] == values[i] else None) for field, values in fields}}
+        for i, timestamp in enumerate(columns["date"].tolist())
+    ]
+    for bar in bars:
+        if bar["volume"] is not None:
+            bar["volume"] = int(bar["volume"])
+    return bars
+
+
+def months_before(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(month_index, 12)
+    # The day is clipped to the end of shorter months (ex: March 31 -> February 28)
+    next_month = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+    return date(year, month + 1, min(day.day, (next_month - timedelta(days=1)).day))
+
+
+def trim_history(columns: dict, requested_range: str) -> dict:
+    """Keeps the bars of the daily history that belong to 'requested_range', counted back from the last bar"""
+    if requested_range == "max" or columns["date"].size == 0:
+        return columns
+
+    # The shortest ranges are counted in trading sessions, like brapi does
+    if requested_range in ("1d", "5d"):
+        start_index = max(0, columns["date"].size - int(requested_range[0]))
+        return {field: values[start_index:] for field, values in columns.items()}
+
+    last_day = datetime.fromtimestamp(int(columns["date"][-1]), timezone.utc).date()
+    if requested_range == "ytd":
+        first_day = date(last_day.year, 1, 1)
+    elif requested_range.endswith("mo"):
+        first_day = months_before(last_day, int(requested_range[:-2]))
+    else:
+        first_day = months_before(last_day, 12 * int(requested_range[:-1]))
+
+    first_timestamp = datetime(first_day.year, first_day.month, first_day.day, tzinfo=timezone.utc).timestamp()
+    start_index = int(np.searchsorted(columns["date"], first_timestamp))
+    return {field: values[start_index:] for field, values in columns.items()}
+
+
+def period_ids(timestamps: np.ndarray, interval: str) -> np.ndarray:
+    """Returns the id of the bar of each daily timestamp. Consecutive days with the same id form one bar"""
+    if interval == "5d":
+        return np.arange(timestamps.size) // 5
+
+    days = timestamps.astype("datetime64[s]").astype("datetime64[D]")
+    if interval == "1wk":
+        # 1970-01-01 was a Thursday. Shifting by 3 days makes the weeks start on Monday
+        return (days.astype(np.int64) + 3) // 7
+
+    months = days.astype("datetime64[M]").astype(np.int64)
+    return months // 3 if interval == "3mo" else months
+
+
+def resample_bars(columns: dict, interval: str) -> dict:
+    """Groups daily bars into bars of 'interval' (open of the first day, close of the last one, ...)"""
+    if interval == "1d" or columns["date"].size == 0:
+        return columns
+
+    ids = period_ids(columns["date"], interval)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], ids.size] - 1
+
+    return {
+        "date": columns["date"][starts],
+        "open": columns["open"][starts],
+        # fmax/fmin skip the days without a value
+        "high": np.fmax.reduceat(columns["high"], starts),
+        "low": np.fmin.reduceat(columns["low"], starts),
+        "close": columns["close"][ends],
+        "volume": np.add.reduceat(np.nan_to_num(columns["volume"]), starts),
+        "adjustedClose": columns["adjustedClose"][ends],
+    }
+
+
+def simple_moving_average(closes: np.ndarray, period: int) -> np.ndarray:
+    result = np.full(closes.size, np.nan)
+    if closes.size >= period:
+        result[period - 1 :] = sliding_window_view(closes, period).mean(axis=-1)
+    return result
+
+
+def exponential_smoothing(values: np.ndarray, alpha: float, first: int) -> np.ndarray:
+    """
+    Exponentially smooths 'values' from position 'first' on, seeded with the mean of the values before it. This
+    recursion is the only step that is not vectorized, and it only runs once per bar
+    """
+    result = np.full(values.size, np.nan)
+    if values.size < first or first < 1:
+        return result
+
+    current = values[:first].mean()
+    result[first - 1] = current
+    smoothed = result.tolist()
+    for i, value in enumerate(values[first:].tolist(), start=first):
+        current = alpha * value + (1 - alpha) * current
+        smoothed[i] = current
+
+    return np.array(smoothed)
+
+
+def exponential_moving_average(closes: np.ndarray, period: int) -> np.ndarray:
+    return exponential_smoothing(closes, 2 / (period + 1), period)
+
+
+def relative_strength_index(closes: np.ndarray, period: int) -> np.ndarray:
+    """Wilder's RSI: 100 - 100 / (1 + average gain / average loss)"""
+    changes = np.diff(closes)
+    gains = exponential_smoothing(np.clip(changes, 0, None), 1 / period, period)
+    losses = exponential_smoothing(np.clip(-changes, 0, None), 1 / period, period)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(losses == 0, 100.0, 100 - 100 / (1 + gains / losses))
+    rsi[np.isnan(gains)] = np.nan
+
+    # There is no change before the first bar (and no bar at all in an empty history)
+    return np.r_[np.nan, rsi][: closes.size]
+
+
+def bar_returns(closes: np.ndarray) -> np.ndarray:
+    return np.r_[np.nan, closes[1:] / closes[:-1] - 1][: closes.size]
+
+
+def rolling_volatility(closes: np.ndarray, period: int, bars_per_year: float) -> np.ndarray:
+    """Annualized standard deviation of the log returns of the last 'period' bars"""
+    log_returns = np.diff(np.log(closes))
+    result = np.full(closes.size, np.nan)
+    if log_returns.size >= period:
+        result[period:] = sliding_window_view(log_returns, period).std(axis=-1, ddof=1) * math.sqrt(bars_per_year)
+    return result
+
+
+def compute_indicators(columns: dict, indicators: list[tuple[str, int | None]], interval: str) -> dict:
+    """
+    Computes each (name, period) indicator over the closing prices of the bars. Every indicator has one value
+    per bar ('sma_200': [...]), None where it is not defined yet
+    """
+    closes = columns["close"]
+    results = {}
+
+    for name, period in indicators:
+        if name == "sma":
+            values = simple_moving_average(closes, period)
+        elif name == "ema":
+            values = exponential_moving_average(closes, period)
+        elif name == "rsi":
+            values = relative_strength_index(closes, period)
+        elif name == "returns":
+            values = bar_returns(closes)
+        else:
+            values = rolling_volatility(closes, period, BARS_PER_YEAR[interval])
+
+        key = f"{name}_{period}" if period is not None else name
+        results[key] = [
+            float(f"{value:.6g}") if value == value and not math.isinf(value) else None for value in values.tolist()
+        ]
+
+    return results
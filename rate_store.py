@@ -0,0 +1,295 @@
+"""
+Local, memory-mapped columnar store of the ECB reference rates published through the FrankFurter API.
+
+The store keeps one float64 column per currency returned by get_existing_currencies(), indexed by business
+day. Every value is EUR-based (units of the currency bought by 1 EUR), so any from/to pair can be derived
+from a single row. Rates for a past business day never change, which lets the conversion endpoints answer
+from disk instead of sending a request to the FrankFurter API.
+
+Files kept in the store directory:
+    rates.npy  -> float64 matrix (business days x currencies) saved in column-major order
+    dates.npy  -> int32 vector with the ordinal (date.toordinal()) of every row of rates.npy
+    meta.json  -> currency column order, last date covered by the store and the last sync timestamp
+
+Usage:
+    python rate_store.py backfill [--start 1999-01-04]
+    python rate_store.py sync
+"""
+
+import argparse
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+import configurations as configs
+
+RATES_FILE_NAME = "rates.npy"
+DATES_FILE_NAME = "dates.npy"
+META_FILE_NAME = "meta.json"
+
+# The FrankFurter API is queried one year at a time while backfilling, so each response stays small
+BACKFILL_CHUNK_IN_DAYS = 366
+
+
+class FXRateStore:
+    """Read/write access to the memory-mapped ECB rate history kept in a local directory"""
+
+    def __init__(self, directory: Path, currencies: list[str]):
+        self.directory = Path(directory)
+        self.currencies = list(currencies)
+        self.currency_index = {currency: i for i, currency in enumerate(self.currencies)}
+
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        # (dates, rates, covered_through) swapped as a whole, so a reader never mixes two versions of the store
+        self._snapshot = (None, None, None)
+
+    # -------- Reading ---------- #
+
+    def _refresh(self) -> None:
+        """(Re)opens the memory-mapped files whenever another process has synced the store"""
+        meta_path = self.directory / META_FILE_NAME
+        try:
+            meta_mtime = meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        if meta_mtime == self._meta_mtime:
+            return
+
+        with self._lock:
+            if meta_mtime == self._meta_mtime:
+                return
+
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+
+            # A store built with another currency list can not be read column by column. It stays unusable (the
+            # rates are requested to the FrankFurter API) until meta.json changes, without parsing it on every read
+            if meta["currencies"] != self.currencies:
+                self._snapshot = (None, None, None)
+                self._meta_mtime = meta_mtime
+                return
+
+            rates = np.load(self.directory / RATES_FILE_NAME, mmap_mode="r")
+            dates = np.load(self.directory / DATES_FILE_NAME, mmap_mode="r")
+
+            # meta.json is the last file written by a sync. If the data files are not the ones it describes
+            # yet, keep the previous view of the store and try again on the next read
+            if len(dates) != meta["rows"] or rates.shape[0] != meta["rows"]:
+                return
+
+            self._snapshot = (dates, rates, date.fromisoformat(meta["covered_through"]))
+            self._meta_mtime = meta_mtime
+
+    def _get_snapshot(self) -> tuple:
+        self._refresh()
+        return self._snapshot
+
+    @property
+    def first_date(self) -> date | None:
+        dates, _, _ = self._get_snapshot()
+        if dates is None or len(dates) == 0:
+            return None
+        return date.fromordinal(int(dates[0]))
+
+    @property
+    def covered_through(self) -> date | None:
+        """Last calendar day for which the store holds the definitive ECB rates"""
+        _, _, covered_through = self._get_snapshot()
+        return covered_through
+
+    @staticmethod
+    def _snapshot_covers(snapshot: tuple, start: date, end: date) -> bool:
+        dates, _, covered_through = snapshot
+        if dates is None or len(dates) == 0:
+            return False
+        return dates[0] <= start.toordinal() and end <= covered_through
+
+    def covers(self, start: date, end: date | None = None) -> bool:
+        """Checks if every day between 'start' and 'end' can be answered from the store"""
+        return self._snapshot_covers(self._get_snapshot(), start, end or start)
+
+    def get_rate_vector(self, day: date) -> tuple[date, np.ndarray] | None:
+        """
+        Returns the EUR-based rates in force on the given day (the last business day on or before it),
+        together with the date those rates were published. None is returned if the store does not cover the day.
+        """
+        snapshot = self._get_snapshot()
+        if not self._snapshot_covers(snapshot, day, day):
+            return None
+
+        dates, rates, _ = snapshot
+        row = int(np.searchsorted(dates, day.toordinal(), side="right")) - 1
+        return date.fromordinal(int(dates[row])), rates[row]
+
+    def get_rate_table(self, start: date, end: date) -> tuple[list[date], np.ndarray] | None:
+        """
+        Returns the business days and EUR-based rates between 'start' and 'end'. Just like the FrankFurter API,
+        the business day right before 'start' is used as the first row when 'start' itself has no rates.
+        None is returned if the store does not cover the whole interval.
+        """
+        snapshot = self._get_snapshot()
+        if not self._snapshot_covers(snapshot, start, end):
+            return None
+
+        dates, rates, _ = snapshot
+        first_row = max(int(np.searchsorted(dates, start.toordinal(), side="right")) - 1, 0)
+        last_row = int(np.searchsorted(dates, end.toordinal(), side="right"))
+
+        days = [date.fromordinal(int(ordinal)) for ordinal in dates[first_row:last_row]]
+        return days, rates[first_row:last_row]
+
+    # -------- Writing ---------- #
+
+    def append(self, rates_by_date: dict, covered_through: date, replace: bool = False) -> int:
+        """
+        Adds the EUR-based rates received from the FrankFurter API ({"YYYY-MM-DD": {"BRL": 6.1, ...}})
+        to the store and returns the number of new business days. With 'replace' the current content of
+        the store is discarded. The files are replaced atomically, so readers in other processes never
+        see a half-written store.
+        """
+        current_dates, current_rates, current_covered_through = self._get_snapshot()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        keep_current = not replace and current_dates is not None
+        last_ordinal = int(current_dates[-1]) if keep_current and len(current_dates) else 0
+        new_days = sorted(
+            day for day in (date.fromisoformat(d) for d in rates_by_date) if day.toordinal() > last_ordinal
+        )
+
+        new_rates = np.full((len(new_days), len(self.currencies)), np.nan, dtype=np.float64)
+        for row, day in enumerate(new_days):
+            day_rates = rates_by_date[day.isoformat()]
+            for currency, rate in day_rates.items():
+                column = self.currency_index.get(currency)
+                if column is not None:
+                    new_rates[row, column] = rate
+            new_rates[row, self.currency_index["EUR"]] = 1.0
+
+        new_dates = np.array([day.toordinal() for day in new_days], dtype=np.int32)
+
+        if keep_current:
+            new_rates = np.concatenate([np.asarray(current_rates), new_rates])
+            new_dates = np.concatenate([np.asarray(current_dates), new_dates])
+
+        if keep_current and current_covered_through is not None:
+            covered_through = max(covered_through, current_covered_through)
+
+        self._atomic_save(RATES_FILE_NAME, np.asfortranarray(new_rates))
+        self._atomic_save(DATES_FILE_NAME, new_dates)
+
+        meta = {
+            "currencies": self.currencies,
+            "rows": len(new_dates),
+            "covered_through": covered_through.isoformat(),
+            "synced_at": datetime.now(timezone.utc).isoformat(),
+        }
+        meta_tmp_path = self.directory / f".{META_FILE_NAME}.{os.getpid()}.tmp"
+        meta_tmp_path.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(meta_tmp_path, self.directory / META_FILE_NAME)
+
+        return len(new_days)
+
+    def _atomic_save(self, file_name: str, array: np.ndarray) -> None:
+        tmp_path = self.directory / f".{file_name}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, array)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.directory / file_name)
+
+
+# -------- Filling the store from the FrankFurter API ---------- #
+
+def fetch_eur_rates(start: date, end: date, consume_api) -> dict:
+    """Requests the EUR-based rates of every business day between 'start' and 'end' to the FrankFurter API"""
+    rates_by_date = {}
+    chunk_start = start
+
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=BACKFILL_CHUNK_IN_DAYS - 1), end)
+        response = consume_api(
+            endpoint=f"/v1/{chunk_start.isoformat()}..{chunk_end.isoformat()}",
+            params={"base": "EUR"},
+        )
+        rates_by_date.update(response["rates"])
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return rates_by_date
+
+
+def sync(store: FXRateStore, consume_api, start: date | None = None) -> int:
+    """
+    Brings the store up to date with the FrankFurter API and returns the number of new business days.
+    When 'start' is given (or the store is empty) the store is rebuilt from that date, which defaults to
+    the beginning of the ECB history.
+    """
+    today = datetime.now(timezone.utc).date()
+    rebuild = start is not None or store.covered_through is None
+
+    if rebuild:
+        start = start or date.fromisoformat(configs.rate_store_history_start)
+    else:
+        start = store.covered_through + timedelta(days=1)
+
+    if start > today:
+        return 0
+
+    rates_by_date = fetch_eur_rates(start, today, consume_api)
+
+    # Today's rates are only published by the ECB in the afternoon (CET). Until they are, the store can
+    # only vouch for the days before today
+    covered_through = today if today.isoformat() in rates_by_date else today - timedelta(days=1)
+
+    return store.append(rates_by_date, covered_through, replace=rebuild)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_rate_store(currencies: list[str]) -> FXRateStore:
+    """Returns the process-wide store instance, opening it on first use"""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                directory = os.environ.get("RATE_STORE_DIR") or configs.rate_store_directory
+                _store = FXRateStore(Path(directory), currencies)
+
+    return _store
+
+
+def main() -> None:
+    # Imported here because useful_functions itself reads from the store
+    import useful_functions as uf
+
+    parser = argparse.ArgumentParser(description="Maintains the local historical FX rate store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Downloads the full ECB rate history")
+    backfill_parser.add_argument(
+        "--start",
+        default=configs.rate_store_history_start,
+        help="First date to download (YYYY-MM-DD). Defaults to the beginning of the ECB history",
+    )
+    subparsers.add_parser("sync", help="Downloads the rates published since the last sync")
+
+    args = parser.parse_args()
+    store = uf.get_fx_rate_store()
+
+    if args.command == "backfill":
+        new_days = sync(store, uf.consume_frankfurter_api, start=date.fromisoformat(args.start))
+    else:
+        new_days = sync(store, uf.consume_frankfurter_api)
+
+    print(f"{new_days} new business days stored. Store covers up to {store.covered_through}")
+
+
+if __name__ == "__main__":
+    main()
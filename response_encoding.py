@@ -0,0 +1,145 @@
+"""
+Fast JSON encoding and compression of the API responses.
+
+    FastJSONProvider -> JSON provider of the Flask app. jsonify() encodes with orjson when it is installed
+    encode_variants  -> encodes a response body once, plus its gzip and brotli variants, to be cached
+    variant_response -> serves the cached variant accepted by the client (Accept-Encoding), as it is
+    compress_response -> compresses the large responses that were not served from a cache
+
+orjson and brotli are optional. Without them, the standard json module is used and only gzip is offered.
+"""
+
+import gzip
+import hashlib
+import json
+
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+import tracing
+
+try:
+    import orjson
+# orjson is only an optional speed-up of the JSON encoding
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+# brotli is only an optional, better compressed alternative to gzip
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are not worth compressing
+MINIMUM_COMPRESSION_SIZE = 1024
+
+# The cached variants are compressed once, so they get the best compression. The responses compressed on the fly
+# use a faster level
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 11
+DYNAMIC_GZIP_LEVEL = 5
+DYNAMIC_BROTLI_QUALITY = 4
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Same output as Flask's default provider (sorted keys), encoded by orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs.keys() - {"indent", "separators"}:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj, indent=bool(kwargs.get("indent"))).decode()
+
+    def _orjson_dumps(self, obj, indent: bool = False) -> bytes:
+        # Dates are left to Flask's default function, which formats them as HTTP dates
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    @tracing.traced("serialization")
+    def response(self, *args, **kwargs) -> Response:
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # The encoded bytes go straight into the response, without a round trip through str
+        return self._app.response_class(self._orjson_dumps(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+def dumps(obj) -> bytes:
+    """Encodes a JSON payload compactly, with the same key order as jsonify"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+
+
+def compute_etag(body: bytes) -> str:
+    """ETag of an uncompressed body. It is used as a weak ETag, shared by the compressed variants"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+@tracing.traced("serialization")
+def encode_variants(body: bytes) -> dict:
+    """Returns the body and its compressed variants: {"identity": ..., "gzip": ..., "br": ...}"""
+    variants = {"identity": body}
+
+    if len(body) >= MINIMUM_COMPRESSION_SIZE:
+        variants["gzip"] = gzip.compress(body, compresslevel=CACHED_GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=CACHED_BROTLI_QUALITY)
+
+    return variants
+
+
+def choose_encoding(available_encodings) -> str:
+    """Picks the smallest variant the client accepts: brotli, then gzip, then the uncompressed body"""
+    accepted = request.accept_encodings
+    for encoding in ("br", "gzip"):
+        if encoding in available_encodings and accepted[encoding] > 0:
+            return encoding
+    return "identity"
+
+
+def variant_response(variants: dict, status: int = 200, content_type: str = "application/json") -> Response:
+    """Builds the response to the current request from pre-encoded variants, without encoding anything"""
+    encoding = choose_encoding(variants)
+    response = Response(variants[encoding], status=status, content_type=content_type)
+
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    if len(variants) > 1:
+        response.vary.add("Accept-Encoding")
+
+    return response
+
+
+def compress_response(response: Response) -> Response:
+    """Compresses a large JSON response on the fly, if the client accepts it and it is not compressed yet"""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype != "application/json"
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < MINIMUM_COMPRESSION_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(("br", "gzip") if brotli is not None else ("gzip",))
+    if encoding == "identity":
+        return response
+
+    with tracing.span("serialization", "compress_response", encoding=encoding):
+        if encoding == "br":
+            response.set_data(brotli.compress(body, quality=DYNAMIC_BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(body, compresslevel=DYNAMIC_GZIP_LEVEL, mtime=0))
+
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,297 @@
+"""
+Cache backend shared by every process running the API on the same host.
+
+Entries are kept in a local SQLite database (WAL mode, memory-mapped reads), so no external service is needed.
+Every write is an atomic transaction and every entry carries its own expiry time. Two front-ends are provided:
+
+    SQLiteCache    -> Flask-Caching backend (CACHE_TYPE = "shared_cache.SQLiteCache")
+    SharedTTLCache -> mutable mapping that can replace the cachetools caches used by useful_functions
+
+The shared backend is enabled with the environment variable CACHE_BACKEND=sqlite. The database location can be
+changed with SHARED_CACHE_PATH.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+
+from cachetools import TLRUCache, TTLCache
+from flask_caching.backends.base import BaseCache
+
+import configurations as configs
+import metrics
+
+# Expired entries are removed (and the database trimmed to its maximum size) once every N writes
+PURGE_EVERY_N_WRITES = 256
+
+
+def shared_backend_enabled() -> bool:
+    return os.environ.get("CACHE_BACKEND", "").lower() == "sqlite"
+
+
+def get_shared_cache_path() -> Path:
+    return Path(os.environ.get("SHARED_CACHE_PATH") or configs.shared_cache_path)
+
+
+class SQLiteStore:
+    """Key/value store with per-entry expiry kept in a SQLite database file"""
+
+    def __init__(self, path: Path, max_entries: int = configs.shared_cache_max_entries):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Each thread uses its own connection. SQLite connections can not be shared between threads"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # WAL lets readers in other processes go on while an entry is being written
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={configs.shared_cache_mmap_size}")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Runs the enclosed statements atomically. Readers never see a partially written entry"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def get(self, key: str) -> bytes | None:
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, expires_at: float, only_if_missing: bool = False) -> bool:
+        now = time.time()
+
+        with self._transaction() as connection:
+            if only_if_missing:
+                # An expired entry counts as missing
+                connection.execute("DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now))
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+            else:
+                cursor = connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+
+        self._writes += 1
+        if self._writes % PURGE_EVERY_N_WRITES == 0:
+            self.purge()
+
+        return cursor.rowcount > 0
+
+    def delete(self, key: str) -> bool:
+        with self._transaction() as connection:
+            cursor = connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def delete_prefix(self, prefix: str) -> None:
+        escaped_prefix = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM entries WHERE key LIKE ? ESCAPE '\\'", (escaped_prefix + "%",))
+
+    def keys(self, prefix: str) -> list[str]:
+        escaped_prefix = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = self._connection().execute(
+            "SELECT key FROM entries WHERE key LIKE ? ESCAPE '\\' AND expires_at > ?",
+            (escaped_prefix + "%", time.time()),
+        )
+        return [row[0] for row in rows]
+
+    def purge(self) -> None:
+        """Removes the expired entries and, above 'max_entries', the ones closest to expiring"""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            connection.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: Path | None = None) -> SQLiteStore:
+    """Returns the process-wide store for the given database file"""
+    path = Path(path or get_shared_cache_path())
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = SQLiteStore(path)
+        return _stores[path]
+
+
+class SQLiteCache(BaseCache):
+    """Flask-Caching backend storing the cached views in the shared SQLite database"""
+
+    def __init__(self, path: Path | None = None, default_timeout: int = 300, key_prefix: str = ""):
+        super().__init__(default_timeout=default_timeout)
+        self.store = get_store(path)
+        self.key_prefix = key_prefix
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            path=config.get("CACHE_SQLITE_PATH"),
+            key_prefix=config.get("CACHE_KEY_PREFIX") or "flask_cache_",
+        )
+        return cls(*args, **kwargs)
+
+    def _expires_at(self, timeout: int | None) -> float:
+        timeout = self._normalize_timeout(timeout)
+        # A timeout of 0 means the entry never expires
+        return time.time() + timeout if timeout > 0 else float("inf")
+
+    def get(self, key):
+        value = self.store.get(self.key_prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, timeout=None):
+        return self.store.set(
+            self.key_prefix + key,
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            self._expires_at(timeout),
+        )
+
+    def add(self, key, value, timeout=None):
+        return self.store.set(
+            self.key_prefix + key,
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            self._expires_at(timeout),
+            only_if_missing=True,
+        )
+
+    def delete(self, key):
+        return self.store.delete(self.key_prefix + key)
+
+    def has(self, key):
+        return self.store.get(self.key_prefix + key) is not None
+
+    def clear(self):
+        self.store.delete_prefix(self.key_prefix)
+        return True
+
+
+class SharedTTLCache(MutableMapping):
+    """
+    Mutable mapping backed by the shared SQLite database, usable wherever a cachetools TTLCache/TLRUCache is.
+    Entries expire after 'ttl' seconds, or at the time returned by ttu(key, value, now) when 'ttu' is given.
+    The keys live in 'namespace', so several caches can share the same database.
+    """
+
+    def __init__(self, namespace: str, ttl: float | None = None, ttu=None, path: Path | None = None):
+        self.namespace = f"fn:{namespace}:"
+        self.ttl = ttl
+        self.ttu = ttu
+        self.store = get_store(path)
+
+    def _key(self, key) -> str:
+        return self.namespace + repr(tuple(key) if isinstance(key, tuple) else key)
+
+    def __getitem__(self, key):
+        value = self.store.get(self._key(key))
+        if value is None:
+            raise KeyError(key)
+        return pickle.loads(value)
+
+    def __setitem__(self, key, value):
+        now = time.time()
+        expires_at = self.ttu(key, value, now) if self.ttu is not None else now + self.ttl
+        self.store.set(self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at)
+
+    def __delitem__(self, key):
+        if not self.store.delete(self._key(key)):
+            raise KeyError(key)
+
+    def __iter__(self):
+        # Only the string form of the keys is kept in the database
+        return iter(self.store.keys(self.namespace))
+
+    def __len__(self):
+        return len(self.store.keys(self.namespace))
+
+    def clear(self):
+        self.store.delete_prefix(self.namespace)
+
+
+class EvictionCounter:
+    """
+    Counts the entries a cachetools cache removes by itself: the least recently used ones when it is full
+    (capacity) and the ones whose time to live is over (expired)
+    """
+
+    def __init__(self, name: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = name
+
+    def popitem(self):
+        item = super().popitem()
+        metrics.CACHE_EVICTIONS.inc(cache=self.name, reason="capacity")
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        if expired:
+            metrics.CACHE_EVICTIONS.inc(len(expired), cache=self.name, reason="expired")
+        return expired
+
+
+class CountingTTLCache(EvictionCounter, TTLCache):
+    pass
+
+
+class CountingTLRUCache(EvictionCounter, TLRUCache):
+    pass
+
+
+def make_function_cache(namespace: str, maxsize: int, ttl: float | None = None, ttu=None) -> MutableMapping:
+    """
+    Returns the cache used by a cached function of useful_functions: a SharedTTLCache when the shared backend is
+    enabled, or an in-process cachetools cache (TTLCache, or TLRUCache when 'ttu' is given) otherwise
+    """
+    if shared_backend_enabled():
+        return SharedTTLCache(namespace, ttl=ttl, ttu=ttu)
+
+    if ttu is not None:
+        return CountingTLRUCache(namespace, maxsize=maxsize, ttu=ttu)
+    return CountingTTLCache(namespace, maxsize=maxsize, ttl=ttl)
+
+
+def get_flask_cache_config() -> dict:
+    """Flask-Caching settings for the shared backend, or an empty dict when it is disabled"""
+    if not shared_backend_enabled():
+        return {}
+
+    return {
+        "CACHE_TYPE": "shared_cache.SQLiteCache",
+        "CACHE_SQLITE_PATH": str(get_shared_cache_path()),
+    }
@@ -0,0 +1,86 @@
+"""
+Single-flight coalescing of identical upstream requests.
+
+When a popular cache entry expires, every thread that misses it at the same moment would send the same
+request to the upstream API. With single-flight, the first caller (the leader) sends the request and the
+others wait for its result, so the upstream API sees one request no matter how many threads missed the cache.
+"""
+
+import copy
+import threading
+from collections import Counter
+
+import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its outcome with every concurrent caller"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # (group, outcome) -> count. outcome is 'leader', 'coalesced' or 'error'
+        self.stats = Counter()
+
+    def stats_snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def do(self, group: str, key, function):
+        """
+        Calls 'function' unless an identical call (same 'key') is already running, in which case its result is
+        waited for instead. Every caller gets its own copy of the result, so they can change it freely.
+        Exceptions raised by the leader are raised to every waiting caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.stats[(group, "leader")] += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.stats[(group, "coalesced")] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = function()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            # From here on, new callers start a call of their own
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+                if call.error is not None:
+                    self.stats[(group, "error")] += 1
+            call.done.set()
+
+        # The waiting callers copy the stored result, so the leader can not hand out that same object
+        return copy.deepcopy(call.result) if waiters else call.result
+
+
+def request_key(endpoint: str, params: dict | None) -> tuple:
+    """Normalizes an upstream request (endpoint and URL parameters) into a hashable key"""
+    normalized_params = tuple(sorted((str(key), str(value)) for key, value in (params or {}).items()))
+    return endpoint.strip("/"), normalized_params
+
+
+# Shared by every upstream API consumed by the application
+upstream_requests = SingleFlight()
+metrics.SINGLE_FLIGHT_CALLS.add_source(upstream_requests.stats_snapshot)
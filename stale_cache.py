@@ -0,0 +1,342 @@
+"""
+Stale-while-revalidate and stale-if-error caching.
+
+An entry stays fresh for 'fresh_ttl' seconds. After that it is still served for 'stale_ttl' seconds while a
+background worker refreshes it, so no request has to wait for the upstream API when a popular entry expires.
+If the refresh fails (the upstream API is down, for instance), the last known good value keeps being served
+until the stale window is over.
+
+'fresh_ttl' is a number of seconds, or a function returning it for an entry fetched at a given time (see
+ttl_policy), so each entry stays fresh for as long as its data does not change. The 'timeout' of cached_view is a
+number of seconds too, or a function of the parsed parameters of the request and the fetch time.
+
+Two decorators are provided:
+    stale_while_revalidate -> for plain functions (ex: get_b3_traded_stocks), backed by a cachetools cache
+    cached_view            -> for Flask views, backed by the Flask-Caching instance of the application
+"""
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools.keys import hashkey
+from flask import Response, current_app, request
+
+import metrics
+import response_encoding
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Workers that refresh the stale entries in the background. Created on the first refresh
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+
+# Keys being refreshed right now. A stale entry is refreshed by one worker at a time
+_refreshing_keys = set()
+_refreshing_keys_lock = threading.Lock()
+
+# Age (in seconds) of the oldest stale value used to answer the current request
+_served_staleness = contextvars.ContextVar("served_staleness", default=None)
+
+# Until when (Unix time) every cached value used to answer the current request is fresh
+_data_fresh_until = contextvars.ContextVar("data_fresh_until", default=None)
+
+
+def reset_served_staleness() -> None:
+    """Must be called at the beginning of every request"""
+    _served_staleness.set(None)
+    _data_fresh_until.set(None)
+
+
+def get_data_fresh_until() -> float | None:
+    """Returns until when the cached data used to answer the current request is fresh, if any was used"""
+    return _data_fresh_until.get()
+
+
+def _note_data_fresh_until(fresh_until: float) -> None:
+    current = _data_fresh_until.get()
+    _data_fresh_until.set(fresh_until if current is None else min(fresh_until, current))
+
+
+def get_served_staleness() -> float | None:
+    """Returns how old the stale data used to answer the current request is, or None if it was all fresh"""
+    return _served_staleness.get()
+
+
+def _note_served_staleness(age: float) -> None:
+    current = _served_staleness.get()
+    _served_staleness.set(age if current is None else max(age, current))
+
+
+def resolve_ttl(ttl, fetched_at: float) -> float:
+    """The TTL of an entry fetched at 'fetched_at' (Unix time). 'ttl' is a number of seconds or a TTL function"""
+    return ttl(fetched_at) if callable(ttl) else ttl
+
+
+def stale_entry_ttu(fresh_ttl, stale_ttl: float):
+    """
+    Returns the ttu of a cachetools TLRUCache (or shared_cache.SharedTTLCache) keeping each (value, fetched_at)
+    entry for its fresh TTL plus 'stale_ttl' seconds
+    """
+
+    def ttu(key, entry, now) -> float:
+        return now + resolve_ttl(fresh_ttl, entry[1]) + stale_ttl
+
+    return ttu
+
+
+def get_refresh_executor() -> ThreadPoolExecutor:
+    global _refresh_executor
+
+    if _refresh_executor is None:
+        with _refresh_executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+    return _refresh_executor
+
+
+def _schedule_refresh(key, refresh) -> None:
+    """Runs 'refresh' in the background, unless the same key is already being refreshed"""
+    with _refreshing_keys_lock:
+        if key in _refreshing_keys:
+            return
+        _refreshing_keys.add(key)
+
+    def run():
+        try:
+            refresh()
+        except Exception:
+            # Stale-if-error: the current value is kept and will be refreshed again by the next request
+            logger.exception("Could not refresh the cache entry %r. Serving the stale value.", key)
+        finally:
+            with _refreshing_keys_lock:
+                _refreshing_keys.discard(key)
+
+    get_refresh_executor().submit(run)
+
+
+def stale_while_revalidate(cache, fresh_ttl, lock=None):
+    """
+    Caches the results of a function in 'cache' (a mutable mapping such as a cachetools TTLCache or a
+    shared_cache.SharedTTLCache, whose TTL sets how long a stale result can still be served). Results older than 'fresh_ttl' are served while they are
+    refreshed in the background. Only a cache miss calls the function in the foreground.
+    """
+    lock = lock or threading.Lock()
+
+    def decorator(function):
+        def store(key, *args, **kwargs):
+            value = function(*args, **kwargs)
+            fetched_at = time.time()
+            with lock:
+                cache[key] = (value, fetched_at)
+            return value, fetched_at
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            key = hashkey(*args, **kwargs)
+            with tracing.span("cache", function.__name__) as span, lock:
+                entry = cache.get(key)
+                span["hit"] = entry is not None
+
+            if entry is None:
+                metrics.record_cache_lookup(function.__name__, "miss")
+                value, fetched_at = store(key, *args, **kwargs)
+                _note_data_fresh_until(fetched_at + resolve_ttl(fresh_ttl, fetched_at))
+                return value
+
+            value, fetched_at = entry
+            entry_ttl = resolve_ttl(fresh_ttl, fetched_at)
+            _note_data_fresh_until(fetched_at + entry_ttl)
+            age = time.time() - fetched_at
+            if age >= entry_ttl:
+                metrics.record_cache_lookup(function.__name__, "stale")
+                _note_served_staleness(age - entry_ttl)
+                _schedule_refresh((function.__qualname__, key), lambda: store(key, *args, **kwargs))
+            else:
+                metrics.record_cache_lookup(function.__name__, "hit")
+
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def get_many(cache, keys: list, fetch_many, fresh_ttl, lock, name: str = "get_many") -> dict:
+    """
+    Looks up several keys of 'cache' at once. The missing ones are fetched together with a single call to
+    fetch_many(missing_keys), which must return a {key: value} dict. Values older than 'fresh_ttl' are returned
+    as they are and refreshed together in the background. 'name' identifies the cache in the metrics.
+    """
+    values, missing_keys, stale_keys = {}, [], []
+    now = time.time()
+
+    with tracing.span("cache", name, keys=len(keys)) as span, lock:
+        entries = {key: cache.get(key) for key in keys}
+        span["hits"] = sum(entry is not None for entry in entries.values())
+
+    for key, entry in entries.items():
+        if entry is None:
+            missing_keys.append(key)
+            continue
+
+        value, fetched_at = entry
+        values[key] = value
+        entry_ttl = resolve_ttl(fresh_ttl, fetched_at)
+        _note_data_fresh_until(fetched_at + entry_ttl)
+        if now - fetched_at >= entry_ttl:
+            _note_served_staleness(now - fetched_at - entry_ttl)
+            stale_keys.append(key)
+
+    def store_many(keys_to_fetch: list) -> dict:
+        fetched = fetch_many(keys_to_fetch)
+        fetched_at = time.time()
+        with lock:
+            for key, value in fetched.items():
+                cache[key] = (value, fetched_at)
+        _note_data_fresh_until(fetched_at + resolve_ttl(fresh_ttl, fetched_at))
+        return fetched
+
+    fresh_count = len(values) - len(stale_keys)
+    for result, count in (("hit", fresh_count), ("stale", len(stale_keys)), ("miss", len(missing_keys))):
+        if count:
+            metrics.CACHE_REQUESTS.inc(count, cache=name, result=result)
+
+    if missing_keys:
+        values.update(store_many(missing_keys))
+
+    if stale_keys:
+        _schedule_refresh(tuple(stale_keys), lambda: store_many(stale_keys))
+
+    return values
+
+
+def cached_view(cache, validate, make_cache_key, timeout=None, stale_ttl: int = 86400, invalid_errors=()):
+    """
+    Caches the successful (200) responses of a Flask view in the Flask-Caching instance 'cache'. The request
+    parameters are parsed once, by validate(request), and the view is called with them (params=...). The entry is
+    kept under the key returned by make_cache_key(request.path, params). Responses older than 'timeout' are served
+    for 'stale_ttl' more seconds while the view runs again in the background, with the same parameters.
+
+    Requests whose validation raises one of 'invalid_errors' are not cached: the view is called without params and
+    answers them with its own error message.
+
+    The final bytes of the response are cached, together with their gzip (and brotli) compressed variants, so a
+    hit is answered with the variant accepted by the client without encoding or compressing anything. The
+    responses carry the ETag of the cached payload and, as Last-Modified, the time it was fetched.
+    """
+
+    def decorator(view):
+        metrics_name = f"view:{view.__name__}"
+
+        def get_fresh_ttl(params: dict, fetched_at: float) -> float:
+            if timeout is None:
+                return cache.cache.default_timeout
+            return timeout(params, fetched_at) if callable(timeout) else timeout
+
+        def get_cache_timeout(params: dict) -> int:
+            return int(get_fresh_ttl(params, time.time()) + stale_ttl)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                params = validate(request)
+            except invalid_errors:
+                return view(*args, **kwargs)
+
+            with tracing.span("cache", metrics_name) as span:
+                cache_key = make_cache_key(request.path, params)
+                entry = cache.get(cache_key)
+                span["hit"] = entry is not None
+
+            # Entries cached before the responses were pre-encoded do not have variants nor ETags
+            if entry is None or "etag" not in entry:
+                metrics.record_cache_lookup(metrics_name, "miss")
+                response = current_app.make_response(view(*args, params=params, **kwargs))
+                # Streamed responses are sent as they are produced and never cached as a whole
+                if response.status_code == 200 and not response.is_streamed:
+                    entry = _store_response(cache, cache_key, response, get_cache_timeout(params))
+                    response = response_encoding.variant_response(
+                        entry["variants"], status=entry["status"], content_type=entry["content_type"]
+                    )
+                    response.set_etag(entry["etag"], weak=True)
+                    response.last_modified = entry["fetched_at"]
+                response.headers["X-Cache-Status"] = "MISS"
+                return response
+
+            age = time.time() - entry["fetched_at"]
+            fresh_ttl = get_fresh_ttl(params, entry["fetched_at"])
+
+            if age >= fresh_ttl:
+                _note_served_staleness(age - fresh_ttl)
+                refresh = _build_view_refresh(
+                    app=current_app._get_current_object(),
+                    view=view,
+                    cache=cache,
+                    cache_key=cache_key,
+                    get_cache_timeout=functools.partial(get_cache_timeout, params),
+                    args=args,
+                    kwargs={**kwargs, "params": params},
+                )
+                _schedule_refresh(cache_key, refresh)
+                cache_status = "STALE"
+            else:
+                cache_status = "HIT"
+            metrics.record_cache_lookup(metrics_name, cache_status.lower())
+
+            response = response_encoding.variant_response(
+                entry["variants"], status=entry["status"], content_type=entry["content_type"]
+            )
+            response.set_etag(entry["etag"], weak=True)
+            response.last_modified = entry["fetched_at"]
+            response.headers["Age"] = str(int(age))
+            response.headers["X-Cache-Status"] = cache_status
+            return response
+
+        # Used by cache_keys.measure_hit_ratios to compute the same keys offline
+        wrapper.validate_params = validate
+        wrapper.make_cache_key = make_cache_key
+        return wrapper
+
+    return decorator
+
+
+def _store_response(cache, cache_key: str, response: Response, cache_timeout: int) -> dict:
+    """Caches the encoded body of the response, its compressed variants and its ETag, and returns the entry"""
+    body = response.get_data()
+    entry = {
+        "variants": response_encoding.encode_variants(body),
+        "etag": response_encoding.compute_etag(body),
+        "status": response.status_code,
+        "content_type": response.content_type,
+        "fetched_at": time.time(),
+    }
+    cache.set(cache_key, entry, timeout=cache_timeout)
+    return entry
+
+
+def _build_view_refresh(app, view, cache, cache_key, get_cache_timeout, args, kwargs):
+    """
+    Returns a function that runs 'view' again with the parsed parameters of the request ('kwargs'), outside the
+    request, and caches its response
+    """
+
+    def refresh():
+        with app.app_context():
+            response = app.make_response(view(*args, **kwargs))
+        cache_timeout = get_cache_timeout()
+
+        # Stale-if-error: an unsuccessful response leaves the last good one in the cache
+        if response.status_code == 200:
+            _store_response(cache, cache_key, response, cache_timeout)
+        else:
+            logger.warning(
+                "Refreshing %s returned %s. Serving the stale response.", cache_key, response.status_code
+            )
+
+    return refresh
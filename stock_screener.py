@@ -0,0 +1,121 @@
+"""
+Local screener of the stocks traded on B3.
+
+A snapshot of the whole brapi /quote/list stock universe is kept in memory, in columnar form (one numpy array per
+sortable field). The sort permutation of every sortByOptions column is computed once per snapshot, in both
+orders, and every sector has a precomputed membership mask. Filtering by sector, sorting and paginating the
+/v1/b3stocks/stocksinfo requests is then a matter of indexing those arrays, with no request to brapi.
+
+The snapshot is refreshed periodically by useful_functions.get_b3_stock_screener.
+"""
+
+import math
+from datetime import datetime, timezone
+
+import numpy as np
+
+# sortByOptions accepted by the stocksinfo endpoint (the ones of brapi) -> field of the stocks used to sort them.
+# brapi's 'name' is the ticker (the 'name' column of its data source), and 'market_cap_basic' is 'market_cap'
+SORT_COLUMNS = {
+    "name": "stock",
+    "close": "close",
+    "change": "change",
+    "change_abs": "change_abs",
+    "volume": "volume",
+    "market_cap_basic": "market_cap",
+    "sector": "sector",
+}
+
+NUMERIC_COLUMNS = ("close", "change", "change_abs", "volume", "market_cap")
+
+
+def to_float(value) -> float:
+    """Stocks without a value in a numeric field (not traded today, for instance) get NaN, sorted last"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def absolute_change(close: float, change: float) -> float:
+    """brapi gives the change in percent. The absolute change is close - previous close"""
+    if math.isnan(close) or math.isnan(change) or change == -100:
+        return math.nan
+    return close * change / (100 + change)
+
+
+class StockScreener:
+    """Columnar snapshot of the B3 stocks, with precomputed sort permutations and sector masks"""
+
+    def __init__(self, stocks: list[dict], indexes: list | None = None, fetched_at: datetime | None = None):
+        self.stocks = stocks
+        self.indexes = indexes or []
+        self.fetched_at = fetched_at or datetime.now(timezone.utc)
+
+        columns = {
+            "stock": np.array([str(stock.get("stock") or "") for stock in stocks], dtype=object),
+            "sector": np.array([str(stock.get("sector") or "") for stock in stocks], dtype=object),
+        }
+        for column in ("close", "change", "volume", "market_cap"):
+            columns[column] = np.array([to_float(stock.get(column)) for stock in stocks], dtype=np.float64)
+        columns["change_abs"] = np.array(
+            [absolute_change(close, change) for close, change in zip(columns["close"], columns["change"])],
+            dtype=np.float64,
+        )
+        self.columns = columns
+
+        # sortByOption -> {"asc": permutation, "desc": permutation}
+        self.permutations = {
+            option: self._sort_permutations(column) for option, column in SORT_COLUMNS.items()
+        }
+
+        self.available_sectors = sorted({sector for sector in columns["sector"] if sector})
+        self.sector_masks = {sector: columns["sector"] == sector for sector in self.available_sectors}
+
+    def _sort_permutations(self, column: str) -> dict:
+        values = self.columns[column]
+
+        if column in NUMERIC_COLUMNS:
+            # NaN is sorted last by numpy, so negating the values gives the descending order with NaN still last
+            return {
+                "asc": np.argsort(values, kind="stable"),
+                "desc": np.argsort(-values, kind="stable"),
+            }
+
+        # Ties (same sector) are broken by the ticker
+        tickers = self.columns["stock"]
+        ascending = np.array(sorted(range(len(values)), key=lambda i: (values[i], tickers[i])), dtype=np.intp)
+        descending = np.array(
+            sorted(range(len(values)), key=lambda i: (values[i], tickers[i]), reverse=True), dtype=np.intp
+        )
+        return {"asc": ascending, "desc": descending}
+
+    def query(
+        self, sector: str | None, sorted_by: str, order: str, limit: int | None, page: int | None
+    ) -> dict:
+        """
+        Returns one page of the stocks of 'sector' (or of every stock), sorted by 'sorted_by' in 'order', with the
+        same fields as a brapi /quote/list response
+        """
+        permutation = self.permutations[sorted_by][order]
+
+        if sector is not None:
+            mask = self.sector_masks.get(sector)
+            permutation = permutation[mask[permutation]] if mask is not None else permutation[:0]
+
+        total_count = len(permutation)
+        items_per_page = limit or max(total_count, 1)
+        current_page = page or 1
+        start = (current_page - 1) * items_per_page
+
+        return {
+            "indexes": self.indexes,
+            "stocks": [self.stocks[i] for i in permutation[start : start + items_per_page]],
+            "availableSectors": self.available_sectors,
+            "currentPage": current_page,
+            "totalPages": math.ceil(total_count / items_per_page),
+            "itemsPerPage": items_per_page,
+            "totalCount": total_count,
+            "hasNextPage": start + items_per_page < total_count,
+            "snapshotTime": self.fetched_at.isoformat(),
+        }
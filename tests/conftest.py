@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+# Set before the API modules are imported: no .env API key is needed, nothing is written to data/ and every rate
+# comes from the upstream stubs
+os.environ.setdefault("BRAPI_API_KEY", "tests")
+os.environ["ACCESS_LOG_PATH"] = "off"
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ["CACHE_WARMING"] = "off"
+os.environ["RATE_STORE_DIR"] = tempfile.mkdtemp(prefix="financeapi-tests-")
+
+import pytest
+
+import configurations as configs
+import upstream_policy
+import upstream_stubs
+import useful_functions as uf
+
+
+def start_stub(monkeypatch, api: str, **faults) -> upstream_stubs.StubServer:
+    """
+    Starts a stub server of 'api' with the given faults (see upstream_stubs.FaultProfile) and points the API to
+    it, with the connection pool and retries of the real upstream
+    """
+    stub = upstream_stubs.StubServer(api, faults=upstream_stubs.FaultProfile(**faults)).start()
+    upstream_policy.mount_upstream_adapters(uf.session, {api: stub.base_url})
+    base_url_name = "FRANKFURTER_API_BASE_URL" if api == "frankfurter" else "BRAPI_API_BASE_URL"
+    monkeypatch.setattr(uf, base_url_name, stub.base_url)
+    return stub
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """Factory of stub servers, stopped at the end of the test"""
+    stubs = []
+
+    def factory(api: str, **faults) -> upstream_stubs.StubServer:
+        stubs.append(start_stub(monkeypatch, api, **faults))
+        return stubs[-1]
+
+    yield factory
+    for stub in stubs:
+        stub.stop()
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    """Gives each upstream a new breaker, so the calls of other tests do not count. Returns a function to replace it"""
+
+    def replace(upstream: str, **settings) -> upstream_policy.CircuitBreaker:
+        breaker = upstream_policy.CircuitBreaker(upstream, **settings)
+        monkeypatch.setitem(upstream_policy.breakers, upstream, breaker)
+        return breaker
+
+    for upstream, settings in configs.upstream_circuit_breakers.items():
+        replace(upstream, **settings)
+    return replace
@@ -0,0 +1,22 @@
+import pytest
+
+import useful_functions as uf
+
+TICKERS = ["PETR4", "VALE3", "ITUB4", "BBDC4", "ABEV3"]
+
+
+@pytest.mark.parametrize(("max_tickers_per_call", "brapi_requests"), [(None, 5), ("1", 5), ("2", 3), ("10", 1)])
+def test_batch_quotes_share_brapi_requests_up_to_the_plan_limit(
+    stub_server, breakers, monkeypatch, max_tickers_per_call, brapi_requests
+):
+    if max_tickers_per_call is None:
+        monkeypatch.delenv("BRAPI_MAX_TICKERS_PER_CALL", raising=False)
+    else:
+        monkeypatch.setenv("BRAPI_MAX_TICKERS_PER_CALL", max_tickers_per_call)
+    stub = stub_server("brapi")
+
+    quotes = uf.consume_brapi_quotes(TICKERS, {})
+
+    assert list(quotes) == TICKERS
+    assert all(quotes[ticker]["symbol"] == ticker for ticker in TICKERS)
+    assert stub.requests_received == brapi_requests
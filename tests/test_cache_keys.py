@@ -0,0 +1,42 @@
+import json
+
+import cache_keys
+
+
+def test_read_request_paths_of_a_json_access_log(tmp_path):
+    records = [
+        {"method": "GET", "path": "/v1/conversion/historical", "query": "from=USD&to=BRL", "internalRequest": None},
+        {"method": "GET", "path": "/v1/currencies", "query": "", "internalRequest": None},
+        # Sent by the cache warming
+        {"method": "GET", "path": "/v1/conversion/historical", "query": "to=BRL", "internalRequest": "cache-warming"},
+        {"method": "POST", "path": "/v1/b3stocks/quote", "query": "", "internalRequest": None},
+    ]
+    log_path = tmp_path / "access.log"
+    log_path.write_text("\n".join(json.dumps(record) for record in records) + "\nnot json {\n", encoding="utf-8")
+
+    assert cache_keys.read_request_paths(str(log_path)) == [
+        "/v1/conversion/historical?from=USD&to=BRL",
+        "/v1/currencies",
+        "not json {",
+    ]
+
+
+def test_equivalent_requests_share_one_canonical_key():
+    from main import app
+
+    results = cache_keys.measure_hit_ratios(
+        app,
+        [
+            "/v1/conversion/historical?from=USD&to=BRL,EUR&date=2024-03-15",
+            "/v1/conversion/historical?to=EUR,BRL&date=15-03-2024&from=USD&amount=1",
+            "/v1/conversion/interval?from=USD&to=BRL&start_date=2024-01-01&end_date=2024-01-31",
+            "/v1/conversion/interval?end_date=2024-01-31&start_date=2024-01-01&to=BRL&from=USD&amount=1",
+            # Invalid requests are never cached, and endpoints without a cached view are not keyed
+            "/v1/conversion/historical?from=XXX&to=BRL",
+            "/v1/currencies",
+        ],
+    )
+
+    assert results["requests"] == 4
+    assert (results["raw_entries"], results["canonical_entries"]) == (4, 2)
+    assert results["canonical_hit_ratio"] == 0.5
@@ -0,0 +1,40 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import custom_exceptions
+import price_indicators
+import useful_functions as uf
+
+INDICATORS = [("sma", 3), ("ema", 3), ("rsi", 3), ("returns", None), ("volatility", 2)]
+
+
+@pytest.mark.parametrize("bars", [0, 1, 2, 3, 30])
+def test_every_indicator_has_one_value_per_bar(bars):
+    closes = 10 + np.sin(np.arange(bars, dtype=float))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        results = price_indicators.compute_indicators({"close": closes}, INDICATORS, "1d")
+
+    assert {key: len(values) for key, values in results.items()} == {
+        "sma_3": bars, "ema_3": bars, "rsi_3": bars, "returns": bars, "volatility_2": bars
+    }
+
+
+def test_volatility_needs_a_period_of_at_least_two():
+    with pytest.raises(custom_exceptions.BadRequestError, match="between 2 and"):
+        uf.parse_indicators("volatility:1")
+
+    assert uf.parse_indicators("volatility:2,sma:1,returns") == [("volatility", 2), ("sma", 1), ("returns", None)]
+
+
+def test_volatility_of_two_returns():
+    closes = np.array([100.0, 110.0, 99.0, 99.0])
+
+    volatility = price_indicators.rolling_volatility(closes, 2, 252)
+
+    log_returns = np.diff(np.log(closes))
+    assert np.isnan(volatility[:2]).all()
+    assert volatility[2] == pytest.approx(np.std(log_returns[:2], ddof=1) * np.sqrt(252))
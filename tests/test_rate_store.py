@@ -0,0 +1,225 @@
+import json
+import math
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import rate_store
+
+CURRENCIES = ["BRL", "EUR", "USD"]
+
+
+def business_days(start: date, end: date) -> list[date]:
+    days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+    return [day for day in days if day.weekday() < 5]
+
+
+def rates_of(day: date) -> dict:
+    return {"BRL": 5.0 + day.day / 100, "USD": 1.0 + day.day / 1000}
+
+
+class FakeFrankfurter:
+    """consume_api of rate_store.sync. Answers every business day of the requested interval, up to 'last_day'"""
+
+    def __init__(self, last_day: date):
+        self.last_day = last_day
+        self.endpoints = []
+
+    def __call__(self, endpoint: str, params: dict | None = None) -> dict:
+        self.endpoints.append(endpoint)
+        start, end = (date.fromisoformat(day) for day in endpoint.removeprefix("/v1/").split(".."))
+        days = business_days(start, min(end, self.last_day))
+        return {"base": "EUR", "rates": {day.isoformat(): rates_of(day) for day in days}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return rate_store.FXRateStore(tmp_path, CURRENCIES)
+
+
+def fill(store, start: date, end: date) -> int:
+    """Appends the rates of every business day between 'start' and 'end', and covers the store through 'end'"""
+    rates_by_date = {day.isoformat(): rates_of(day) for day in business_days(start, end)}
+    return store.append(rates_by_date, end)
+
+
+# -------- Writing ---------- #
+
+def test_meta_json_is_replaced_last(store, tmp_path, monkeypatch):
+    replaced = []
+    real_replace = rate_store.os.replace
+
+    def recording_replace(source, destination):
+        replaced.append(rate_store.Path(destination).name)
+        real_replace(source, destination)
+
+    monkeypatch.setattr(rate_store.os, "replace", recording_replace)
+    fill(store, date(2024, 1, 1), date(2024, 1, 12))
+
+    assert replaced == [rate_store.RATES_FILE_NAME, rate_store.DATES_FILE_NAME, rate_store.META_FILE_NAME]
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(replaced)
+
+
+def test_append_adds_only_the_new_days(store):
+    assert fill(store, date(2024, 1, 1), date(2024, 1, 12)) == 10
+    # Overlaps the days already stored
+    assert fill(store, date(2024, 1, 8), date(2024, 1, 19)) == 5
+
+    days, table = store.get_rate_table(date(2024, 1, 1), date(2024, 1, 19))
+    assert days == business_days(date(2024, 1, 1), date(2024, 1, 19))
+    assert table.shape == (15, len(CURRENCIES))
+    assert store.covered_through == date(2024, 1, 19)
+
+
+def test_append_fills_eur_and_leaves_missing_currencies_empty(store):
+    store.append({"2024-01-05": {"BRL": 5.4}}, date(2024, 1, 5))
+
+    _, vector = store.get_rate_vector(date(2024, 1, 5))
+    brl, eur, usd = vector
+    assert (brl, eur) == (5.4, 1.0)
+    assert math.isnan(usd)
+
+
+def test_readers_keep_their_view_until_meta_json_describes_the_new_files(store, tmp_path):
+    fill(store, date(2024, 1, 1), date(2024, 1, 5))
+    reader = rate_store.FXRateStore(tmp_path, CURRENCIES)
+    assert reader.covered_through == date(2024, 1, 5)
+
+    # A sync that wrote meta.json but whose data files are not there yet
+    meta_path = tmp_path / rate_store.META_FILE_NAME
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta_path.write_text(json.dumps({**meta, "rows": meta["rows"] + 5, "covered_through": "2024-01-12"}))
+    assert reader.covered_through == date(2024, 1, 5)
+
+    fill(store, date(2024, 1, 8), date(2024, 1, 12))
+    assert reader.covered_through == date(2024, 1, 12)
+
+
+# -------- Reading ---------- #
+
+@pytest.mark.parametrize(
+    ("day", "rates_date"),
+    [
+        (date(2024, 1, 5), date(2024, 1, 5)),
+        (date(2024, 1, 6), date(2024, 1, 5)),  # Saturday -> Friday
+        (date(2024, 1, 7), date(2024, 1, 5)),
+        (date(2024, 1, 8), date(2024, 1, 8)),
+    ],
+)
+def test_rate_vector_of_a_day_without_rates_is_the_one_of_the_business_day_before(store, day, rates_date):
+    fill(store, date(2024, 1, 1), date(2024, 1, 12))
+
+    found_date, vector = store.get_rate_vector(day)
+
+    assert found_date == rates_date
+    assert vector[0] == rates_of(rates_date)["BRL"]
+
+
+def test_rate_table_starts_at_the_business_day_before_a_start_without_rates(store):
+    fill(store, date(2024, 1, 1), date(2024, 1, 12))
+
+    days, table = store.get_rate_table(date(2024, 1, 6), date(2024, 1, 9))
+
+    assert days == [date(2024, 1, 5), date(2024, 1, 8), date(2024, 1, 9)]
+    assert len(table) == 3
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "outside_day"),
+    [
+        (date(2023, 12, 29), date(2024, 1, 3), date(2023, 12, 29)),  # Before the first stored day
+        (date(2024, 1, 10), date(2024, 1, 13), date(2024, 1, 13)),  # After covered_through
+    ],
+)
+def test_days_outside_the_store_are_not_answered(store, start, end, outside_day):
+    fill(store, date(2024, 1, 1), date(2024, 1, 12))
+
+    assert not store.covers(start, end)
+    assert store.get_rate_table(start, end) is None
+    assert store.get_rate_vector(outside_day) is None
+
+
+def test_empty_store_covers_nothing(store):
+    assert store.covered_through is None
+    assert store.first_date is None
+    assert store.get_rate_vector(date(2024, 1, 5)) is None
+
+
+def test_store_built_with_other_currencies_is_not_used_nor_read_again(store, tmp_path, monkeypatch):
+    fill(store, date(2024, 1, 1), date(2024, 1, 12))
+    other = rate_store.FXRateStore(tmp_path, ["EUR", "USD"])
+
+    reads = []
+    real_loads = rate_store.json.loads
+    monkeypatch.setattr(rate_store.json, "loads", lambda text: reads.append(text) or real_loads(text))
+
+    for _ in range(3):
+        assert other.get_rate_vector(date(2024, 1, 5)) is None
+    assert len(reads) == 1
+
+    # Usable again once the store is rebuilt with its currencies
+    monkeypatch.undo()
+    rebuilt = rate_store.FXRateStore(tmp_path, ["EUR", "USD"])
+    rebuilt.append({"2024-01-05": {"USD": 1.1}}, date(2024, 1, 5), replace=True)
+    assert other.get_rate_vector(date(2024, 1, 5))[1][1] == 1.1
+
+
+# -------- Syncing ---------- #
+
+TODAY = date(2025, 1, 15)  # A Wednesday
+
+
+@pytest.fixture
+def frozen_today(monkeypatch):
+    """Makes TODAY the current date of rate_store.sync"""
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(TODAY.year, TODAY.month, TODAY.day, 12, 0, tzinfo=tz)
+
+    monkeypatch.setattr(rate_store, "datetime", FrozenDatetime)
+
+
+@pytest.mark.parametrize(
+    ("last_published_day", "covered_through"),
+    [
+        (TODAY, TODAY),
+        # Today's rates are not published yet: only the days before today are final
+        (TODAY - timedelta(days=1), TODAY - timedelta(days=1)),
+    ],
+)
+def test_today_is_covered_once_its_rates_are_published(store, frozen_today, last_published_day, covered_through):
+    rate_store.sync(store, FakeFrankfurter(last_day=last_published_day), start=date(2025, 1, 1))
+
+    assert store.covered_through == covered_through
+
+
+def test_sync_only_requests_the_days_after_the_store(store, frozen_today):
+    rate_store.sync(store, FakeFrankfurter(last_day=TODAY - timedelta(days=1)), start=date(2025, 1, 1))
+
+    consume_api = FakeFrankfurter(last_day=TODAY)
+    assert rate_store.sync(store, consume_api) == 1
+
+    assert consume_api.endpoints == [f"/v1/{TODAY}..{TODAY}"]
+    assert store.covered_through == TODAY
+    assert store.get_rate_vector(TODAY)[0] == TODAY
+
+
+def test_sync_of_a_store_covering_today_requests_nothing(store, frozen_today):
+    rate_store.sync(store, FakeFrankfurter(last_day=TODAY), start=date(2025, 1, 1))
+
+    consume_api = FakeFrankfurter(last_day=TODAY)
+    assert rate_store.sync(store, consume_api) == 0
+    assert consume_api.endpoints == []
+
+
+def test_backfill_is_requested_in_chunks(store, frozen_today):
+    start = TODAY - timedelta(days=2 * rate_store.BACKFILL_CHUNK_IN_DAYS)
+    consume_api = FakeFrankfurter(last_day=TODAY)
+
+    rate_store.sync(store, consume_api, start=start)
+
+    assert len(consume_api.endpoints) == 3
+    assert store.first_date == business_days(start, TODAY)[0]
+    assert store.covered_through == TODAY
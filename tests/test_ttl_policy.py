@@ -0,0 +1,154 @@
+from datetime import date, datetime
+
+import pytest
+
+import configurations as configs
+import ttl_policy
+
+
+def berlin(*fields) -> float:
+    return datetime(*fields, tzinfo=ttl_policy.ECB_TIMEZONE).timestamp()
+
+
+def sao_paulo(*fields) -> float:
+    return datetime(*fields, tzinfo=ttl_policy.B3_TIMEZONE).timestamp()
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+# -------- Calendars ---------- #
+
+@pytest.mark.parametrize(
+    ("year", "easter"),
+    [(2000, date(2000, 4, 23)), (2019, date(2019, 4, 21)), (2024, date(2024, 3, 31)),
+     (2025, date(2025, 4, 20)), (2026, date(2026, 4, 5)), (2038, date(2038, 4, 25))],
+)
+def test_easter_sunday(year, easter):
+    assert ttl_policy.get_easter_sunday(year) == easter
+
+
+@pytest.mark.parametrize(
+    "holiday",
+    [
+        date(2025, 3, 3), date(2025, 3, 4),  # Carnival 2025
+        date(2026, 2, 16), date(2026, 2, 17),  # Carnival 2026
+        date(2025, 4, 18), date(2026, 4, 3),  # Good Friday
+        date(2025, 6, 19), date(2026, 6, 4),  # Corpus Christi
+        date(2025, 4, 21), date(2025, 9, 7), date(2025, 12, 24), date(2025, 12, 31),
+        date(2024, 11, 20), date(2025, 11, 20),  # Black Consciousness Day
+    ],
+)
+def test_b3_holidays(holiday):
+    assert holiday in ttl_policy.get_b3_holidays(holiday.year)
+
+
+@pytest.mark.parametrize(
+    "day",
+    [
+        date(2025, 3, 5),  # Ash Wednesday
+        date(2025, 4, 22),  # Easter Monday is a TARGET holiday, not a B3 one
+        date(2023, 11, 20),  # Black Consciousness Day only became a national holiday in 2024
+    ],
+)
+def test_b3_trading_days(day):
+    assert ttl_policy.is_b3_trading_day(day)
+
+
+@pytest.mark.parametrize(
+    ("day", "is_business_day"),
+    [
+        (date(2025, 4, 17), True),
+        (date(2025, 4, 18), False),  # Good Friday
+        (date(2025, 4, 21), False),  # Easter Monday
+        (date(2025, 5, 1), False),
+        (date(2025, 12, 24), True),
+        (date(2025, 12, 26), False),
+        (date(2025, 1, 11), False),  # Saturday
+    ],
+)
+def test_target_business_days(day, is_business_day):
+    assert ttl_policy.is_target_business_day(day) is is_business_day
+
+
+# -------- FX rates ---------- #
+
+@pytest.mark.parametrize(
+    ("now", "next_publication_day"),
+    [
+        (berlin(2025, 1, 10, 12, 0), date(2025, 1, 10)),
+        (berlin(2025, 1, 10, 16, 14), date(2025, 1, 10)),
+        (berlin(2025, 1, 10, 16, 15), date(2025, 1, 13)),  # Friday after the publication -> Monday
+        (berlin(2025, 4, 17, 17, 0), date(2025, 4, 22)),  # Good Friday and Easter Monday are skipped
+        (berlin(2025, 12, 24, 17, 0), date(2025, 12, 29)),
+    ],
+)
+def test_next_publication_day(now, next_publication_day):
+    assert ttl_policy.get_next_publication_day(now) == next_publication_day
+
+
+@pytest.mark.parametrize(
+    ("requested_date", "published_date", "now", "ttl"),
+    [
+        # Before the 16:00 CET publication (plus the delay), the rates of today last until it
+        ("2025-01-10", None, berlin(2025, 1, 10, 12, 0), 4 * HOUR + configs.ecb_publication_delay),
+        ("2025-01-10", None, berlin(2025, 1, 10, 16, 0), configs.ecb_publication_delay),
+        ("2025-01-10", None, berlin(2025, 1, 10, 16, 14, 59), 1),
+        # After it they are final, or short-lived when the data does not tell if they were picked up
+        ("2025-01-10", "2025-01-10", berlin(2025, 1, 10, 16, 15), configs.immutable_data_ttl),
+        ("2025-01-10", None, berlin(2025, 1, 10, 16, 15), configs.fx_latest_rate_ttl),
+        # Published late: the FrankFurter API still returns the rates of the day before
+        ("2025-01-10", "2025-01-09", berlin(2025, 1, 10, 17, 0), configs.fx_unpublished_rate_ttl),
+        # The weekend gets the rates of Friday, which are final
+        ("2025-01-11", "2025-01-10", berlin(2025, 1, 11, 12, 0), configs.immutable_data_ttl),
+        # Monday requested on Sunday: cached until Monday's publication
+        ("2025-01-13", None, berlin(2025, 1, 12, 16, 15), DAY),
+        # Past dates never change
+        ("2024-01-05", None, berlin(2025, 1, 10, 12, 0), configs.immutable_data_ttl),
+        ("2024-01-05", "2024-01-05", berlin(2025, 1, 10, 12, 0), configs.immutable_data_ttl),
+    ],
+)
+def test_fx_rate_ttl(requested_date, published_date, now, ttl):
+    assert ttl_policy.fx_rate_ttl(requested_date, published_date, now) == pytest.approx(ttl)
+
+
+def test_fx_params_ttl_reads_the_date_of_the_params():
+    ttl = ttl_policy.fx_params_ttl("end_date")
+    now = berlin(2025, 1, 10, 16, 0)
+
+    assert ttl({"end_date": "2025-01-10"}, now) == pytest.approx(configs.ecb_publication_delay)
+    assert ttl({"end_date": "2024-12-31"}, now) == configs.immutable_data_ttl
+
+
+# -------- B3 trading session ---------- #
+
+@pytest.mark.parametrize(
+    ("now", "ttl"),
+    [
+        # Session open: the session TTL
+        (sao_paulo(2025, 1, 15, 12, 0), 900),
+        (sao_paulo(2025, 1, 15, 17, 59), 900),
+        # Friday after the close -> Monday's open
+        (sao_paulo(2025, 1, 17, 18, 0), 64 * HOUR),
+        (sao_paulo(2025, 1, 18, 12, 0), 46 * HOUR),
+        # Before the open, at least the session TTL
+        (sao_paulo(2025, 1, 20, 9, 0), HOUR),
+        (sao_paulo(2025, 1, 20, 9, 59), 900),
+        # Friday before Carnival 2025 -> Ash Wednesday
+        (sao_paulo(2025, 2, 28, 18, 30), 4 * DAY + 15.5 * HOUR),
+        # Black Consciousness Day 2024 (Wednesday)
+        (sao_paulo(2024, 11, 19, 18, 0), 40 * HOUR),
+        # Christmas Eve and Christmas 2025 -> Friday the 26th
+        (sao_paulo(2025, 12, 23, 18, 0), 64 * HOUR),
+    ],
+)
+def test_b3_market_ttl(now, ttl):
+    assert ttl_policy.b3_market_ttl(900, now) == pytest.approx(ttl)
+
+
+def test_b3_session_ttl_is_the_ttl_function_of_the_caches():
+    ttl = ttl_policy.b3_session_ttl(600)
+
+    assert ttl(sao_paulo(2025, 1, 15, 12, 0)) == 600
+    assert ttl(sao_paulo(2025, 1, 17, 18, 0)) == pytest.approx(64 * HOUR)
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import useful_functions as uf
+
+
+def test_requests_reach_the_stub_server(stub_server, breakers):
+    stub = stub_server("frankfurter")
+
+    response = uf.consume_frankfurter_api("/v1/2024-01-05", {"base": "EUR", "symbols": "USD"})
+
+    assert response["date"] == "2024-01-05"
+    assert set(response["rates"]) == {"USD"}
+    assert stub.get_response_counts() == {200: 1}
+
+
+def test_brapi_requests_reach_the_stub_server(stub_server, breakers):
+    stub = stub_server("brapi")
+
+    response = uf.consume_brapi_api("/quote/PETR4")
+
+    assert response["results"][0]["symbol"] == "PETR4"
+    assert stub.requests_received == 1
+
+
+def test_fan_out_requests_are_sent_in_parallel(stub_server, breakers):
+    stub = stub_server("frankfurter", latency=0.3)
+    months = [("2024-01-01", "2024-01-31"), ("2024-02-01", "2024-02-29"), ("2024-03-01", "2024-03-31")]
+
+    started_at = time.perf_counter()
+    responses = uf.consume_many(
+        "frankfurter", [(f"/v1/{start}..{end}", {"base": "EUR"}) for start, end in months]
+    )
+    elapsed = time.perf_counter() - started_at
+
+    # In the order they were requested
+    assert [response["start_date"] for response in responses] == [start for start, _ in months]
+    assert stub.requests_received == 3
+    # One after the other they would take 0.9s
+    assert elapsed < 0.7
+
+
+def test_identical_concurrent_requests_share_one_upstream_call(stub_server, breakers):
+    stub = stub_server("frankfurter", latency=0.3)
+    results = []
+
+    def request_rates():
+        results.append(uf.consume_frankfurter_api("/v1/2024-01-05", {"base": "EUR"}))
+
+    threads = [threading.Thread(target=request_rates) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 5
+    assert all(result == results[0] for result in results)
+    assert stub.requests_received == 1
@@ -0,0 +1,176 @@
+import time
+
+import pytest
+import requests
+from urllib3.util.retry import RequestHistory
+
+import configurations as configs
+import custom_exceptions
+import upstream_policy
+import useful_functions as uf
+
+
+def request_rates(day: str = "2024-01-05") -> dict:
+    return uf.consume_frankfurter_api(f"/v1/{day}", {"base": "EUR"})
+
+
+@pytest.fixture
+def retry_delays(monkeypatch):
+    """Records the delay urllib3 would wait before each retry instead of waiting it"""
+    delays = []
+    monkeypatch.setattr(
+        upstream_policy.JitteredRetry, "sleep", lambda retry, response=None: delays.append(retry.get_backoff_time())
+    )
+    return delays
+
+
+# -------- Circuit breaker ---------- #
+
+def test_breaker_trips_on_error_rate(stub_server, breakers):
+    breaker = breakers("frankfurter", minimum_calls=3, failure_rate_threshold=0.5)
+    stub = stub_server("frankfurter", error_rate=1.0, error_status=500)
+
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            request_rates()
+    assert breaker.state == upstream_policy.OPEN
+
+    # Fails at once, without calling the API
+    with pytest.raises(custom_exceptions.UpstreamUnavailableError):
+        request_rates()
+    assert stub.requests_received == 3
+    assert breaker.snapshot()["rejectedCalls"] == 1
+
+
+def test_breaker_trips_on_latency(stub_server, breakers):
+    breaker = breakers("frankfurter", minimum_calls=3, slow_call_seconds=0.1, slow_call_rate_threshold=0.8)
+    stub_server("frankfurter", latency=0.15)
+
+    for _ in range(3):
+        # The slow calls succeed, but the API is not healthy
+        assert request_rates()["date"] == "2024-01-05"
+    assert breaker.state == upstream_policy.OPEN
+
+
+def test_client_errors_do_not_trip_the_breaker(stub_server, breakers):
+    breaker = breakers("frankfurter", minimum_calls=3)
+    stub_server("frankfurter")
+
+    for _ in range(5):
+        with pytest.raises(requests.HTTPError):
+            uf.consume_frankfurter_api("/v1/not-a-date")
+    assert breaker.state == upstream_policy.CLOSED
+
+
+def test_open_breaker_answers_503_with_retry_after(stub_server, breakers):
+    from main import app
+
+    breaker = breakers("frankfurter", minimum_calls=1, open_seconds=30.0)
+    stub = stub_server("frankfurter")
+    breaker.record(True, 0.0)
+
+    # A date no other test requests, so it is in no cache
+    response = app.test_client().get("/v1/conversion/historical?from=USD&to=BRL&date=2021-03-03")
+
+    assert response.status_code == 503
+    assert 1 <= int(response.headers["Retry-After"]) <= 30
+    assert stub.requests_received == 0
+
+
+@pytest.mark.parametrize(
+    ("probe_fails", "final_state", "times_opened"),
+    [(False, upstream_policy.CLOSED, 1), (True, upstream_policy.OPEN, 2)],
+)
+def test_half_open_probe_closes_or_reopens_the_breaker(stub_server, breakers, probe_fails, final_state, times_opened):
+    breaker = breakers("frankfurter", minimum_calls=2, open_seconds=0.2, half_open_max_calls=1)
+    stub = stub_server("frankfurter", error_rate=1.0, error_status=500)
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            request_rates()
+    assert breaker.state == upstream_policy.OPEN
+
+    time.sleep(0.25)
+    assert breaker.state == upstream_policy.HALF_OPEN
+
+    if not probe_fails:
+        stub.faults.error_rate = 0.0
+        request_rates()
+    else:
+        with pytest.raises(requests.HTTPError):
+            request_rates()
+
+    assert breaker.state == final_state
+    assert breaker.snapshot()["timesOpened"] == times_opened
+
+
+def test_half_open_breaker_only_lets_the_probes_through(breakers):
+    breaker = breakers("frankfurter", minimum_calls=1, open_seconds=0.1, half_open_max_calls=1)
+    breaker.record(True, 0.0)
+    time.sleep(0.15)
+
+    breaker.allow_request()
+    with pytest.raises(custom_exceptions.UpstreamUnavailableError):
+        breaker.allow_request()
+
+
+# -------- Retries ---------- #
+
+def test_read_timeouts_are_not_retried(stub_server, breakers, retry_delays, monkeypatch):
+    monkeypatch.setattr(configs, "upstream_timeouts", (1.0, 0.2))
+    stub = stub_server("frankfurter", latency=0.5)
+
+    started_at = time.perf_counter()
+    with pytest.raises(requests.ReadTimeout):
+        request_rates()
+    elapsed = time.perf_counter() - started_at
+
+    # A single read timeout, and a single request once the stub has answered it
+    assert elapsed < 0.4
+    assert retry_delays == []
+    time.sleep(0.5)
+    assert stub.requests_received == 1
+
+
+def test_500_responses_are_not_retried(stub_server, breakers, retry_delays):
+    stub = stub_server("frankfurter", error_rate=1.0, error_status=500)
+
+    with pytest.raises(requests.HTTPError) as error:
+        request_rates()
+
+    assert error.value.response.status_code == 500
+    assert retry_delays == []
+    assert stub.requests_received == 1
+
+
+def test_503_responses_are_retried_a_bounded_number_of_times(stub_server, breakers, retry_delays):
+    stub = stub_server("frankfurter", error_rate=1.0, error_status=503)
+
+    with pytest.raises(requests.HTTPError) as error:
+        request_rates()
+
+    assert error.value.response.status_code == 503
+    assert stub.get_response_counts() == {503: configs.upstream_retry_attempts + 1}
+    # The first retry waits too
+    assert len(retry_delays) == configs.upstream_retry_attempts
+    assert all(delay >= configs.upstream_retry_backoff for delay in retry_delays)
+
+
+def test_connection_errors_are_retried(stub_server, breakers, retry_delays):
+    stub = stub_server("frankfurter")
+    # Nothing listens on the port anymore
+    stub.stop()
+
+    with pytest.raises(requests.ConnectionError):
+        request_rates()
+    assert len(retry_delays) == configs.upstream_retry_attempts
+
+
+def test_every_retry_waits_a_jittered_backoff():
+    retry = upstream_policy.build_retry()
+    assert retry.get_backoff_time() == 0.0
+
+    for retry_number in range(1, 5):
+        retry = retry.new(history=retry.history + (RequestHistory("GET", "/", None, 503, None),))
+        delay = min(configs.upstream_retry_backoff * 2 ** (retry_number - 1), configs.upstream_retry_backoff_max)
+        assert delay <= retry.get_backoff_time() <= delay + configs.upstream_retry_backoff
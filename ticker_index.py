@@ -0,0 +1,99 @@
+"""
+In-memory index of the tickers traded on B3.
+
+The index is built once every time the list of traded stocks is refreshed (see
+useful_functions.get_b3_traded_stocks) and answers, without touching the upstream API:
+
+    * exact membership                      -> "PETR4" in index
+    * prefix search (autocomplete)          -> binary search over the sorted tickers
+    * ticker root and share class searches  -> "PETR" -> PETR3, PETR4 | "11" -> every unit
+    * "did you mean" suggestions            -> tickers close to one that is not traded
+
+It also keeps the encoded /v1/b3stocks/all response, so that endpoint does not encode the whole list on
+every call.
+"""
+
+import bisect
+import difflib
+import re
+
+import response_encoding
+import standard_responses as sr
+
+# B3 tickers are a 4-character root (the company) followed by the share class: 3 (ON), 4 (PN), 11 (units),
+# 34 (BDRs), ... Fractional market tickers end with an extra F (PETR4F)
+TICKER_PATTERN = re.compile(r"^(?P<root>[A-Z0-9]{4})(?P<suffix>\d{1,2}F?)$")
+
+
+def split_ticker(ticker: str) -> tuple[str, str]:
+    """Splits a ticker into its root and share class suffix. Ex: PETR4 -> ('PETR', '4')"""
+    match = TICKER_PATTERN.match(ticker)
+    if match is None:
+        return ticker, ""
+    return match.group("root"), match.group("suffix")
+
+
+class TickerIndex:
+    """Sorted array of tickers plus lookup tables by root and by share class suffix"""
+
+    def __init__(self, tickers):
+        self.tickers = tuple(sorted(set(tickers)))
+        self._ticker_set = frozenset(self.tickers)
+
+        self.by_root = {}
+        self.by_suffix = {}
+        for ticker in self.tickers:
+            root, suffix = split_ticker(ticker)
+            self.by_root.setdefault(root, []).append(ticker)
+            self.by_suffix.setdefault(suffix, []).append(ticker)
+
+        # Body of the /v1/b3stocks/all response (and its compressed variants), encoded once per refresh
+        self.all_tickers_variants = response_encoding.encode_variants(
+            response_encoding.dumps(sr.StandardAPISuccessfulResponse(data=list(self.tickers)).to_dict())
+        )
+
+    def __contains__(self, ticker) -> bool:
+        return ticker in self._ticker_set
+
+    def __iter__(self):
+        return iter(self.tickers)
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def with_prefix(self, prefix: str) -> tuple:
+        """Returns every ticker starting with 'prefix', in alphabetical order"""
+        start = bisect.bisect_left(self.tickers, prefix)
+        # Every ticker starting with the prefix sorts before prefix + the highest character
+        end = bisect.bisect_left(self.tickers, prefix + "\uffff", lo=start)
+        return self.tickers[start:end]
+
+    def search(
+        self, prefix: str | None = None, root: str | None = None, suffix: str | None = None, limit: int = 10
+    ) -> dict:
+        """
+        Returns the tickers matching every given criteria (starting with 'prefix', with the given root and the
+        given share class suffix), at most 'limit' of them, and the total number of matches
+        """
+        if root is not None:
+            candidates = self.by_root.get(root, [])
+        elif prefix is not None:
+            candidates = self.with_prefix(prefix)
+        else:
+            candidates = self.by_suffix.get(suffix, [])
+
+        if prefix is not None and root is not None:
+            candidates = [ticker for ticker in candidates if ticker.startswith(prefix)]
+        if suffix is not None and (root is not None or prefix is not None):
+            candidates = [ticker for ticker in candidates if split_ticker(ticker)[1] == suffix]
+
+        return {"results": list(candidates[:limit]), "count": len(candidates)}
+
+    def suggest(self, ticker: str, limit: int = 3) -> list[str]:
+        """Returns the traded tickers most similar to a ticker that is not traded (ex: PETR5 -> PETR3, PETR4)"""
+        root, _ = split_ticker(ticker)
+        same_root = self.by_root.get(root)
+        if same_root:
+            return same_root[:limit]
+
+        return difflib.get_close_matches(ticker, self.tickers, n=limit, cutoff=0.6)
@@ -0,0 +1,267 @@
+"""
+Per-request traces and the structured JSON access log.
+
+Every request gets a trace: its ID (taken from the W3C traceparent or X-Request-ID headers, or a new one) and the
+spans of the stages it went through. Spans nest, and the time of a span minus the time of the spans inside it
+is added to its phase (spans running in parallel, such as the monthly rate requests, each add their own time):
+
+    validation    -> validate_*_endpoint_params
+    cache         -> lookups of the cached functions, quotes and views
+    upstream      -> requests to the FrankFurter and brapi APIs (host, status and bytes received)
+    reshape       -> building the response data from the rates and quotes
+    serialization -> JSON encoding and compression of the response
+
+The trace ID is returned in the X-Trace-ID header, the phases in the Server-Timing header, and the whole trace
+is written as one JSON line per request to the access log (configurations.access_log_path, or the
+ACCESS_LOG_PATH environment variable: a file path, "-" for the standard error or "off").
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import configurations as configs
+
+PHASES = ("validation", "cache", "upstream", "reshape", "serialization")
+
+TRACEPARENT_PATTERN = re.compile(r"^[0-9a-f]{2}-(?P<trace_id>[0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started_at = time.perf_counter()
+        self.spans = []
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        # Spans can be recorded by the threads of a pool working for the request
+        self._lock = threading.Lock()
+
+    def add_span(self, record: dict, self_seconds: float) -> None:
+        with self._lock:
+            self.phase_seconds[record["phase"]] = self.phase_seconds.get(record["phase"], 0.0) + self_seconds
+            self.spans.append(record)
+
+    def duration(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self) -> dict:
+        return {
+            "phasesMs": {phase: round(seconds * 1000, 3) for phase, seconds in self.phase_seconds.items()},
+            "spans": self.spans,
+        }
+
+
+def get_trace_id(headers) -> str:
+    """Continues the trace of the caller when it sent one, or starts a new one"""
+    match = TRACEPARENT_PATTERN.match(headers.get("traceparent", ""))
+    if match and match["trace_id"] != "0" * 32:
+        return match["trace_id"]
+
+    request_id = headers.get("X-Request-ID", "")
+    if REQUEST_ID_PATTERN.match(request_id):
+        return request_id
+
+    return uuid.uuid4().hex
+
+
+def start_trace(headers) -> Trace:
+    trace = Trace(get_trace_id(headers))
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def get_current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+def end_trace() -> None:
+    _current_trace.set(None)
+    _current_span.set(None)
+
+
+def covered_seconds(intervals: list[tuple[float, float]]) -> float:
+    """Time covered by the (start, end) intervals. Overlapping ones (spans running in parallel) count once"""
+    covered, covered_until = 0.0, float("-inf")
+    for start, end in sorted(intervals):
+        if end > covered_until:
+            covered += end - max(start, covered_until)
+            covered_until = end
+    return covered
+
+
+@contextmanager
+def span(phase: str, name: str | None = None, **attributes):
+    """
+    Records a span of the current trace. The yielded dict can receive more attributes while the span is open.
+    Without a trace (background refreshes, scripts), nothing is recorded
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield {}
+        return
+
+    parent = _current_span.get()
+    record = {"name": name or phase, "phase": phase, **attributes}
+    # (start, end) of the spans opened inside this one
+    record["_children"] = []
+    token = _current_span.set(record)
+    started_at = time.perf_counter()
+
+    try:
+        yield record
+    except BaseException as err:
+        record.setdefault("error", type(err).__name__)
+        raise
+    finally:
+        ended_at = time.perf_counter()
+        duration = ended_at - started_at
+        _current_span.reset(token)
+
+        children_seconds = covered_seconds(record.pop("_children"))
+        if parent is not None:
+            parent["_children"].append((started_at, ended_at))
+
+        record["startMs"] = round((started_at - trace.started_at) * 1000, 3)
+        record["durationMs"] = round(duration * 1000, 3)
+        trace.add_span(record, max(0.0, duration - children_seconds))
+
+
+def annotate(**attributes) -> None:
+    """Adds attributes (ex: the status of an upstream response) to the innermost open span, if any"""
+    record = _current_span.get()
+    if record is not None:
+        record.update(attributes)
+
+
+def traced(phase: str):
+    """Records every call of the decorated function as a span of 'phase', named after the function"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(phase, function.__name__):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def upstream_span(upstream: str, url: str):
+    """Span of a request to an upstream API. The status of failed requests is taken from the error"""
+    url_parts = urlsplit(url)
+    with span("upstream", upstream, host=url_parts.netloc, path=url_parts.path) as record:
+        try:
+            yield record
+        except Exception as err:
+            response = getattr(err, "response", None)
+            record["status"] = response.status_code if response is not None else type(err).__name__
+            raise
+
+
+def bind_to_current_trace(function):
+    """
+    Returns a version of 'function' that records its spans in the current trace (and span) even when it is
+    called by another thread, such as the workers of a thread pool
+    """
+    trace, parent = _current_trace.get(), _current_span.get()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        trace_token, span_token = _current_trace.set(trace), _current_span.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+
+    return wrapper
+
+
+def get_server_timing(trace: Trace) -> str:
+    """Server-Timing header with the time of each phase, shown by the browsers' developer tools"""
+    return ", ".join(
+        f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in trace.phase_seconds.items() if seconds
+    ) + f", total;dur={trace.duration() * 1000:.2f}"
+
+
+# -------- Access log ---------- #
+
+# WSGI environ key naming the origin of the requests the API sends to itself (ex: "cache-warming"). Clients can not
+# set it: their headers only reach the environ as HTTP_* keys
+INTERNAL_REQUEST_KEY = "financeapi.internal_request"
+
+access_logger = logging.getLogger("financeapi.access")
+access_logger.propagate = False
+
+# The access log is opened by the first request that is logged, so importing the API creates no file
+_access_log_configured = False
+_access_log_lock = threading.Lock()
+
+
+def configure_access_log() -> None:
+    """Sends the access log to the file (or standard error) set in ACCESS_LOG_PATH or configurations.py"""
+    global _access_log_configured
+
+    destination = os.environ.get("ACCESS_LOG_PATH") or str(configs.access_log_path)
+    access_logger.handlers.clear()
+    _access_log_configured = True
+
+    if destination.lower() == "off":
+        access_logger.disabled = True
+        return
+
+    if destination == "-":
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+        handler = logging.FileHandler(destination, encoding="utf-8")
+
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    access_logger.addHandler(handler)
+    access_logger.setLevel(logging.INFO)
+    access_logger.disabled = False
+
+
+def log_request(trace: Trace, request, response) -> None:
+    if not _access_log_configured:
+        with _access_log_lock:
+            if not _access_log_configured:
+                configure_access_log()
+
+    if access_logger.disabled or not access_logger.handlers:
+        return
+
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "traceId": trace.trace_id,
+        "method": request.method,
+        "path": request.path,
+        "query": request.query_string.decode("utf-8", "replace"),
+        "route": request.url_rule.rule if request.url_rule is not None else None,
+        "userAgent": request.user_agent.string or None,
+        "internalRequest": request.environ.get(INTERNAL_REQUEST_KEY),
+        "status": response.status_code,
+        "durationMs": round(trace.duration() * 1000, 3),
+        "bytes": response.content_length if not response.is_streamed else None,
+        "cacheStatus": response.headers.get("X-Cache-Status"),
+        "streamed": response.is_streamed,
+        **trace.to_dict(),
+    }
+    access_logger.info(json.dumps(record, separators=(",", ":")))
@@ -0,0 +1,206 @@
+"""
+Cache TTLs computed from what the cached data is, instead of fixed ones.
+
+    FX rates  -> the rates of a date stop changing once the ECB has published the rates of that date (or of the
+                 last TARGET business day before it, on weekends and holidays). Until then they are cached only
+                 until the next publication (around 16:00 CET), and once final they are kept for good
+                 (configurations.immutable_data_ttl)
+    B3 data   -> quotes, the stocks snapshot and the ticker list only change while the B3 trading session is
+                 open. During the session they get a short TTL, outside of it (nights, weekends and the B3
+                 holidays) they last until the next session opens
+
+Every TTL is a number of seconds. The functions returned by b3_session_ttl and fx_request_ttl take the time
+(Unix time) the data was fetched and can be passed as the 'fresh_ttl' of stale_cache (or to
+http_caching.policy_max_age). The ones returned by fx_params_ttl are the 'timeout' of stale_cache.cached_view.
+"""
+
+import functools
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from flask import request
+
+import configurations as configs
+import param_schemas
+
+ECB_TIMEZONE = ZoneInfo(configs.ecb_timezone)
+B3_TIMEZONE = ZoneInfo(configs.b3_timezone)
+
+
+# -------- Calendars ---------- #
+
+@functools.lru_cache(maxsize=64)
+def get_easter_sunday(year: int) -> date:
+    """Easter Sunday of 'year' (Gregorian calendar), which the movable holidays are relative to"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+@functools.lru_cache(maxsize=64)
+def get_target_holidays(year: int) -> frozenset:
+    """Days the ECB publishes no reference rates, besides the weekends (TARGET2 closing days)"""
+    easter = get_easter_sunday(year)
+    return frozenset(
+        {
+            date(year, 1, 1),
+            easter - timedelta(days=2),  # Good Friday
+            easter + timedelta(days=1),  # Easter Monday
+            date(year, 5, 1),
+            date(year, 12, 25),
+            date(year, 12, 26),
+        }
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def get_b3_holidays(year: int) -> frozenset:
+    """Days the B3 does not trade, besides the weekends"""
+    easter = get_easter_sunday(year)
+    holidays = {
+        date(year, 1, 1),
+        easter - timedelta(days=48),  # Carnival Monday
+        easter - timedelta(days=47),  # Carnival Tuesday
+        easter - timedelta(days=2),  # Good Friday
+        date(year, 4, 21),  # Tiradentes
+        date(year, 5, 1),
+        easter + timedelta(days=60),  # Corpus Christi
+        date(year, 9, 7),  # Independence Day
+        date(year, 10, 12),
+        date(year, 11, 2),
+        date(year, 11, 15),
+        date(year, 12, 24),
+        date(year, 12, 25),
+        date(year, 12, 31),
+    }
+    # Black Consciousness Day is a national holiday since 2024
+    if year >= 2024:
+        holidays.add(date(year, 11, 20))
+    return frozenset(holidays | {day for day in configs.b3_extra_holidays if day.year == year})
+
+
+def is_target_business_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in get_target_holidays(day.year)
+
+
+def is_b3_trading_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in get_b3_holidays(day.year)
+
+
+# -------- FX rates ---------- #
+
+def get_publication_time(day: date) -> float:
+    """When (Unix time) the rates of 'day' can be requested to the FrankFurter API"""
+    published_at = datetime.combine(day, configs.ecb_publication_time, tzinfo=ECB_TIMEZONE)
+    return published_at.timestamp() + configs.ecb_publication_delay
+
+
+def get_next_publication_day(now: float) -> date:
+    """The business day of the next publication of rates after 'now'"""
+    day = datetime.fromtimestamp(now, ECB_TIMEZONE).date()
+    while not is_target_business_day(day) or get_publication_time(day) <= now:
+        day += timedelta(days=1)
+    return day
+
+
+def get_latest_rates_day(requested_date: date, now: float) -> date:
+    """The day of the rates in force on 'requested_date' that are already published at 'now'"""
+    day = min(requested_date, datetime.fromtimestamp(now, ECB_TIMEZONE).date())
+    while not is_target_business_day(day) or get_publication_time(day) > now:
+        day -= timedelta(days=1)
+    return day
+
+
+def fx_rate_ttl(requested_date: str, published_date: str | None = None, now: float | None = None) -> float:
+    """
+    TTL of the rates in force on 'requested_date' (YYYY-MM-DD), fetched at 'now'. 'published_date' is the date
+    of the rates actually returned by the FrankFurter API, when it is known
+    """
+    now = time.time() if now is None else now
+    requested_day = date.fromisoformat(requested_date)
+
+    # The rates should already be published, but the FrankFurter API still returned older ones
+    if published_date is not None and published_date < get_latest_rates_day(requested_day, now).isoformat():
+        return configs.fx_unpublished_rate_ttl
+
+    next_publication_day = get_next_publication_day(now)
+    if next_publication_day <= requested_day:
+        return max(1.0, get_publication_time(next_publication_day) - now)
+
+    # Final, but without the date of the rates there is no telling whether the latest publication was picked up
+    today = datetime.fromtimestamp(now, ECB_TIMEZONE).date()
+    if published_date is None and requested_day >= today:
+        return configs.fx_latest_rate_ttl
+
+    return configs.immutable_data_ttl
+
+
+def fx_request_ttl(date_param: str):
+    """
+    TTL function of the responses of an FX endpoint, whose data is final once the date in 'date_param' is.
+    Requests without the date get the latest rates. Must be called in the context of the request
+    """
+
+    def ttl(fetched_at: float) -> float:
+        requested_date = param_schemas.normalize_date(request.args.get(date_param) or "")
+        if requested_date is None:
+            requested_date = datetime.fromtimestamp(fetched_at, ECB_TIMEZONE).date().isoformat()
+        return fx_rate_ttl(requested_date, now=fetched_at)
+
+    return ttl
+
+
+def fx_params_ttl(date_key: str):
+    """
+    TTL function of the cached responses of an FX endpoint (the 'timeout' of stale_cache.cached_view), whose data
+    is final once the date in params[date_key] of the parsed parameters is
+    """
+
+    def ttl(params: dict, fetched_at: float) -> float:
+        return fx_rate_ttl(params[date_key], now=fetched_at)
+
+    return ttl
+
+
+# -------- B3 trading session ---------- #
+
+def get_next_session_open(now: float) -> float:
+    """When (Unix time) the next B3 trading session opens after 'now'"""
+    day = datetime.fromtimestamp(now, B3_TIMEZONE).date()
+    while True:
+        if is_b3_trading_day(day):
+            opens_at = datetime.combine(day, configs.b3_session_open, tzinfo=B3_TIMEZONE).timestamp()
+            if opens_at > now:
+                return opens_at
+        day += timedelta(days=1)
+
+
+def b3_session_is_open(now: float) -> bool:
+    moment = datetime.fromtimestamp(now, B3_TIMEZONE)
+    return (
+        is_b3_trading_day(moment.date())
+        and configs.b3_session_open <= moment.time() < configs.b3_session_close
+    )
+
+
+def b3_market_ttl(session_ttl: float, now: float | None = None) -> float:
+    """
+    TTL of B3 data fetched at 'now': 'session_ttl' while the trading session is open, or until the next session
+    opens otherwise
+    """
+    now = time.time() if now is None else now
+    if b3_session_is_open(now):
+        return session_ttl
+    return max(session_ttl, get_next_session_open(now) - now)
+
+
+def b3_session_ttl(session_ttl: float):
+    """TTL function of B3 data whose TTL is 'session_ttl' during the trading session"""
+    return functools.partial(b3_market_ttl, session_ttl)
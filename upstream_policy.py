@@ -0,0 +1,254 @@
+"""
+Circuit breakers and retry policy of the upstream APIs (FrankFurter and brapi).
+
+Each upstream API has its own circuit breaker. It keeps the outcome of the last calls and trips (opens) when
+too many of them failed (timeouts, connection errors, 5xx and 429 responses) or were too slow. While it is
+open, the calls to that API fail at once with UpstreamUnavailableError instead of waiting for the timeout, so
+the stale cache entries are served and no worker thread is held by an API that is down. After 'open_seconds',
+a few probe calls are let through (half-open): if they succeed the breaker closes, otherwise it opens again.
+
+Idempotent GET requests that could not connect or got a 502, 503 or 504 response are retried a bounded number of
+times, waiting an exponential backoff with random jitter before each retry. Read timeouts are never retried.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from itertools import takewhile
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import configurations as configs
+import custom_exceptions
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_upstream_failure(err: BaseException) -> bool:
+    """
+    Tells if an error means the upstream API is unhealthy. Client errors (400, 401, 404, ...) are answers of a
+    healthy API and do not count, except 429 (we are being throttled)
+    """
+    if isinstance(err, requests.HTTPError):
+        status_code = err.response.status_code if err.response is not None else None
+        return status_code is None or status_code >= 500 or status_code == 429
+    return isinstance(err, requests.RequestException)
+
+
+class CircuitBreaker:
+    """Keeps the health of one upstream API and decides if calls to it are allowed"""
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        minimum_calls: int = 5,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 3.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 2,
+    ):
+        self.name = name
+        self.minimum_calls = minimum_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        # (failed, slow) outcome of the last 'window_size' calls
+        self._outcomes = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = None
+        self._half_open_calls = 0
+
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _update_state(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def retry_after(self) -> int:
+        """Seconds left until the open breaker lets probe calls through"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(1, int(self.open_seconds - (time.monotonic() - self._opened_at) + 0.999))
+
+    def allow_request(self) -> None:
+        """Raises UpstreamUnavailableError if the API must not be called right now"""
+        with self._lock:
+            self._update_state()
+
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return
+
+            self.rejected_calls += 1
+
+        raise custom_exceptions.UpstreamUnavailableError(
+            f"The {self.name} API is unavailable at the moment. Please try again later.",
+            retry_after=self.retry_after(),
+        )
+
+    def record(self, failed: bool, duration: float) -> None:
+        """Records the outcome of an allowed call"""
+        slow = duration >= self.slow_call_seconds
+
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                elif self._half_open_calls >= self.half_open_max_calls:
+                    # Every probe call succeeded
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+
+            if self._state != CLOSED:
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.minimum_calls:
+                return
+
+            failure_rate = sum(outcome[0] for outcome in self._outcomes) / calls
+            slow_call_rate = sum(outcome[1] for outcome in self._outcomes) / calls
+            if failure_rate >= self.failure_rate_threshold or slow_call_rate >= self.slow_call_rate_threshold:
+                self._open()
+
+    def call(self, function):
+        """Calls 'function' through the breaker"""
+        self.allow_request()
+
+        started_at = time.monotonic()
+        try:
+            result = function()
+        except BaseException as err:
+            self.record(is_upstream_failure(err), time.monotonic() - started_at)
+            raise
+
+        self.record(False, time.monotonic() - started_at)
+        return result
+
+    def snapshot(self) -> dict:
+        """State of the breaker, for monitoring"""
+        with self._lock:
+            self._update_state()
+            calls = len(self._outcomes)
+            return {
+                "state": self._state,
+                "recentCalls": calls,
+                "failureRate": sum(outcome[0] for outcome in self._outcomes) / calls if calls else 0.0,
+                "slowCallRate": sum(outcome[1] for outcome in self._outcomes) / calls if calls else 0.0,
+                "timesOpened": self.times_opened,
+                "rejectedCalls": self.rejected_calls,
+            }
+
+
+# One breaker per upstream API
+breakers = {
+    upstream: CircuitBreaker(upstream, **settings)
+    for upstream, settings in configs.upstream_circuit_breakers.items()
+}
+
+
+def get_breaker_states() -> dict:
+    return {upstream: breaker.snapshot() for upstream, breaker in breakers.items()}
+
+
+def _breaker_state_values() -> dict:
+    values = {}
+    for upstream, snapshot in get_breaker_states().items():
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            values[(upstream, state)] = int(snapshot["state"] == state)
+    return values
+
+
+metrics.CIRCUIT_BREAKER_STATE.add_source(_breaker_state_values)
+metrics.CIRCUIT_BREAKER_REJECTED.add_source(
+    lambda: {(upstream,): breaker.rejected_calls for upstream, breaker in breakers.items()}
+)
+metrics.CIRCUIT_BREAKER_OPENED.add_source(
+    lambda: {(upstream,): breaker.times_opened for upstream, breaker in breakers.items()}
+)
+
+
+# -------- Retry policy ---------- #
+
+class JitteredRetry(Retry):
+    """
+    urllib3's Retry sends the first retry at once and only waits before the next ones. This one waits before every
+    retry: backoff_factor * 2 ** (N - 1) (at most backoff_max) before retry N, plus a random jitter of up to
+    backoff_jitter
+    """
+
+    def get_backoff_time(self) -> float:
+        # Only the last errors in a row count, like in urllib3 (redirects are not errors)
+        retry_number = len(list(takewhile(lambda entry: entry.redirect_location is None, reversed(self.history))))
+        if retry_number == 0:
+            return 0.0
+
+        delay = min(self.backoff_factor * 2 ** (retry_number - 1), self.backoff_max)
+        return delay + random.uniform(0, self.backoff_jitter)
+
+
+def build_retry() -> Retry:
+    """
+    Retry policy of the 'requests' sessions: idempotent GETs only, bounded, with jittered backoff. Only connection
+    errors and the statuses of configurations.upstream_retry_statuses are retried, never a read timeout
+    """
+    return JitteredRetry(
+        total=configs.upstream_retry_attempts,
+        connect=configs.upstream_retry_attempts,
+        # Read timeouts are raised at once, as requests.ReadTimeout
+        read=False,
+        other=0,
+        status=configs.upstream_retry_attempts,
+        allowed_methods=frozenset({"GET"}),
+        status_forcelist=configs.upstream_retry_statuses,
+        backoff_factor=configs.upstream_retry_backoff,
+        backoff_jitter=configs.upstream_retry_backoff,
+        backoff_max=configs.upstream_retry_backoff_max,
+        # The last response is returned, so raise_for_status() raises the usual HTTPError
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+
+
+def mount_upstream_adapters(session: requests.Session, base_urls: dict) -> None:
+    """Gives each upstream API ({upstream: base URL}) a connection pool of its own, sized in configurations.py"""
+    for upstream, base_url in base_urls.items():
+        session.mount(
+            base_url,
+            HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=configs.upstream_pool_maxsize[upstream],
+                max_retries=build_retry(),
+            ),
+        )
@@ -0,0 +1,447 @@
+"""
+Synthetic, deterministic responses of the FrankFurter and brapi APIs.
+
+They follow the shape of the real responses closely enough for every endpoint of this API to run end to end,
+without network access and without spending brapi's request quota. The same date (or ticker) always gets the
+same values, so repeated runs measure the same work.
+
+    frankfurter_response -> /v1/{date} and /v1/{start_date}..{end_date}
+    brapi_response       -> /available, /quote/list and /quote/{tickers}
+    install              -> replaces the consume_* functions of useful_functions with in-process stubs
+    StubServer           -> serves the same responses over HTTP, with configurable latency and faults
+
+The HTTP stubs let the API run unchanged (FRANKFURTER_API_BASE_URL and BRAPI_API_BASE_URL pointed to them),
+which is what the load tests (load_test.py) use. They can also be started on their own:
+
+    python upstream_stubs.py --frankfurter-port 8081 --brapi-port 8082 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+# Approximate EUR-based rate of each currency. The stub rates oscillate around them
+EUR_BASE_RATES = {
+    "AUD": 1.65, "BGN": 1.96, "BRL": 5.9, "CAD": 1.48, "CHF": 0.95, "CNY": 7.8, "CZK": 25.2, "DKK": 7.46,
+    "GBP": 0.85, "HKD": 8.4, "HUF": 395.0, "IDR": 17400.0, "ILS": 4.0, "INR": 90.0, "ISK": 150.0, "JPY": 160.0,
+    "KRW": 1480.0, "MXN": 19.5, "MYR": 4.9, "NOK": 11.6, "NZD": 1.8, "PHP": 62.0, "PLN": 4.3, "RON": 4.97,
+    "SEK": 11.3, "SGD": 1.45, "THB": 38.0, "TRY": 36.0, "USD": 1.08, "ZAR": 20.0,
+}
+
+# Tickers of real, well known companies. The rest of the stub market is generated from them
+KNOWN_ROOTS = ("PETR", "VALE", "ITUB", "BBDC", "BBAS", "ABEV", "WEGE", "MGLU", "RENT", "SUZB", "TAEE", "B3SA")
+
+# Number of generated company roots, each traded as ON (3) and PN (4) shares
+GENERATED_ROOTS = 400
+
+# Days of daily history in each brapi range
+RANGE_DAYS = {
+    "1d": 1, "5d": 7, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653, "max": 7305,
+}
+# Calendar days between two bars of each brapi interval
+INTERVAL_DAYS = {"1d": 1, "5d": 5, "1wk": 7, "1mo": 30, "3mo": 91}
+
+B3_SECTORS = (
+    "Commercial Services", "Communications", "Consumer Durables", "Consumer Non-Durables", "Consumer Services",
+    "Distribution Services", "Electronic Technology", "Energy Minerals", "Finance", "Health Services",
+    "Health Technology", "Industrial Services", "Miscellaneous", "Non-Energy Minerals", "Process Industries",
+    "Producer Manufacturing", "Retail Trade", "Technology Services", "Transportation", "Utilities",
+)
+
+
+# -------- FrankFurter ---------- #
+
+def business_days(start: date, end: date) -> list[date]:
+    days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+    return [day for day in days if day.weekday() < 5]
+
+
+def last_business_day(day: date) -> date:
+    day = min(day, date.today())
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def eur_rates(day: date) -> dict:
+    """EUR-based rates of a business day. Each currency follows its own slow wave around its base rate"""
+    ordinal = day.toordinal()
+    return {
+        currency: round(rate * (1 + 0.08 * math.sin(ordinal / (40 + i) + i)), 6)
+        for i, (currency, rate) in enumerate(EUR_BASE_RATES.items())
+    }
+
+
+def convert_rates(day: date, base: str, amount: float, symbols: list[str] | None) -> dict:
+    rates = {"EUR": 1.0, **eur_rates(day)}
+    converted = {
+        currency: round(amount * rate / rates[base], 5) for currency, rate in rates.items() if currency != base
+    }
+    if symbols:
+        converted = {currency: rate for currency, rate in converted.items() if currency in symbols}
+    return converted
+
+
+def frankfurter_response(endpoint: str, params: dict | None = None) -> dict:
+    """Response of the FrankFurter API to GET /v1/{date} or /v1/{start_date}..{end_date}"""
+    params = params or {}
+    base = params.get("base", "EUR")
+    amount = float(params.get("amount", 1))
+    symbols = params["symbols"].split(",") if params.get("symbols") else None
+
+    path = endpoint.strip("/").split("/")[-1]
+
+    if ".." in path:
+        start, end = (date.fromisoformat(part) for part in path.split(".."))
+        # Like the real API, the interval starts at the last business day on or before the start date
+        days = business_days(last_business_day(start), min(end, date.today()))
+        return {
+            "amount": amount,
+            "base": base,
+            "start_date": days[0].isoformat() if days else start.isoformat(),
+            "end_date": days[-1].isoformat() if days else end.isoformat(),
+            "rates": {day.isoformat(): convert_rates(day, base, amount, symbols) for day in days},
+        }
+
+    day = last_business_day(date.fromisoformat(path) if path != "latest" else date.today())
+    return {
+        "amount": amount,
+        "base": base,
+        "date": day.isoformat(),
+        "rates": convert_rates(day, base, amount, symbols),
+    }
+
+
+# -------- brapi ---------- #
+
+def generated_root(i: int) -> str:
+    letters = ""
+    for _ in range(4):
+        i, letter = divmod(i, 26)
+        letters += chr(ord("A") + letter)
+    return letters
+
+
+def get_stub_tickers() -> list[str]:
+    roots = list(KNOWN_ROOTS) + [generated_root(i * 7919) for i in range(GENERATED_ROOTS)]
+    tickers = []
+    for i, root in enumerate(roots):
+        tickers += [root + "3", root + "4"]
+        if i % 10 == 0:
+            tickers.append(root + "11")
+    return tickers
+
+
+STUB_TICKERS = get_stub_tickers()
+
+
+def ticker_seed(ticker: str) -> int:
+    return sum((i + 1) * ord(character) for i, character in enumerate(ticker))
+
+
+def stock_summary(ticker: str) -> dict:
+    """Entry of a stock in brapi's /quote/list response"""
+    seed = ticker_seed(ticker)
+    close = round(5 + seed % 9500 / 100, 2)
+    return {
+        "stock": ticker,
+        "name": f"{ticker[:4]} S.A.",
+        "close": close,
+        "change": round((seed % 1000 - 500) / 100, 2),
+        "volume": seed * 1013 % 50_000_000,
+        "market_cap": round(close * (seed * 7 % 5_000_000_000)),
+        "logo": f"https://icons.brapi.dev/icons/{ticker}.svg",
+        "sector": B3_SECTORS[seed % len(B3_SECTORS)],
+        "type": "fund" if ticker.endswith("11") else "stock",
+    }
+
+
+def quote_list_response(params: dict) -> dict:
+    stocks = [stock_summary(ticker) for ticker in STUB_TICKERS]
+    if params.get("type"):
+        stocks = [stock for stock in stocks if stock["type"] == params["type"]]
+    if params.get("sector"):
+        stocks = [stock for stock in stocks if stock["sector"] == params["sector"]]
+
+    limit = int(params.get("limit") or len(stocks) or 1)
+    page = int(params.get("page") or 1)
+    total_pages = max(1, math.ceil(len(stocks) / limit))
+
+    return {
+        "indexes": [{"stock": "^BVSP", "name": "IBOVESPA"}],
+        "stocks": stocks[(page - 1) * limit : page * limit],
+        "availableSectors": list(B3_SECTORS),
+        "availableStockTypes": ["stock", "fund", "bdr"],
+        "currentPage": page,
+        "totalPages": total_pages,
+        "itemsPerPage": limit,
+        "totalCount": len(stocks),
+        "hasNextPage": page < total_pages,
+    }
+
+
+def history_bars(ticker: str, history_range: str, interval: str) -> list[dict]:
+    """Bars of brapi's 'historicalDataPrice', ending today"""
+    today = date.today()
+    if history_range == "ytd":
+        first_day = date(today.year, 1, 1)
+    else:
+        first_day = today - timedelta(days=RANGE_DAYS.get(history_range, 31) - 1)
+
+    step = INTERVAL_DAYS.get(interval, 1)
+    days = business_days(first_day, today)[::step]
+    seed = ticker_seed(ticker)
+
+    bars = []
+    for day in days:
+        close = round(20 + 10 * math.sin(day.toordinal() / 25 + seed) + seed % 50, 2)
+        bars.append({
+            "date": int(datetime(day.year, day.month, day.day, 13, tzinfo=timezone.utc).timestamp()),
+            "open": round(close * 0.995, 2),
+            "high": round(close * 1.01, 2),
+            "low": round(close * 0.99, 2),
+            "close": close,
+            "volume": (seed * day.toordinal()) % 20_000_000,
+            "adjustedClose": close,
+        })
+    return bars
+
+
+def quote_result(ticker: str, params: dict) -> dict:
+    summary = stock_summary(ticker)
+    result = {
+        "currency": "BRL",
+        "shortName": summary["name"],
+        "longName": summary["name"],
+        "symbol": ticker,
+        "regularMarketPrice": summary["close"],
+        "regularMarketChange": summary["change"],
+        "regularMarketChangePercent": round(summary["change"] / summary["close"] * 100, 4),
+        "regularMarketTime": datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        "regularMarketVolume": summary["volume"],
+        "marketCap": summary["market_cap"],
+        "logourl": summary["logo"],
+    }
+
+    if params.get("range"):
+        result["usedRange"] = params["range"]
+        result["usedInterval"] = params.get("interval", "1d")
+        result["historicalDataPrice"] = history_bars(ticker, params["range"], params.get("interval", "1d"))
+    if str(params.get("fundamental", "false")).lower() == "true":
+        result["priceEarnings"] = round(5 + ticker_seed(ticker) % 300 / 10, 2)
+        result["earningsPerShare"] = round(summary["close"] / result["priceEarnings"], 4)
+    if str(params.get("dividends", "false")).lower() == "true":
+        result["dividendsData"] = {"cashDividends": [], "stockDividends": [], "subscriptions": []}
+
+    return result
+
+
+def brapi_response(endpoint: str, params: dict | None = None) -> dict:
+    """Response of brapi to GET /available, /quote/list or /quote/{tickers}"""
+    params = params or {}
+    path = endpoint.strip("/")
+
+    if path == "available":
+        return {"indexes": ["^BVSP"], "stocks": list(STUB_TICKERS)}
+    if path == "quote/list":
+        return quote_list_response(params)
+    if path.startswith("quote/"):
+        return {
+            "results": [quote_result(ticker, params) for ticker in path.split("/", 1)[1].split(",")],
+            "requestedAt": datetime.now(timezone.utc).isoformat(),
+        }
+
+    response = requests.Response()
+    response.status_code = 404
+    raise requests.HTTPError(f"404 Client Error: Not Found for url: {endpoint}", response=response)
+
+
+# -------- In-process stubs ---------- #
+
+# (upstream, first path segment) -> number of calls received by the stubs
+calls = Counter()
+
+
+def install() -> None:
+    """
+    Replaces the functions of useful_functions that call the FrankFurter and brapi APIs with the stubs above.
+    Only the synchronous upstream mode goes through them
+    """
+    import useful_functions as uf
+
+    def consume_frankfurter_api(endpoint: str, params: dict | None = None, http_session=None) -> dict:
+        calls[("frankfurter", endpoint.strip("/").split("/")[0])] += 1
+        return frankfurter_response(endpoint, params)
+
+    def consume_brapi_api(endpoint: str, params: dict | None = None, http_session=None) -> dict:
+        calls[("brapi", endpoint.strip("/").split("/")[0])] += 1
+        return brapi_response(endpoint, params)
+
+    uf.consume_frankfurter_api = consume_frankfurter_api
+    uf.consume_brapi_api = consume_brapi_api
+
+
+# -------- HTTP stub servers ---------- #
+
+class FaultProfile:
+    """
+    How a stub server misbehaves: every response waits 'latency' seconds (plus up to 'jitter' more), and a
+    fraction of the requests is answered with 429 Too Many Requests ('rate_limit_rate') or with an error status
+    ('error_rate', 503 Service Unavailable unless 'error_status' says otherwise) instead of the data
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        error_status: int = 503,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.error_status = error_status
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once
+    request_queue_size = 128
+
+
+class StubServer:
+    """Serves the stub responses of one upstream API ('frankfurter' or 'brapi') over HTTP, in a background thread"""
+
+    def __init__(self, api: str, host: str = "127.0.0.1", port: int = 0, faults: FaultProfile | None = None):
+        self.api = api
+        self.faults = faults or FaultProfile()
+        # status code -> number of responses sent
+        self.responses = Counter()
+        self._lock = threading.Lock()
+        self._server = StubHTTPServer((host, port), self._build_handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        # brapi's paths live under /api, like on https://brapi.dev/api
+        return f"http://{host}:{port}" + ("/api" if self.api == "brapi" else "")
+
+    @property
+    def requests_received(self) -> int:
+        with self._lock:
+            return sum(self.responses.values())
+
+    def get_response_counts(self) -> dict:
+        with self._lock:
+            return dict(self.responses)
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"{self.api}-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, path: str, params: dict) -> tuple[int, dict, dict]:
+        """Returns the (status, headers, JSON body) of a request, after the configured latency and faults"""
+        faults = self.faults
+        delay = faults.latency + (random.uniform(0, faults.jitter) if faults.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        draw = random.random()
+        if draw < faults.rate_limit_rate:
+            return 429, {"Retry-After": "1"}, {"error": True, "message": "Too many requests"}
+        if draw < faults.rate_limit_rate + faults.error_rate:
+            return faults.error_status, {}, {"error": True, "message": "Service unavailable"}
+
+        try:
+            if self.api == "frankfurter":
+                return 200, {}, frankfurter_response(path, params)
+            return 200, {}, brapi_response(path.removeprefix("/api"), params)
+        except requests.HTTPError as err:
+            return err.response.status_code, {}, {"error": True, "message": str(err)}
+        except ValueError as err:
+            return 400, {}, {"error": True, "message": str(err)}
+
+    def _build_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so the connection pools of the API are exercised like with the real services
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, headers, body = stub._respond(url.path, dict(parse_qsl(url.query)))
+                encoded_body = json.dumps(body).encode()
+
+                # Counted before the response is sent, so a client that got it also finds it in the counts
+                with stub._lock:
+                    stub.responses[status] += 1
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded_body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(encoded_body)
+
+            def log_message(self, format, *args):
+                # One line per request would flood the output of a load test
+                pass
+
+        return Handler
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each upstream response takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction answered with 429")
+
+
+def get_fault_profile(args: argparse.Namespace) -> FaultProfile:
+    return FaultProfile(args.latency, args.jitter, args.error_rate, args.rate_limit_rate)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serves stub FrankFurter and brapi APIs over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--frankfurter-port", type=int, default=8081)
+    parser.add_argument("--brapi-port", type=int, default=8082)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    servers = [
+        StubServer("frankfurter", args.host, args.frankfurter_port, get_fault_profile(args)).start(),
+        StubServer("brapi", args.host, args.brapi_port, get_fault_profile(args)).start(),
+    ]
+    print(f"FRANKFURTER_API_BASE_URL={servers[0].base_url}")
+    print(f"BRAPI_API_BASE_URL={servers[1].base_url}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
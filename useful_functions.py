@@ -1,22 +1,64 @@
 import requests
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from requests import RequestException, HTTPError
 import custom_exceptions
-from dotenv import load_dotenv
+import rate_store
+import single_flight
+import stale_cache
+import shared_cache
+import upstream_policy
+import metrics
+import tracing
+import ticker_index
+import param_schemas
+import ttl_policy
+import stock_screener
+import response_encoding
+import fx_analytics
+import price_indicators
+import configurations as configs
 from pathlib import Path
 import os
-from cachetools import cached, TTLCache
-
-# loading the enviormental variables
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from cachetools import cached
+from cachetools.keys import hashkey
+
+# loading the enviormental variables. dotenv is only imported when there is a .env file to load
 DOTENV_PATH = Path(__file__).parent / ".env"
-load_dotenv(str(DOTENV_PATH))
+if DOTENV_PATH.exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(str(DOTENV_PATH))
 
-# External APIs will use
-FRANKFURTER_API_BASE_URL = "https://api.frankfurter.dev"
-BRAPI_API_BASE_URL = "https://brapi.dev/api"
+# External APIs will use. They can be pointed to local stub servers through the environment variables
+FRANKFURTER_API_BASE_URL = os.environ.get("FRANKFURTER_API_BASE_URL") or "https://api.frankfurter.dev"
+BRAPI_API_BASE_URL = os.environ.get("BRAPI_API_BASE_URL") or "https://brapi.dev/api"
 
-# Establishing our http session to send requests
+# Establishing our http session to send requests. Each upstream API gets a connection pool of its own, and the
+# failed GET requests are retried with a jittered backoff (see upstream_policy)
 session = requests.Session()
+upstream_policy.mount_upstream_adapters(
+    session, {"frankfurter": FRANKFURTER_API_BASE_URL, "brapi": BRAPI_API_BASE_URL}
+)
+
+# Workers used to send independent upstream requests of a single API request in parallel (the missing monthly
+# segments of an interval conversion, the ticker batches of a multi-ticker quote, ...). Created on first use, so
+# importing this module starts no threads
+_upstream_fetch_executor = None
+_upstream_fetch_executor_lock = threading.Lock()
+
+
+def get_upstream_fetch_executor() -> ThreadPoolExecutor:
+    global _upstream_fetch_executor
+
+    if _upstream_fetch_executor is None:
+        with _upstream_fetch_executor_lock:
+            if _upstream_fetch_executor is None:
+                _upstream_fetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upstream-fetch")
+    return _upstream_fetch_executor
 
 
 def get_api_basic_info() -> dict:
@@ -40,7 +82,9 @@ def get_api_basic_info() -> dict:
                 "/v1/conversion/historical?from=USD&to=BRL&amount=1",
                 "/v1/conversion/historical?from=USD&to=BRL&amount=1&date=2025-10-12",
                 "/v1/conversion/interval?from=USD&to=BRL&start_date=2025-01-09&end_date=2025-02-09",
+                "/v1/conversion/analytics?from=USD&to=BRL&start_date=2024-01-01&end_date=2024-12-31",
                 "/v1/b3stocks/all",
+                "/v1/b3stocks/search?prefix=PETR",
                 "/v1/b3stocks/quote?ticker=PETR3&range=5d&interval=1d",
                 "/v1/b3stocks/stocksinfo?sector=Retail+Trade&limit=10&sortedBy=volume",
             ]
@@ -84,38 +128,28 @@ def get_existing_currencies() -> dict:
     }
 
 
+SUPPORTED_CURRENCIES = frozenset(get_existing_currencies())
+
+
 def currency_exists(currency: str) -> bool:
     """Verifies if the given currency exists"""
-    currencies = get_existing_currencies()
-    return True if currency in currencies.keys() else False
+    return currency in SUPPORTED_CURRENCIES
 
 
 def date_is_real(str_date: str) -> bool:
     """Checks if a given date in string format is equivalent to a real date"""
-    date_formats = ["%Y-%m-%d", "%d-%m-%Y"]
-    for date_format in date_formats:
-        try:
-            datetime.strptime(str_date, date_format)
-            return True
-        except ValueError:
-            continue
-
-    return False
+    return param_schemas.normalize_date(str_date) is not None
 
 
 def get_formatted_date(str_date: str) -> str:
     """This function converts a given date in string format to the following pattern: %Y-%m-%d, and returns it"""
-    if not date_is_real(str_date):
+    formatted_date = param_schemas.normalize_date(str_date)
+    if formatted_date is None:
         raise custom_exceptions.NonExistentDateError(
             f"The following date does not exist: {str_date}"
         )
 
-    try:
-        formatted_date = datetime.strptime(str_date, "%Y-%m-%d")
-    except ValueError:
-        formatted_date = datetime.strptime(str_date, "%d-%m-%Y")
-
-    return formatted_date.date().isoformat()
+    return formatted_date
 
 
 def consume_frankfurter_api(
@@ -126,106 +160,606 @@ def consume_frankfurter_api(
 
     url = f"{FRANKFURTER_API_BASE_URL}/{clean_endpoint}"
 
-    # Consuming the API
-    response = http_session.get(url, params=params, timeout=10)
+    def send_request() -> dict | None:
+        with metrics.observe_upstream_request("frankfurter"):
+            # Consuming the API
+            response = http_session.get(url, params=params, timeout=configs.upstream_timeouts)
 
-    # automatically raises an exception if the HTTPS request returned an unsuccessful status code
-    response.raise_for_status()
+            # automatically raises an exception if the HTTPS request returned an unsuccessful status code
+            response.raise_for_status()
 
-    return response.json()
+        tracing.annotate(status=response.status_code, bytes=len(response.content))
+        return response.json()
 
+    def send_request_through_breaker() -> dict | None:
+        # Fails at once, without waiting for the timeout, while the FrankFurter API is unhealthy
+        return upstream_policy.breakers["frankfurter"].call(send_request)
 
-def validate_historical_endpoint_params(request) -> dict:
+    # Identical requests sent at the same time by other threads share a single call to the API. Waiting for the
+    # call of another thread counts as upstream time too
+    with tracing.upstream_span("frankfurter", url):
+        return single_flight.upstream_requests.do(
+            "frankfurter",
+            ("frankfurter",) + single_flight.request_key(clean_endpoint, params),
+            send_request_through_breaker,
+        )
+
+
+def get_fx_rate_store() -> rate_store.FXRateStore:
+    """Returns the local store holding the EUR-based history of every currency we are able to convert"""
+    return rate_store.get_rate_store(list(get_currency_index().keys()))
+
+
+# -------- Cross-rate engine ---------- #
+# Every conversion is derived from a single vector of EUR-based rates per date (one position per currency in
+# get_existing_currencies()). USD->BRL, EUR->BRL and BRL->JPY for the same date therefore share one upstream
+# request and one cache entry, and are computed locally with a vectorized division.
+
+@cached(cache={})
+def get_currency_index() -> dict:
+    """Returns the position of each supported currency in the EUR-based rate vectors"""
+    return {currency: i for i, currency in enumerate(get_existing_currencies().keys())}
+
+
+def eur_rates_to_vector(rates: dict) -> np.ndarray:
     """
-    This function validates the URL parameters passed in the request to the historical endpoin and returns them
-    pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
-    the function raises an error.
+    Converts the EUR-based rates returned by the FrankFurter API ({"BRL": 6.1, ...}) into a rate vector.
+    Currencies that were not quoted are stored as NaN
     """
-    from_currency = request.args.get("from") or "USD"
-    to_currencies = request.args.get("to")
-    amount = request.args.get("amount") or "1"
-    date = request.args.get("date") or datetime.now().date().isoformat()
+    currency_index = get_currency_index()
+    vector = np.full(len(currency_index), np.nan, dtype=np.float64)
 
-    # --Validating the parameters-- #
-    if not currency_exists(from_currency):
-        raise custom_exceptions.BadRequestError(
-            f"The following currency is not supported: {from_currency}"
+    for currency, rate in rates.items():
+        if currency in currency_index:
+            vector[currency_index[currency]] = rate
+    vector[currency_index["EUR"]] = 1.0
+
+    return vector
+
+
+def rate_cache_time_to_use(key, value, now) -> float:
+    """
+    Rates stop changing once the ECB has published the ones of their date, and are cached for good from then on.
+    Until then they expire at the next publication (see ttl_policy)
+    """
+    # The last positional argument of the cached functions is always the (end) date in YYYY-MM-DD format
+    published_date = None
+    if isinstance(value, tuple) and value:
+        # (date, rates) of fetch_eur_rate_vector or (days, rates) of fetch_eur_rate_segment. The date of the rates
+        # returned tells whether the FrankFurter API is late to publish the ones of the requested date
+        if isinstance(value[0], str):
+            published_date = value[0]
+        elif isinstance(value[0], list) and value[0]:
+            published_date = value[0][-1]
+    return now + ttl_policy.fx_rate_ttl(key[-1], published_date)
+
+
+@cached(
+    shared_cache.make_function_cache("eur_rate_vector", maxsize=4096, ttu=rate_cache_time_to_use),
+    lock=threading.Lock(),
+    info=True,
+)
+def fetch_eur_rate_vector(str_date: str) -> tuple[str, np.ndarray]:
+    """Requests the EUR-based rates in force on the given date to the FrankFurter API"""
+    response = consume_frankfurter_api(endpoint=f"/v1/{str_date}", params={"base": "EUR"})
+    return response["date"], eur_rates_to_vector(response["rates"])
+
+
+metrics.track_cached_function("eur_rate_vector", fetch_eur_rate_vector)
+
+
+# Interval conversions are cached one calendar month (segment) at a time. Overlapping intervals such as
+# Jan-Jun and Feb-Jul reuse the same segments, so the memory used grows with the distinct days requested
+# and not with the number of distinct intervals. Intervals longer than configurations.interval_max_month_segments
+# months are cached whole, as a single segment
+@cached(
+    shared_cache.make_function_cache("eur_rate_segment", maxsize=2048, ttu=rate_cache_time_to_use),
+    lock=threading.Lock(),
+    info=True,
+)
+def fetch_eur_rate_segment(start_date: str, end_date: str) -> tuple[list[str], np.ndarray]:
+    """Requests the EUR-based rates of every business day between the given dates to the FrankFurter API"""
+    response = consume_frankfurter_api(
+        endpoint=f"/v1/{start_date}..{end_date}", params={"base": "EUR"}
+    )
+    return eur_rate_table_from_response(response)
+
+
+metrics.track_cached_function("eur_rate_segment", fetch_eur_rate_segment)
+
+
+def eur_rate_table_from_response(response: dict) -> tuple[list[str], np.ndarray]:
+    """Converts a FrankFurter API interval response (base=EUR) into its business days and rate table"""
+    days = sorted(response["rates"].keys())
+    table = np.array([eur_rates_to_vector(response["rates"][day]) for day in days]).reshape(
+        len(days), len(get_currency_index())
+    )
+    return days, table
+
+
+def get_month_segments(start: date, end: date) -> list[tuple[str, str]]:
+    """
+    Splits the interval between 'start' and 'end' into the calendar months it touches. The segment of the
+    current month ends today, since the FrankFurter API has no rates for future dates.
+    """
+    today = datetime.now(timezone.utc).date()
+    end = min(end, today)
+    segments = []
+
+    month_start = start.replace(day=1)
+    while month_start <= end:
+        next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+        month_end = min(next_month_start - timedelta(days=1), today)
+        segments.append((month_start.isoformat(), month_end.isoformat()))
+        month_start = next_month_start
+
+    return segments
+
+
+def fetch_eur_rate_table(start_date: str, end_date: str) -> tuple[list[str], np.ndarray]:
+    """
+    Assembles the EUR-based rates between the given dates from their monthly segments. Only the segments that
+    are not cached yet are requested to the FrankFurter API, in parallel. Longer intervals are requested in a
+    single call.
+    """
+    segments = get_month_segments(date.fromisoformat(start_date), date.fromisoformat(end_date))
+
+    # Month by month, a long interval would cost one upstream request per month
+    if len(segments) > configs.interval_max_month_segments:
+        segments = [(start_date, min(end_date, datetime.now(timezone.utc).date().isoformat()))]
+
+    if len(segments) > 1:
+        segment_tables = list(
+            get_upstream_fetch_executor().map(
+                tracing.bind_to_current_trace(lambda segment: fetch_eur_rate_segment(*segment)), segments
+            )
         )
+    else:
+        segment_tables = [fetch_eur_rate_segment(*segment) for segment in segments]
 
-    if to_currencies is not None:
-        for currency in to_currencies.split(","):
-            if not currency_exists(currency):
-                raise custom_exceptions.BadRequestError(
-                    f"The following currency is not supported: {currency}"
-                )
+    days, rows = [], []
+    for segment_days, segment_table in segment_tables:
+        for day, row in zip(segment_days, segment_table):
+            # Each segment also brings the business day before it, which the previous segment already has
+            if not days or day > days[-1]:
+                days.append(day)
+                rows.append(row)
 
-    try:
-        int(amount)
-    except:
-        raise custom_exceptions.BadRequestError(
-            f"The 'amount' parameter must be a number"
+    # Just like the FrankFurter API, the business day right before 'start_date' is kept when 'start_date'
+    # itself has no rates
+    first_row = max(bisect.bisect_right(days, start_date) - 1, 0)
+    last_row = bisect.bisect_right(days, end_date)
+
+    table = np.array(rows[first_row:last_row]).reshape(-1, len(get_currency_index()))
+    return days[first_row:last_row], table
+
+
+def get_eur_rate_vector(str_date: str) -> tuple[str, np.ndarray]:
+    """
+    Returns the date of the rates in force on the given date (the last business day on or before it) and their
+    EUR-based rate vector. The local rate store is used when it has the date, the FrankFurter API otherwise.
+    """
+    with tracing.span("cache", "rate_store"):
+        stored = get_fx_rate_store().get_rate_vector(date.fromisoformat(str_date))
+    if stored is not None:
+        rates_date, vector = stored
+        return rates_date.isoformat(), vector
+
+    return fetch_eur_rate_vector(str_date)
+
+
+def get_eur_rate_table(start_date: str, end_date: str) -> tuple[list[str], np.ndarray]:
+    """
+    Returns the business days between the given dates and a matrix with their EUR-based rate vectors (one row
+    per day). The days the local rate store has are read from it and only the remaining ones are requested
+    to the FrankFurter API.
+    """
+    store = get_fx_rate_store()
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    covered_through = store.covered_through
+
+    if covered_through is None or not store.covers(start):
+        return fetch_eur_rate_table(start_date, end_date)
+
+    with tracing.span("cache", "rate_store"):
+        stored_days, stored_table = store.get_rate_table(start, min(end, covered_through))
+    days = [day.isoformat() for day in stored_days]
+
+    # The most recent dates are not in the store yet, so they are requested to the FrankFurter API
+    if end > covered_through:
+        missing_days, missing_table = fetch_eur_rate_table(
+            (covered_through + timedelta(days=1)).isoformat(), end_date
         )
+        # The business day before the requested interval is also returned, and that one we already have
+        new_rows = [i for i, day in enumerate(missing_days) if not days or day > days[-1]]
+        days += [missing_days[i] for i in new_rows]
+        stored_table = np.concatenate([stored_table, missing_table[new_rows]])
+
+    return days, stored_table
+
+
+def compute_cross_rates(
+    eur_rates: np.ndarray, from_currency: str, to_currencies: list[str], amount: float
+) -> np.ndarray:
+    """
+    Derives the rates of 'from_currency' against each currency in 'to_currencies' from EUR-based rates, scaled
+    by 'amount'. Works on a single rate vector or on a table with one rate vector per row (one column per
+    currency in 'to_currencies' is returned).
+    """
+    currency_index = get_currency_index()
+    to_columns = [currency_index[currency] for currency in to_currencies]
+    from_column = currency_index[from_currency]
+
+    return eur_rates[..., to_columns] / eur_rates[..., from_column, np.newaxis] * amount
+
+
+def get_target_currencies(from_currency: str, to_currencies: list[str] | None) -> list[str]:
+    """Returns the currencies 'from_currency' must be converted to. The base currency itself is left out"""
+    candidates = get_currency_index().keys() if to_currencies is None else to_currencies
+
+    return [currency for currency in candidates if currency != from_currency]
 
-    try:
-        date = get_formatted_date(date)
-    except custom_exceptions.NonExistentDateError as err:
-        raise custom_exceptions.BadRequestError(str(err))
 
-    # -- Returning the URL parameters already validated and in the desired formatting -- #
+def round_rate(rate: float) -> float:
+    """Rounds a conversion rate to 5 significant digits, the same precision used by the FrankFurter API"""
+    return float(f"{rate:.5g}")
+
+
+def rates_to_dict(currencies: list[str], rates) -> dict:
+    """Pairs each currency with its rate. Currencies that were not quoted on that day (NaN) are left out"""
     return {
-        "from_currency": from_currency,
-        "to_currencies": to_currencies,
-        "amount": amount,
-        "date": date,
+        currency: round_rate(rate)
+        for currency, rate in zip(currencies, rates.tolist())
+        if rate == rate
     }
 
 
+@tracing.traced("reshape")
+def get_historical_conversion(params: dict) -> dict:
+    """Returns the conversion described by the validated historical endpoint params in the FrankFurter API format"""
+    rates_date, eur_rates = get_eur_rate_vector(params["date"])
+
+    to_currencies = get_target_currencies(params["from_currency"], params["to_currencies"])
+    rates = compute_cross_rates(
+        eur_rates, params["from_currency"], to_currencies, float(params["amount"])
+    )
+
+    return {
+        "amount": float(params["amount"]),
+        "base": params["from_currency"],
+        "date": rates_date,
+        "rates": rates_to_dict(to_currencies, rates),
+    }
+
+
+@tracing.traced("reshape")
+def get_interval_conversion(params: dict) -> dict:
+    """Returns the conversions described by the validated interval endpoint params in the FrankFurter API format"""
+    days, eur_rates = get_eur_rate_table(params["start_date"], params["end_date"])
+
+    to_currencies = get_target_currencies(params["from_currency"], params["to_currencies"])
+    rates = compute_cross_rates(
+        eur_rates, params["from_currency"], to_currencies, float(params["amount"])
+    )
+
+    return {
+        "amount": float(params["amount"]),
+        "base": params["from_currency"],
+        "start_date": days[0] if days else params["start_date"],
+        "end_date": days[-1] if days else params["end_date"],
+        "rates": {day: rates_to_dict(to_currencies, day_rates) for day, day_rates in zip(days, rates)},
+    }
+
+
+# Each statistic is cached by (pair, range, metric, window). The series it was computed from is left out of the
+# key, and the statistics expire like the rates they come from (see rate_cache_time_to_use)
+@cached(
+    shared_cache.make_function_cache("fx_pair_metric", maxsize=8192, ttu=rate_cache_time_to_use),
+    key=lambda from_currency, to_currency, metric, window, start_date, end_date, get_series: hashkey(
+        from_currency, to_currency, metric, window, start_date, end_date
+    ),
+    lock=threading.Lock(),
+    info=True,
+)
+def compute_pair_metric(
+    from_currency: str, to_currency: str, metric: str, window: int, start_date: str, end_date: str, get_series
+) -> dict | None:
+    """Computes one statistic of the from_currency/to_currency pair. get_series() returns (days, rates by pair)"""
+    days, rates_by_pair = get_series()
+    return fx_analytics.compute_metric(metric, days, rates_by_pair[to_currency], window)
+
+
+metrics.track_cached_function("fx_pair_metric", compute_pair_metric)
+
+
+@tracing.traced("reshape")
+def get_fx_analytics(params: dict) -> dict:
+    """Returns the statistics asked by the validated analytics endpoint params, for each currency pair"""
+    from_currency = params["from_currency"]
+    to_currencies = get_target_currencies(from_currency, params["to_currencies"])
+    series = []
+
+    def get_series() -> tuple[list[str], dict]:
+        # The rates are only fetched (once, for every pair at once) if some statistic is not cached yet
+        if not series:
+            days, eur_rates = get_eur_rate_table(params["start_date"], params["end_date"])
+            rates = compute_cross_rates(eur_rates, from_currency, to_currencies, 1.0)
+            series.append((days, {currency: rates[:, i] for i, currency in enumerate(to_currencies)}))
+        return series[0]
+
+    return {
+        "from": from_currency,
+        "start_date": params["start_date"],
+        "end_date": params["end_date"],
+        "window": params["window"],
+        "to": {
+            to_currency: {
+                metric: compute_pair_metric(
+                    from_currency,
+                    to_currency,
+                    metric,
+                    params["window"] if metric in fx_analytics.WINDOWED_METRICS else None,
+                    params["start_date"],
+                    params["end_date"],
+                    get_series,
+                )
+                for metric in params["metrics"]
+            }
+            for to_currency in to_currencies
+        },
+    }
+
+
+def stream_interval_conversion(params: dict):
+    """
+    Returns a generator of the conversions described by the validated interval endpoint params, one line (bytes)
+    per date, as NDJSON or CSV (params["format"]). The rates are fetched right away, so upstream errors are raised
+    here and not in the middle of the stream. The cross rates and the lines are then computed a chunk of dates at
+    a time while the response is sent.
+    """
+    days, eur_rates = get_eur_rate_table(params["start_date"], params["end_date"])
+
+    from_currency = params["from_currency"]
+    to_currencies = get_target_currencies(from_currency, params["to_currencies"])
+    amount = float(params["amount"])
+
+    def format_ndjson_line(day: str, day_rates) -> bytes:
+        line = {
+            "date": day,
+            "from": from_currency,
+            "amount": amount,
+            "to": rates_to_dict(to_currencies, day_rates),
+        }
+        return response_encoding.dumps(line) + b"\n"
+
+    def format_csv_line(day: str, day_rates) -> bytes:
+        # Currencies that were not quoted on that day (NaN) are left empty
+        values = [repr(round_rate(rate)) if rate == rate else "" for rate in day_rates.tolist()]
+        return ",".join([day] + values).encode() + b"\n"
+
+    format_line = format_csv_line if params["format"] == "csv" else format_ndjson_line
+
+    def generate_lines():
+        if params["format"] == "csv":
+            yield ",".join(["date"] + to_currencies).encode() + b"\n"
+
+        for chunk_start in range(0, len(days), configs.interval_stream_chunk_size):
+            chunk_end = chunk_start + configs.interval_stream_chunk_size
+            rates = compute_cross_rates(eur_rates[chunk_start:chunk_end], from_currency, to_currencies, amount)
+            yield b"".join(
+                format_line(day, day_rates) for day, day_rates in zip(days[chunk_start:chunk_end], rates)
+            )
+
+    return generate_lines()
+
+
+def get_brapi_headers() -> dict:
+    return {"Authorization": f"Bearer {os.environ['BRAPI_API_KEY']}"}
+
+
+def consume_many(api: str, requests_to_send: list[tuple[str, dict | None]]) -> list[dict]:
+    """
+    Sends several independent (endpoint, params) requests to the same upstream API ('frankfurter' or 'brapi')
+    and returns their JSON responses in order. They run concurrently in the upstream thread pool, each one through
+    the breaker, retries and single-flight of consume_frankfurter_api / consume_brapi_api.
+    """
+    consume_api = consume_frankfurter_api if api == "frankfurter" else consume_brapi_api
+
+    if len(requests_to_send) < 2:
+        return [consume_api(endpoint=endpoint, params=params) for endpoint, params in requests_to_send]
+
+    return list(
+        get_upstream_fetch_executor().map(
+            # The requests are recorded in the trace of the current request, even from the pool's threads
+            tracing.bind_to_current_trace(
+                lambda request_to_send: consume_api(endpoint=request_to_send[0], params=request_to_send[1])
+            ),
+            requests_to_send,
+        )
+    )
+
+
+# -------- Endpoint parameters ---------- #
+# Declared once, compiled into the validators below and used to generate the parameters of docs/*.yml
+
+HISTORICAL_PARAMS = param_schemas.ParamSchema(
+    [
+        param_schemas.Param(
+            "from",
+            key="from_currency",
+            default="USD",
+            choices=get_existing_currencies().keys(),
+            error="The following currency is not supported: {value}",
+            description="The currency that will serve as the basis for the conversions",
+        ),
+        param_schemas.Param(
+            "to",
+            "list",
+            key="to_currencies",
+            choices=get_existing_currencies().keys(),
+            error="The following currency is not supported: {value}",
+            description="The currencies that will be compared with the base currency, comma-separated. Every "
+            "currency by default",
+        ),
+        param_schemas.Param(
+            "amount", "integer", default="1", description="The amount of currencies to be compared"
+        ),
+        param_schemas.Param(
+            "date",
+            "date",
+            default=param_schemas.get_today,
+            description="The date of conversion (YYYY-MM-DD or DD-MM-YYYY). The current date by default",
+        ),
+    ],
+    docs_file="docs/conversion_historical.yml",
+)
+
+INTERVAL_PARAMS = param_schemas.ParamSchema(
+    [
+        param_schemas.Param(
+            "from",
+            key="from_currency",
+            default="USD",
+            choices=get_existing_currencies().keys(),
+            error="The following currency does not exist: {value}",
+            description="The currency that will serve as the basis for the conversions",
+        ),
+        param_schemas.Param(
+            "to",
+            "list",
+            key="to_currencies",
+            choices=get_existing_currencies().keys(),
+            error="The following currency does not exist: {value}",
+            description="The currencies that will be compared with the base currency, comma-separated. Every "
+            "currency by default",
+        ),
+        param_schemas.Param(
+            "amount", "integer", default="1", description="The amount of currencies to be compared"
+        ),
+        param_schemas.Param(
+            "start_date",
+            "date",
+            default=param_schemas.get_today,
+            description="The date that starts the conversion interval (YYYY-MM-DD or DD-MM-YYYY). The current "
+            "date by default",
+        ),
+        param_schemas.Param(
+            "end_date",
+            "date",
+            default=param_schemas.get_today,
+            description="The date that ends the conversion interval (YYYY-MM-DD or DD-MM-YYYY). The current date "
+            "by default",
+        ),
+        # 'json' returns a single document. 'ndjson' and 'csv' stream one line per date, so long intervals start
+        # arriving right away and are never held in memory as a whole
+        param_schemas.Param(
+            "format",
+            default="json",
+            choices=("json", "ndjson", "csv"),
+            description="Output format. 'json' returns a single document. 'ndjson' (one JSON object per line) and "
+            "'csv' (one row per date, one column per currency) are streamed as the dates are converted, which "
+            "suits long intervals",
+        ),
+    ],
+    docs_file="docs/conversion_interval.yml",
+)
+
+ANALYTICS_PARAMS = param_schemas.ParamSchema(
+    [
+        param_schemas.Param(
+            "from",
+            key="from_currency",
+            default="USD",
+            choices=get_existing_currencies().keys(),
+            error="The following currency does not exist: {value}",
+            description="The base currency of the pairs",
+        ),
+        param_schemas.Param(
+            "to",
+            "list",
+            key="to_currencies",
+            choices=get_existing_currencies().keys(),
+            error="The following currency does not exist: {value}",
+            description="The quote currencies of the pairs, comma-separated. Every currency by default",
+        ),
+        param_schemas.Param(
+            "start_date",
+            "date",
+            default=param_schemas.get_today,
+            description="The date that starts the analysed interval (YYYY-MM-DD or DD-MM-YYYY). The current date "
+            "by default",
+        ),
+        param_schemas.Param(
+            "end_date",
+            "date",
+            default=param_schemas.get_today,
+            description="The date that ends the analysed interval (YYYY-MM-DD or DD-MM-YYYY). The current date by "
+            "default",
+        ),
+        # Comma-separated list of statistics. Ex: returns,volatility
+        param_schemas.Param(
+            "metrics",
+            "list",
+            default=",".join(fx_analytics.METRICS.keys()),
+            choices=fx_analytics.METRICS.keys(),
+            description="The statistics to compute, comma-separated. All of them by default",
+        ),
+        param_schemas.Param(
+            "window",
+            "integer",
+            default="20",
+            minimum=2,
+            maximum=configs.fx_analytics_max_window,
+            description="Number of business days of the rolling windows (volatility and moving average)",
+        ),
+    ],
+    docs_file="docs/conversion_analytics.yml",
+)
+
+
+@tracing.traced("validation")
+def validate_historical_endpoint_params(request) -> dict:
+    """
+    This function validates the URL parameters passed in the request to the historical endpoin and returns them
+    pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
+    the function raises an error.
+    """
+    return HISTORICAL_PARAMS.parse(request.args)
+
+
+@tracing.traced("validation")
 def validate_interval_endpoint_params(request) -> dict:
     """
     This function validates the URL parameters passed in the request to the interval endpoin and returns them
     pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
     the function raises an error.
     """
-    from_currency = request.args.get("from") or "USD"
-    to_currencies = request.args.get("to")
-    amount = request.args.get("amount") or "1"
-    start_date = request.args.get("start_date") or datetime.now().date().isoformat()
-    end_date = request.args.get("end_date") or datetime.now().date().isoformat()
+    params = INTERVAL_PARAMS.parse(request.args)
 
-    # --Validating the parameters-- #
-    if not currency_exists(from_currency):
+    if params["start_date"] > params["end_date"]:
         raise custom_exceptions.BadRequestError(
-            f"The following currency does not exist: {from_currency}"
+            "The 'start_date' parameter must not be after the 'end_date' parameter"
         )
 
-    if to_currencies is not None:
-        for currency in to_currencies.split(","):
-            if not currency_exists(currency):
-                raise custom_exceptions.BadRequestError(
-                    f"The following currency does not exist: {currency}"
-                )
+    return params
 
-    try:
-        int(amount)
-    except:
+
+@tracing.traced("validation")
+def validate_analytics_endpoint_params(request) -> dict:
+    """
+    This function validates the URL parameters passed in the request to the analytics endpoin and returns them
+    pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
+    the function raises an error.
+    """
+    params = ANALYTICS_PARAMS.parse(request.args)
+
+    if params["start_date"] > params["end_date"]:
         raise custom_exceptions.BadRequestError(
-            f"The 'amount' parameter must be a number"
+            "The 'start_date' parameter must not be after the 'end_date' parameter"
         )
 
-    try:
-        start_date = get_formatted_date(start_date)
-        end_date = get_formatted_date(end_date)
-    except custom_exceptions.NonExistentDateError as err:
-        raise custom_exceptions.BadRequestError(str(err))
-
-    # -- Returning the URL parameters already validated and in the desired formatting -- #
-    return {
-        "from_currency": from_currency,
-        "to_currencies": to_currencies,
-        "amount": amount,
-        "start_date": start_date,
-        "end_date": end_date,
-    }
+    return params
 
 
 def get_b3_avaliable_market_sectors() -> set:
@@ -276,180 +810,521 @@ def consume_brapi_api(
 
     url = f"{BRAPI_API_BASE_URL}/{clean_endpoint}"
 
-    try:
-        # Consuming the API
-        response = http_session.get(
-            url=url,
-            params=params,
-            timeout=10,
-            headers={"Authorization": f"Bearer {os.environ['BRAPI_API_KEY']}"},
+    def send_request() -> dict | None:
+        try:
+            with metrics.observe_upstream_request("brapi"):
+                # Consuming the API
+                response = http_session.get(
+                    url=url,
+                    params=params,
+                    timeout=configs.upstream_timeouts,
+                    headers=get_brapi_headers(),
+                )
+                # raises an exception if the HTTPS request returned an unsuccessful status code
+                response.raise_for_status()
+
+        except HTTPError as err:
+            # If the error was due to our API key being invalid, then we raise a specific error
+            if err.response.status_code == 401:
+                raise custom_exceptions.InvalidBrapiAPIKeyError(
+                    "The provided BRAPI API key is invalid. Please, check the key and try again."
+                )
+            else:
+                raise
+
+        tracing.annotate(status=response.status_code, bytes=len(response.content))
+        return response.json()
+
+    def send_request_through_breaker() -> dict | None:
+        # Fails at once, without waiting for the timeout, while the brapi API is unhealthy
+        return upstream_policy.breakers["brapi"].call(send_request)
+
+    # Identical requests sent at the same time by other threads share a single call to the API
+    # (brapi's request quota is tight)
+    with tracing.upstream_span("brapi", url):
+        return single_flight.upstream_requests.do(
+            "brapi",
+            ("brapi",) + single_flight.request_key(clean_endpoint, params),
+            send_request_through_breaker,
         )
-        # raises an exception if the HTTPS request returned an unsuccessful status code
-        response.raise_for_status()
-
-    except HTTPError as err:
-        # If the error was due to our API key being invalid, then we raise a specific error
-        if err.response.status_code == 401:
-            raise custom_exceptions.InvalidBrapiAPIKeyError(
-                "The provided BRAPI API key is invalid. Please, check the key and try again."
-            )
-        else:
-            raise
 
-    return response.json()
+
+# The list is fresh for 3 hours during the trading session, and until the next session opens outside of it. After
+# that it is refreshed in the background while the previous list is still served for up to one more day, which
+# also covers brapi being unavailable
+B3_TICKERS_TTL = ttl_policy.b3_session_ttl(configs.b3_tickers_session_ttl)
 
 
-@cached(TTLCache(maxsize=1, ttl=10800))
-def get_b3_traded_stocks():
-    """This function returns the tickers of all stocks traded on B3 at the present time"""
+@stale_cache.stale_while_revalidate(
+    shared_cache.make_function_cache(
+        "b3_traded_stocks", maxsize=1, ttu=stale_cache.stale_entry_ttu(B3_TICKERS_TTL, configs.b3_stale_ttl)
+    ),
+    fresh_ttl=B3_TICKERS_TTL,
+)
+def get_b3_traded_stocks() -> ticker_index.TickerIndex:
+    """
+    This function returns the tickers of all stocks traded on B3 at the present time, indexed for membership,
+    prefix and root searches. The index is built once per refresh of the list
+    """
     # Requesting the tickers to brapi API
     response = consume_brapi_api(endpoint="/available")
-    return set(response["stocks"])
+    return ticker_index.TickerIndex(response["stocks"])
+
+
+def parse_tickers(tickers) -> list[str]:
+    """
+    Parses the 'ticker' parameter (one or more comma-separated tickers, or a list in a JSON body). Repeated
+    tickers are quoted only once, keeping the order in which they were requested
+    """
+    if isinstance(tickers, str):
+        tickers = tickers.split(",")
+    return list(dict.fromkeys(str(ticker).strip() for ticker in tickers if str(ticker).strip()))
+
+
+def parse_indicators(indicators) -> list[tuple[str, int | None]]:
+    """
+    Parses the 'indicators' parameter (ex: 'sma:200,rsi:14,returns', or a list in a JSON body) into
+    (name, period) pairs. Raises BadRequestError if an indicator or period is not valid
+    """
+    if not indicators:
+        return []
+    if isinstance(indicators, str):
+        indicators = indicators.split(",")
 
+    parsed = []
+    for indicator in indicators:
+        name, _, period = str(indicator).strip().lower().partition(":")
+
+        if name not in price_indicators.INDICATORS:
+            raise custom_exceptions.BadRequestError(
+                "The 'indicators' parameter only accepts the following indicators: "
+                + " | ".join(price_indicators.INDICATORS.keys())
+            )
+
+        min_period = price_indicators.INDICATORS[name]
+        if min_period is None:
+            parsed.append((name, None))
+            continue
 
+        try:
+            if not min_period <= int(period) <= configs.b3_indicator_max_period:
+                raise ValueError
+        except ValueError:
+            raise custom_exceptions.BadRequestError(
+                f"The '{name}' indicator needs a period between {min_period} and {configs.b3_indicator_max_period}. "
+                + f"Example: {name}:20"
+            )
+        parsed.append((name, int(period)))
+
+    # Repeated indicators are computed only once
+    return list(dict.fromkeys(parsed))
+
+
+QUOTES_PARAMS = param_schemas.ParamSchema(
+    [
+        # Batches of tickers can also be sent as a JSON body in a POST request: {"tickers": ["PETR4", "VALE3"], ...}
+        param_schemas.Param(
+            "ticker",
+            key="tickers",
+            aliases=("tickers",),
+            required=True,
+            parser=parse_tickers,
+            missing_error="At least one stock ticker must be specified. Exemples: PETR3, GOLL54",
+            description="The ticker of the stock you want to get quotes for, or a comma-separated list of "
+            "tickers. Example: PETR4,VALE3,ITUB4",
+        ),
+        # Passed on to brapi as they are, which answers the values it does not support
+        param_schemas.Param(
+            "range",
+            key="analysis_time_range",
+            default="1d",
+            choices=("1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max"),
+            strict=False,
+            description="The time range from which you will get the quotes. Example: 5d -> returns quotes from "
+            "the last 5 days | 1mo -> returns quotes from the last 30 days",
+        ),
+        param_schemas.Param(
+            "interval",
+            key="interval_between_quotations",
+            default="1d",
+            choices=("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d", "5d", "1wk", "1mo", "3mo"),
+            strict=False,
+            description="The interval between quotes in the given time range",
+        ),
+        # Whether users want to include basic fundamental data such as PE (Price-to-Earnings ratio) and EPS
+        # (Earnings Per Share) in the response
+        param_schemas.Param(
+            "fundamental",
+            "boolean",
+            key="fundamental_data",
+            description="Indicates whether you want to include basic fundamental data such as PE "
+            "(Price-to-Earnings ratio) and EPS (Earnings Per Share) in the response",
+        ),
+        # Whether users want to include information about dividends and interest on equity historically paid by
+        # the asset in the response
+        param_schemas.Param(
+            "dividends",
+            "boolean",
+            description="Indicates whether you want to include information about dividends and interest on "
+            "equity historically paid by the asset in the response",
+        ),
+        # When 'true', the bars of the requested interval are built by us from the daily history of the ticker,
+        # which is requested to brapi once and reused by every range and interval
+        param_schemas.Param(
+            "resample",
+            "boolean",
+            description="When true, the bars of the requested interval (1d, 5d, 1wk, 1mo or 3mo) are built by "
+            "this API from the daily history of the stock, which is cached and shared by every range and interval",
+        ),
+        # Indicators computed over the closing prices of the bars, comma-separated. Ex: sma:200,ema:50,rsi:14
+        param_schemas.Param(
+            "indicators",
+            parser=parse_indicators,
+            description="Indicators computed over the closing prices of the bars, comma-separated (implies "
+            "resample=true): sma:PERIOD, ema:PERIOD, rsi:PERIOD, returns, volatility:PERIOD (at least 2). Each one is "
+            "returned in 'indicators' with one value per bar. Example: sma:200,rsi:14",
+        ),
+    ],
+    docs_file="docs/b3stocks_quote.yml",
+)
+
+
+@tracing.traced("validation")
 def validate_quotes_endpoint_params(request) -> dict:
     """
     This function validates the URL parameters passed in the request to the quote endpoin and returns them
     pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
     the function raises an error.
     """
-    ticker = request.args.get("ticker")
-    analysis_time_range = request.args.get("range") or "1d"
-    interval_between_quotations = request.args.get("interval") or "1d"
-
-    # This parameter tells whether users want to include basic fundamental data such as  PE (Price-to-Earnings ratio)
-    # and EPS (Earnings Per Share) in the response
-    fundamental_data = request.args.get("fundamental")
-
-    # This parameter tells whether users want to include information about dividends and interest
-    # on equity historically paid by the asset in the response.
-    dividends = request.args.get("dividends")
+    body = request.get_json(silent=True) if request.method == "POST" else None
+    params = QUOTES_PARAMS.parse(get_request_values(request, body))
 
     # -- Verifications --#
-    if not ticker:
+    if len(params["tickers"]) > configs.b3_quote_max_tickers_per_request:
         raise custom_exceptions.BadRequestError(
-            "At least one stock ticker must be specified. Exemples: PETR3, GOLL54"
+            f"At most {configs.b3_quote_max_tickers_per_request} tickers can be quoted in a single request"
         )
-    else:
-        try:
-            if ticker not in get_b3_traded_stocks():
+
+    try:
+        traded_stocks = get_b3_traded_stocks()
+        for ticker in params["tickers"]:
+            if ticker not in traded_stocks:
+                suggestions = traded_stocks.suggest(ticker)
                 raise custom_exceptions.BadRequestError(
                     f"The ticker '{ticker}' is not traded on B3"
+                    + (f". Did you mean: {', '.join(suggestions)}?" if suggestions else "")
                 )
-        # If we could not get the up-to-date list of stocks traded on B3, then we just skip this verification
-        # and let the brapi API handle the invalid ticker error
-        except RequestException:
-            pass
-
-    if fundamental_data and fundamental_data not in ["true", "false"]:
+    # If we could not get the up-to-date list of stocks traded on B3, then we just skip this verification
+    # and let the brapi API handle the invalid ticker error
+    except RequestException:
+        pass
+
+    indicators = params["indicators"] or []
+
+    # The bars built by us come from the daily history, so they can only be daily or coarser
+    if (params["resample"] == "true" or indicators) and (
+        params["interval_between_quotations"] not in price_indicators.RESAMPLE_INTERVALS
+        or params["analysis_time_range"] not in price_indicators.RANGES
+    ):
         raise custom_exceptions.BadRequestError(
-            "The 'fundamental' parameter only accepts 'true' or 'false' as a value"
-        )
-
-    if dividends and dividends not in ["true", "false"]:
-        raise custom_exceptions.BadRequestError(
-            "The 'dividens' parameter only accepts 'true' or 'false' as a value"
+            "Resampled bars and indicators are only available for the intervals "
+            + " | ".join(price_indicators.RESAMPLE_INTERVALS)
+            + " and the ranges "
+            + " | ".join(price_indicators.RANGES)
         )
 
     # -- If all verifications passed, then return a dictionary containing the URL parameters formatted and ready to use
-
-    return {
-        "ticker": ticker,
-        "analysis_time_range": analysis_time_range,
-        "interval_between_quotations": interval_between_quotations,
-        "fundamental_data": fundamental_data,
-        "dividends": dividends,
-    }
+    params["resample"] = params["resample"] == "true" or bool(indicators)
+    params["indicators"] = indicators
+    return params
 
 
-def validate_stocksinfo_endpoint_params(request) -> dict:
+def get_request_values(request, body: dict | None) -> dict:
     """
-    This function validates the URL parameters passed in the request to the stocksinfo endpoin and returns them
-    pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
-    the function raises an error.
+    Merges the URL parameters of a request with its JSON body (whose values take precedence). Booleans in the
+    JSON body are converted to the 'true'/'false' strings accepted in the URL parameters.
     """
+    values = dict(request.args.items())
 
-    # stock market sector
-    sector = request.args.get("sector")
-
-    # 'sorted_by' determines the field by which the stocks will be sorted
-    sorted_by = request.args.get("sortedBy") or "name"
-
-    # 'order' determines the order in which the sorted stocks will appear in the response.
-    # Smallest to largest, bottom to top : asc
-    # largest to smallest, top to bottom: desc
-    order = request.args.get("order") or "asc"
-
-    # limits the number of stocks that will be shown in the response at a time
-    limit = request.args.get("limit")
+    if isinstance(body, dict):
+        for key, value in body.items():
+            values[key] = str(value).lower() if isinstance(value, bool) else value
 
-    # Page number of results to be returned, considering the specified limit. Starts at 1.
-    # Ex: limit=2 sortedBy=name. Page 1: AAA, AAB . Page 2: AAC AAD
-    page = request.args.get("page")
+    return values
 
-    # -- Verifications -- #
 
-    if sector:
-        available_market_sectors = get_b3_avaliable_market_sectors()
-
-        if sector not in available_market_sectors:
-            raise custom_exceptions.BadRequestError(
-                f"The sector '{sector}' does not include any group of shares traded on b3.\n"
-                + f"Available market sectors are: \n"
-                + " | ".join(available_market_sectors)
-            )
+def consume_brapi_quotes(tickers: list[str], url_params: dict) -> dict:
+    """
+    Requests the quotes of the given tickers to brapi, with as many tickers per request as our brapi plan
+    allows (BRAPI_MAX_TICKERS_PER_CALL), and returns them by ticker
+    """
+    max_tickers_per_call = max(
+        1, int(os.environ.get("BRAPI_MAX_TICKERS_PER_CALL") or configs.brapi_max_tickers_per_call)
+    )
+    batches = [
+        tickers[i : i + max_tickers_per_call] for i in range(0, len(tickers), max_tickers_per_call)
+    ]
+
+    responses = consume_many(
+        "brapi", [(f"quote/{','.join(batch)}", url_params) for batch in batches]
+    )
+    batch_results = [response["results"] for response in responses]
+
+    quotes = {}
+    for batch, results in zip(batches, batch_results):
+        for position, result in enumerate(results):
+            # brapi may return the symbol with the exchange suffix (PETR4.SA)
+            symbol = str(result.get("symbol", "")).split(".")[0]
+            ticker = symbol if symbol in batch else batch[position]
+            quotes[ticker] = result
+
+    return quotes
+
+
+# Quotes are cached per ticker (and per range/interval/fundamental/dividends options) for 15 minutes during the
+# trading session, and until the next session opens outside of it, so a batch request only sends the tickers that
+# are not cached to brapi. Expired quotes are still served for one more day while they are refreshed in the
+# background
+B3_QUOTE_TTL = ttl_policy.b3_session_ttl(configs.b3_quote_session_ttl)
+b3_quote_cache = shared_cache.make_function_cache(
+    "b3_quote", maxsize=4096, ttu=stale_cache.stale_entry_ttu(B3_QUOTE_TTL, configs.b3_stale_ttl)
+)
+b3_quote_cache_lock = threading.Lock()
+
+
+@tracing.traced("reshape")
+def get_b3_quotes(params: dict) -> list[dict]:
+    """Returns the brapi quote of every ticker in the validated quote endpoint params, in the requested order"""
+    if params["resample"]:
+        return get_resampled_b3_quotes(params)
+
+    url_params = {
+        "range": params["analysis_time_range"],
+        "interval": params["interval_between_quotations"],
+        "fundamental": params["fundamental_data"],
+        "dividends": params["dividends"],
+    }
+    # Only the URL parameters different than None will be passed to the brapi API request
+    url_params = {key: value for key, value in url_params.items() if value is not None}
+
+    # brapi treats an omitted 'fundamental' or 'dividends' parameter as false
+    options = (
+        params["analysis_time_range"],
+        params["interval_between_quotations"],
+        params["fundamental_data"] or "false",
+        params["dividends"] or "false",
+    )
+    keys = [(ticker,) + options for ticker in params["tickers"]]
+
+    def fetch_quotes(missing_keys: list[tuple]) -> dict:
+        quotes = consume_brapi_quotes([key[0] for key in missing_keys], url_params)
+        return {key: quotes[key[0]] for key in missing_keys if key[0] in quotes}
+
+    quotes = stale_cache.get_many(
+        b3_quote_cache, keys, fetch_quotes, fresh_ttl=B3_QUOTE_TTL, lock=b3_quote_cache_lock, name="b3_quote"
+    )
+    return [quotes[key] for key in keys if key in quotes]
+
+
+@tracing.traced("reshape")
+def get_resampled_b3_quotes(params: dict) -> list[dict]:
+    """
+    Returns the quotes with bars (and indicators) built from the daily history of each ticker. The daily history
+    of a range that covers the requested one is cached once per ticker, so every range and interval derived from
+    it is answered without new requests to brapi
+    """
+    history_params = {
+        **params,
+        "analysis_time_range": price_indicators.covering_history_range(
+            params["analysis_time_range"], configs.b3_daily_history_ranges
+        ),
+        "interval_between_quotations": "1d",
+        "resample": False,
+    }
 
-    if sorted_by:
-        valid_sort_options = [
-            "name",
-            "close",
-            "change",
-            "change_abs",
-            "volume",
-            "market_cap_basic",
-            "sector",
-        ]
+    quotes = []
+    for quote in get_b3_quotes(history_params):
+        # The cached quote is shared, so only a copy is changed
+        quote = dict(quote)
+        columns = price_indicators.trim_history(
+            price_indicators.bars_to_columns(quote.get("historicalDataPrice") or []), params["analysis_time_range"]
+        )
+        columns = price_indicators.resample_bars(columns, params["interval_between_quotations"])
 
-        if sorted_by not in valid_sort_options:
-            raise custom_exceptions.BadRequestError(
-                "The parameter sortedBy only accepts the following options: "
-                + " | ".join(valid_sort_options)
+        quote["historicalDataPrice"] = price_indicators.columns_to_bars(columns)
+        if params["indicators"]:
+            quote["indicators"] = price_indicators.compute_indicators(
+                columns, params["indicators"], params["interval_between_quotations"]
             )
-
-    if order and order not in ["asc", "desc"]:
+        quotes.append(quote)
+
+    return quotes
+
+
+def normalize_ticker_part(value: str) -> str:
+    return value.strip().upper()
+
+
+SEARCH_PARAMS = param_schemas.ParamSchema(
+    [
+        param_schemas.Param(
+            "prefix",
+            parser=normalize_ticker_part,
+            description="Beginning of the tickers. Example: PE -> PETR3, PETR4, PETZ3",
+        ),
+        param_schemas.Param(
+            "root",
+            parser=normalize_ticker_part,
+            description="Company part of the tickers. Example: PETR -> PETR3, PETR4",
+        ),
+        param_schemas.Param(
+            "suffix",
+            parser=normalize_ticker_part,
+            description="Share class part of the tickers. Example: 11 -> every unit",
+        ),
+        param_schemas.Param(
+            "limit",
+            "integer",
+            default="10",
+            minimum=1,
+            maximum=configs.b3_ticker_search_max_limit,
+            description="Maximum number of tickers returned",
+        ),
+    ],
+    docs_file="docs/b3stocks_search.yml",
+)
+
+
+@tracing.traced("validation")
+def validate_search_endpoint_params(request) -> dict:
+    """
+    This function validates the URL parameters passed in the request to the search endpoin and returns them
+    pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
+    the function raises an error.
+    """
+    if not (request.args.get("prefix") or request.args.get("root") or request.args.get("suffix")):
         raise custom_exceptions.BadRequestError(
-            "The 'order' parameter can only receive 'asc' or 'desc'"
+            "At least one of the 'prefix', 'root' or 'suffix' parameters must be specified"
         )
 
-    if page:
-        try:
-            if int(page) < 1:
-                raise custom_exceptions.BadRequestError(
-                    "The 'page' parameter must be a number greater than or equal to 1"
-                )
-        except ValueError:
-            raise custom_exceptions.BadRequestError(
-                f"The 'page' parameter must be a number"
-            )
+    return SEARCH_PARAMS.parse(request.args)
 
-    if limit:
-        try:
-            if int(limit) < 1:
-                raise custom_exceptions.BadRequestError(
-                    "The 'limit' parameter must be a number greater than or equal to 1"
-                )
-        except ValueError:
-            raise custom_exceptions.BadRequestError(
-                f"The 'limit' parameter must be a number"
-            )
 
-    return {
-        "sector": sector,
-        "sortedBy": sorted_by,
-        "order": order,
-        "page": page,
-        "limit": limit,
-    }
+@tracing.traced("reshape")
+def search_b3_tickers(params: dict) -> dict:
+    """Returns the traded tickers matching the validated search endpoint params"""
+    return get_b3_traded_stocks().search(
+        prefix=params["prefix"], root=params["root"], suffix=params["suffix"], limit=params["limit"]
+    )
+
+
+def fetch_b3_stock_universe() -> tuple[list[dict], list]:
+    """
+    Requests every stock of the brapi /quote/list endpoint. The first page tells how many pages there are, and
+    the remaining ones are requested concurrently
+    """
+    url_params = {"type": "stock", "limit": configs.brapi_quote_list_page_size}
+
+    first_page = consume_brapi_api(endpoint="/quote/list", params={**url_params, "page": 1})
+    other_pages = consume_many(
+        "brapi",
+        [
+            ("/quote/list", {**url_params, "page": page})
+            for page in range(2, (first_page.get("totalPages") or 1) + 1)
+        ],
+    )
+
+    stocks = []
+    for response in [first_page] + other_pages:
+        stocks.extend(response["stocks"])
+
+    return stocks, first_page.get("indexes", [])
+
+
+# The snapshot is fresh for 15 minutes during the trading session, and until the next session opens outside of it.
+# After that it is refreshed in the background while the previous one is still served for up to one more day
+# (stale-if-error)
+B3_STOCKS_TTL = ttl_policy.b3_session_ttl(configs.b3_stocks_session_ttl)
+
+
+@stale_cache.stale_while_revalidate(
+    shared_cache.make_function_cache(
+        "b3_stock_screener", maxsize=1, ttu=stale_cache.stale_entry_ttu(B3_STOCKS_TTL, configs.b3_stale_ttl)
+    ),
+    fresh_ttl=B3_STOCKS_TTL,
+)
+def get_b3_stock_screener() -> stock_screener.StockScreener:
+    """This function returns a snapshot of every stock traded on B3, ready to be filtered, sorted and paginated"""
+    stocks, indexes = fetch_b3_stock_universe()
+    return stock_screener.StockScreener(stocks, indexes)
+
+
+@tracing.traced("reshape")
+def get_b3_stocks_information(params: dict) -> dict:
+    """Returns the page of stocks asked by the validated stocksinfo endpoint params, from the local snapshot"""
+    response = get_b3_stock_screener().query(
+        sector=params["sector"],
+        sorted_by=params["sortedBy"],
+        order=params["order"],
+        limit=params["limit"],
+        page=params["page"],
+    )
+    response["sortByOptions"] = list(stock_screener.SORT_COLUMNS.keys())
+    return response
+
+
+STOCKSINFO_PARAMS = param_schemas.ParamSchema(
+    [
+        param_schemas.Param(
+            "sector",
+            choices=sorted(get_b3_avaliable_market_sectors()),
+            error="The sector '{value}' does not include any group of shares traded on b3.\n"
+            "Available market sectors are: \n{options}",
+            description="Stock market sector",
+        ),
+        # The field by which the stocks will be sorted
+        param_schemas.Param(
+            "sortedBy",
+            default="name",
+            choices=stock_screener.SORT_COLUMNS.keys(),
+            error="The parameter sortedBy only accepts the following options: {options}",
+            description="The field by which the stocks will be sorted",
+        ),
+        # Smallest to largest, bottom to top : asc
+        # largest to smallest, top to bottom: desc
+        param_schemas.Param(
+            "order",
+            default="asc",
+            choices=("asc", "desc"),
+            error="The 'order' parameter can only receive 'asc' or 'desc'",
+            description="The order in which the sorted stocks will appear in the response (asc or desc)",
+        ),
+        param_schemas.Param(
+            "limit",
+            "integer",
+            minimum=1,
+            description="The number of stocks that will be shown in the response at a time",
+        ),
+        # Ex: limit=2 sortedBy=name. Page 1: AAA, AAB . Page 2: AAC AAD
+        param_schemas.Param(
+            "page",
+            "integer",
+            minimum=1,
+            description="Page number of results to be returned, considering the specified limit. Starts at 1.",
+        ),
+    ],
+    docs_file="docs/b3stocks_stocksinfo.yml",
+)
+
+
+@tracing.traced("validation")
+def validate_stocksinfo_endpoint_params(request) -> dict:
+    """
+    This function validates the URL parameters passed in the request to the stocksinfo endpoin and returns them
+    pre-formatted so they can be processed. If any passed parameter doesn't match what was expected,
+    the function raises an error.
+    """
+    return STOCKSINFO_PARAMS.parse(request.args)
 
 
 if __name__ == "__main__":